@@ -0,0 +1,393 @@
+"""
+Prueba de carga de extremo a extremo de la API de historias, sin red externa.
+
+Levanta `main.app` con uvicorn en un thread, contra una base de datos local y
+el proveedor de LLM "fake" (latencia y tamaño configurables), y simula
+jugadores concurrentes que repiten el recorrido real del frontend:
+
+    POST /story/create -> GET /job/{id} (polling) -> GET /story/{id}/complete
+
+Mide en el cliente la latencia de cada endpoint (p50/p95/p99), las requests
+por segundo y el tiempo hasta que la historia está lista; en el servidor
+cuenta las consultas SQL por request (y las de la generación en segundo
+plano). El resultado se guarda en JSON con el commit actual para comparar
+corridas entre commits con --compare.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.load_test --players 20 --duration 30 --llm-latency-ms 800 --llm-latency-jitter-ms 400
+    python -m benchmarks.load_test --output results/base.json
+    python -m benchmarks.load_test --compare results/base.json
+    python -m benchmarks.load_test --env GENERATION_MODE=fanout --env ASYNC_GENERATION=true
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Estados del job con los que el jugador ya puede cargar la historia
+READY_STATUSES = ("completado", "parcial")
+
+# Contador de consultas de la request (o de la generación) en curso
+_query_counter: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("query_counter", default=None)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values), 3),
+        "p50_ms": round(_percentile(values, 0.50), 3),
+        "p95_ms": round(_percentile(values, 0.95), 3),
+        "p99_ms": round(_percentile(values, 0.99), 3),
+        "max_ms": round(max(values), 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure_environment(args: argparse.Namespace, database_url: str):
+    """Fija la configuración antes de importar la aplicación (settings se lee al importar)."""
+    os.environ.update(
+        DATABASE_URL=database_url,
+        LLM_PROVIDER="fake",
+        FAKE_LLM_LATENCY_MS=str(args.llm_latency_ms),
+        FAKE_LLM_LATENCY_JITTER_MS=str(args.llm_latency_jitter_ms),
+        FAKE_LLM_DEPTH=str(args.depth),
+        FAKE_LLM_DEPTH_JITTER=str(args.depth_jitter),
+        FAKE_LLM_BRANCHING=str(args.branching),
+    )
+    for assignment in args.env:
+        name, _, value = assignment.partition("=")
+        os.environ[name] = value
+
+
+class QueryCountingMiddleware:
+    """
+    Middleware ASGI que atribuye las consultas SQL a la ruta de cada request.
+
+    Cuando la respuesta termina de enviarse, las tareas en segundo plano de la
+    misma request (la generación) pasan a contarse aparte como "generation".
+    La generación corre en la cola del proceso y puede terminar después de la
+    request: su contador se guarda y se suma al pedir el resumen.
+    """
+
+    def __init__(self, app, stats: "ServerStats"):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_counter = [0]
+        generation_counter = [0]
+        _query_counter.set(request_counter)
+
+        async def counting_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _query_counter.set(generation_counter)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            route = scope.get("route")
+            name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+            self.stats.record(name, request_counter[0], generation_counter)
+
+
+class ServerStats:
+    """Consultas SQL por ruta, acumuladas por el middleware."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.queries: Dict[str, int] = defaultdict(int)
+        self.generation_counters: List[List[int]] = []
+
+    def record(self, route: str, queries: int, generation_counter: List[int]):
+        with self._lock:
+            self.requests[route] += 1
+            self.queries[route] += queries
+            self.generation_counters.append(generation_counter)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            # Solo las requests que lanzaron una generación tienen consultas en su contador
+            generation_queries = [counter[0] for counter in self.generation_counters if counter[0]]
+            return {
+                "queries_per_request": {
+                    route: round(self.queries[route] / count, 2) for route, count in sorted(self.requests.items())
+                },
+                "queries_per_background_generation": (
+                    round(sum(generation_queries) / len(generation_queries), 2) if generation_queries else None
+                ),
+            }
+
+
+def _count_query(*_):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def _instrument_engines():
+    """Cuenta cada sentencia enviada al driver en todos los motores de la aplicación."""
+    from sqlalchemy import event
+
+    from core.config import settings
+    from db import database
+
+    engines = [database.engine, database.replica_engine]
+    if settings.ASYNC_GENERATION:
+        engines.append(database.get_async_sessionmaker().kw["bind"].sync_engine)
+    for engine in engines:
+        if engine is not None:
+            event.listen(engine, "before_cursor_execute", _count_query)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(stats: ServerStats):
+    """Levanta la aplicación con uvicorn en un thread y espera a que acepte conexiones."""
+    import uvicorn
+
+    from main import app
+
+    _instrument_engines()
+    app.add_middleware(QueryCountingMiddleware, stats=stats)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("El servidor no pudo arrancar")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+class LoadResults:
+    """Latencias medidas por los jugadores (del lado del cliente)."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.time_to_ready: List[float] = []
+        self.stories_loaded = 0
+        self.failed_jobs = 0
+
+    def observe(self, endpoint: str, elapsed_ms: float, ok: bool):
+        self.latencies[endpoint].append(elapsed_ms)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+async def _timed(client, results: LoadResults, endpoint: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except Exception:
+        results.observe(endpoint, (time.perf_counter() - start) * 1000, False)
+        return None
+    results.observe(endpoint, (time.perf_counter() - start) * 1000, response.status_code < 400)
+    return response
+
+
+async def player(base_url: str, api_prefix: str, player_id: int, args: argparse.Namespace,
+                 results: LoadResults, deadline: float):
+    """Un jugador: pide historias una tras otra hasta que se acaba el tiempo."""
+    import httpx
+
+    rng = random.Random(player_id)
+    # Cada jugador tiene su propia cookie de sesión, como un navegador
+    async with httpx.AsyncClient(base_url=base_url + api_prefix, timeout=args.request_timeout) as client:
+        while time.monotonic() < deadline:
+            theme = f"{rng.choice(args.themes)} {rng.randrange(args.theme_variants)}"
+            created = time.perf_counter()
+            response = await _timed(client, results, "POST /story/create", "POST", "/story/create", json={"theme": theme})
+            if response is None or response.status_code >= 400:
+                await asyncio.sleep(args.poll_interval)
+                continue
+            job = response.json()
+
+            while job["status"] not in READY_STATUSES + ("error",) and time.monotonic() < deadline + args.request_timeout:
+                await asyncio.sleep(args.poll_interval)
+                response = await _timed(client, results, "GET /job/{job_id}", "GET", f"/job/{job['job_id']}")
+                if response is not None and response.status_code < 400:
+                    job = response.json()
+
+            if job["status"] not in READY_STATUSES:
+                results.failed_jobs += 1
+                continue
+            results.time_to_ready.append((time.perf_counter() - created) * 1000)
+
+            response = await _timed(
+                client, results, "GET /story/{story_id}/complete", "GET", f"/story/{job['story_id']}/complete"
+            )
+            if response is not None and response.status_code < 400:
+                results.stories_loaded += 1
+            # Tiempo "jugando" antes de pedir otra historia
+            await asyncio.sleep(rng.uniform(0, args.think_time * 2))
+
+
+async def drive_load(base_url: str, api_prefix: str, args: argparse.Namespace) -> Dict[str, Any]:
+    results = LoadResults()
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        player(base_url, api_prefix, player_id, args, results, deadline) for player_id in range(args.players)
+    ))
+    elapsed = time.monotonic() - start
+
+    total_requests = sum(len(values) for values in results.latencies.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": total_requests,
+        "requests_per_second": round(total_requests / elapsed, 2),
+        "errors": dict(results.errors),
+        "endpoints": {endpoint: _summary(values) for endpoint, values in sorted(results.latencies.items())},
+        "generation": {
+            "stories_ready": len(results.time_to_ready),
+            "stories_loaded": results.stories_loaded,
+            "failed_jobs": results.failed_jobs,
+            "stories_per_second": round(len(results.time_to_ready) / elapsed, 3),
+            "time_to_ready": _summary(results.time_to_ready),
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Diferencias relativas en las métricas principales respecto de otra corrida."""
+    def delta(new: Optional[float], old: Optional[float]) -> str:
+        if not old or new is None:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    lines = [f"Comparación con {baseline.get('commit') or 'la corrida base'}:"]
+    lines.append(
+        f"  requests/s: {baseline['requests_per_second']} -> {current['requests_per_second']} "
+        f"({delta(current['requests_per_second'], baseline['requests_per_second'])})"
+    )
+    for endpoint, summary in current["endpoints"].items():
+        old = baseline["endpoints"].get(endpoint, {})
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            lines.append(
+                f"  {endpoint} {key}: {old.get(key, '-')} -> {summary.get(key, '-')} ({delta(summary.get(key), old.get(key))})"
+            )
+    old_ready = baseline["generation"]["time_to_ready"]
+    new_ready = current["generation"]["time_to_ready"]
+    lines.append(
+        f"  historia lista p95: {old_ready.get('p95_ms', '-')} -> {new_ready.get('p95_ms', '-')} "
+        f"({delta(new_ready.get('p95_ms'), old_ready.get('p95_ms'))})"
+    )
+    for route, queries in current["database"]["queries_per_request"].items():
+        old_queries = baseline["database"]["queries_per_request"].get(route)
+        if old_queries != queries:
+            lines.append(f"  consultas {route}: {old_queries} -> {queries}")
+    return lines
+
+
+def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """Configura el entorno, levanta el servidor, genera la carga y arma el informe."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, 'load_test.db')}"
+        _configure_environment(args, database_url)
+
+        stats = ServerStats()
+        server, thread, base_url = start_server(stats)
+        from core.config import settings
+
+        try:
+            report = asyncio.run(drive_load(base_url, settings.API_PREFIX, args))
+        finally:
+            server.should_exit = True
+            thread.join()
+
+        report["database"] = stats.snapshot()
+        report["commit"] = _git_commit()
+        report["config"] = {
+            "players": args.players,
+            "duration_s": args.duration,
+            "poll_interval_s": args.poll_interval,
+            "think_time_s": args.think_time,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_latency_jitter_ms": args.llm_latency_jitter_ms,
+            "depth": args.depth,
+            "depth_jitter": args.depth_jitter,
+            "branching": args.branching,
+            "database": settings.DATABASE_URL.split(":", 1)[0],
+            "generation_mode": settings.GENERATION_MODE,
+            "async_generation": settings.ASYNC_GENERATION,
+            "job_queue_backend": settings.JOB_QUEUE_BACKEND,
+            "env": args.env,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de historias con un LLM simulado")
+    parser.add_argument("--players", type=int, default=10, help="Jugadores concurrentes")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos creando historias")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Segundos entre consultas a /job")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Pausa media entre historias de un jugador (s)")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--themes", nargs="+", default=["fantasía", "ciencia ficción", "misterio", "terror", "piratas"])
+    parser.add_argument(
+        "--theme-variants", type=int, default=50,
+        help="Variantes por tema (menos variantes = más aciertos de la caché de historias)"
+    )
+    parser.add_argument("--llm-latency-ms", type=int, default=500)
+    parser.add_argument("--llm-latency-jitter-ms", type=int, default=250)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--depth-jitter", type=int, default=1)
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--database-url", default="", help="Base de datos (por defecto un SQLite temporal)")
+    parser.add_argument("--env", action="append", default=[], metavar="NOMBRE=VALOR", help="Configuración extra de la app")
+    parser.add_argument("--output", help="Guarda el informe JSON en este archivo")
+    parser.add_argument("--compare", help="Informe JSON anterior con el que comparar")
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline:
+            print("\n".join(compare(report, json.load(baseline))))
+
+
+if __name__ == "__main__":
+    main()
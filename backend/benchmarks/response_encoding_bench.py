@@ -0,0 +1,108 @@
+"""
+Benchmark de las variantes de respuesta de `GET /story/{id}/complete`.
+
+Para historias de distintos tamaños mide los bytes de cada variante (JSON,
+msgpack, gzip y brotli si está instalado) y el costo por request de:
+- serializar el esquema con `json.dumps` (el camino de `jsonable_encoder`)
+  frente a `model_dump_json` de Pydantic y a orjson sobre el dict;
+- comprimir en cada request frente a leer la variante precalculada.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.response_encoding_bench --depths 3 4 5 --branching 3 --runs 200
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from core.llm_providers import build_fake_story
+from core.models import StoryLLMResponse
+from core.response_cache import build_cached_response
+from core.response_encoding import Variant, available_encodings, compress, dumps_json, orjson
+from core.story_persistence import build_node_rows, flatten_story_tree
+from schemas.story import CompleteStoryNodeResponse, CompleteStoryResponse
+
+
+def complete_story(depth: int, branching: int) -> CompleteStoryResponse:
+    """Respuesta de /complete para una historia del proveedor fake (IDs consecutivos)."""
+    story = StoryLLMResponse.model_validate(build_fake_story(f"benchmark {depth}", depth, branching))
+    flat_nodes = flatten_story_tree(story.rootNode)
+    rows = build_node_rows(1, flat_nodes, list(range(1, len(flat_nodes) + 1)))
+    nodes = {
+        row["id"]: CompleteStoryNodeResponse(
+            id=row["id"],
+            content=row["content"],
+            is_ending=row["is_ending"],
+            is_winning_ending=row["is_winning_ending"],
+            options=row["options"]
+        )
+        for row in rows
+    }
+    return CompleteStoryResponse(
+        id=1, title=story.title, created_at="2025-01-01T00:00:00",
+        root_node=nodes[1], all_nodes=nodes
+    )
+
+
+def time_calls(function: Callable[[], Any], runs: int) -> float:
+    """Mediana en microsegundos de `runs` llamadas."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def run_benchmark(depths: List[int], branching: int, runs: int) -> List[Dict[str, Any]]:
+    results = []
+    for depth in depths:
+        response = complete_story(depth, branching)
+        body = dumps_json(response)
+        data = response.model_dump(mode="json")
+        entry = build_cached_response(body)
+
+        timings = {
+            "json.dumps": time_calls(lambda: json.dumps(jsonable_encoder(response)).encode("utf-8"), runs),
+            "model_dump_json": time_calls(lambda: dumps_json(response), runs),
+        }
+        if orjson is not None:
+            timings["orjson"] = time_calls(lambda: orjson.dumps(data), runs)
+        for encoding in available_encodings():
+            timings[f"{encoding} por request"] = time_calls(lambda: compress(body, encoding), runs)
+            timings[f"{encoding} precalculado"] = time_calls(lambda: entry.select(Variant("json", encoding)), runs)
+
+        results.append({
+            "depth": depth,
+            "nodes": len(response.all_nodes),
+            "bytes": {key: len(value) for key, value in sorted(entry.variants.items())},
+            "median_us": timings
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las variantes de respuesta de /complete")
+    parser.add_argument("--depths", type=int, nargs="+", default=[3, 4, 5])
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.depths, args.branching, args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(f"profundidad={result['depth']} nodos={result['nodes']}")
+        print("  bytes: " + "  ".join(f"{key}={size}" for key, size in result["bytes"].items()))
+        print("  µs:    " + "  ".join(f"{name}={value:.0f}" for name, value in result["median_us"].items()))
+
+
+if __name__ == "__main__":
+    main()
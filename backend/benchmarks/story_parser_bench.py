@@ -0,0 +1,155 @@
+"""
+Benchmark del parseo de la respuesta del LLM.
+
+Compara el camino anterior (`PydanticOutputParser.parse` con `next_node`
+como dict, y luego un `StoryNodeLLM.model_validate` por nivel al aplanar el
+árbol) con `core.story_parser.parse_story` (una sola validación del esquema
+recursivo). Mide también el texto dentro de un bloque ```json``` y el rechazo
+de una respuesta que supera STORY_MAX_NODES.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.story_parser_bench --depths 3 4 5 --branching 3 --runs 200
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+
+from core.config import settings
+from core.llm_providers import build_fake_story
+from core.models import StoryNodeLLM
+from core.story_parser import StoryParseError, check_tree_limits, parse_story
+from core.story_persistence import flatten_story_tree
+
+
+class LegacyOptionLLM(BaseModel):
+    """Copia del esquema anterior: el siguiente nodo llegaba como dict sin validar."""
+    text: str
+    next_node: Dict[str, Any]
+
+
+class LegacyNodeLLM(BaseModel):
+    content: str
+    isEnding: bool
+    isWinningEnding: bool
+    options: Optional[List[LegacyOptionLLM]] = None
+
+
+class LegacyResponse(BaseModel):
+    title: str
+    rootNode: LegacyNodeLLM
+
+
+LEGACY_PARSER = PydanticOutputParser(pydantic_object=LegacyResponse)
+
+
+def legacy_parse(text: str) -> int:
+    """Réplica del camino anterior: parseo de LangChain y validación nivel a nivel al aplanar."""
+    story = LEGACY_PARSER.parse(text)
+    count = 0
+    stack = [StoryNodeLLM.model_validate(story.rootNode.model_dump())]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if not node.isEnding and node.options:
+            stack.extend(StoryNodeLLM.model_validate(option.next_node) for option in node.options)
+    return count
+
+
+def single_pass_parse(text: str) -> int:
+    """Camino actual: una validación y el aplanado sin revalidar."""
+    return len(flatten_story_tree(parse_story(text).rootNode))
+
+
+def time_calls(function: Callable[[str], Any], text: str, runs: int) -> Dict[str, float]:
+    """Ejecuta `function(text)` `runs` veces y devuelve la media y la mediana en microsegundos."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            function(text)
+        except (StoryParseError, ValueError):
+            pass  # Se mide también el tiempo en rechazar
+        timings.append(time.perf_counter() - start)
+    return {
+        "mean_us": statistics.mean(timings) * 1e6,
+        "median_us": statistics.median(timings) * 1e6
+    }
+
+
+def run_benchmark(depths: List[int], branching: int, runs: int) -> Dict[str, Any]:
+    """Mide ambos caminos para cada profundidad y el rechazo de una historia desmesurada."""
+    results: Dict[str, Any] = {"branching": branching, "runs": runs, "sizes": []}
+
+    for depth in depths:
+        story = build_fake_story(f"benchmark {depth}", depth, branching)
+        text = json.dumps(story, ensure_ascii=False)
+        fenced = f"Aquí tienes la historia:\n```json\n{text}\n```"
+        nodes = single_pass_parse(text)
+        assert legacy_parse(text) == nodes
+        results["sizes"].append({
+            "depth": depth,
+            "nodes": nodes,
+            "bytes": len(text.encode("utf-8")),
+            "legacy": time_calls(legacy_parse, text, runs),
+            "single_pass": time_calls(single_pass_parse, text, runs),
+            "single_pass_fenced": time_calls(single_pass_parse, fenced, runs)
+        })
+
+    # Primera profundidad cuya historia supera STORY_MAX_NODES
+    oversized_depth = max(depths)
+    while True:
+        oversized_depth += 1
+        story = build_fake_story("benchmark oversized", oversized_depth, branching)
+        if check_tree_limits(story, oversized_depth, 10 ** 9) > settings.STORY_MAX_NODES:
+            break
+    oversized = json.dumps(story, ensure_ascii=False)
+    results["oversized"] = {
+        "depth": oversized_depth,
+        "max_nodes": settings.STORY_MAX_NODES,
+        "legacy": time_calls(legacy_parse, oversized, max(1, runs // 10)),
+        "single_pass_reject": time_calls(
+            lambda text: parse_story(text, max_depth=oversized_depth), oversized, max(1, runs // 10)
+        )
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parseo de la respuesta del LLM")
+    parser.add_argument("--depths", type=int, nargs="+", default=[3, 4, 5])
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.depths, args.branching, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"ramas={args.branching} runs={args.runs}")
+    for size in results["sizes"]:
+        legacy = size["legacy"]["median_us"]
+        single = size["single_pass"]["median_us"]
+        print(
+            f"profundidad={size['depth']} nodos={size['nodes']:>4} bytes={size['bytes']:>7}: "
+            f"anterior={legacy:.0f} µs  una pasada={single:.0f} µs ({legacy / single:.1f}x)  "
+            f"con bloque ```json```={size['single_pass_fenced']['median_us']:.0f} µs"
+        )
+    over = results["oversized"]
+    print(
+        f"historia de profundidad {over['depth']} (> {over['max_nodes']} nodos): "
+        f"anterior la acepta en {over['legacy']['median_us']:.0f} µs, "
+        f"una pasada la rechaza en {over['single_pass_reject']['median_us']:.0f} µs"
+    )
+
+
+if __name__ == "__main__":
+    main()
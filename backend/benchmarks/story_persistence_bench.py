@@ -0,0 +1,158 @@
+"""
+Benchmark de persistencia de árboles de historias.
+
+Compara el camino recursivo anterior (un flush por nodo más otro para las
+opciones) con el INSERT masivo de `core.story_persistence`, midiendo viajes
+a la base de datos (sentencias enviadas al driver) y tiempo total.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.story_persistence_bench --depth 4 --branching 3 --runs 20
+    python -m benchmarks.story_persistence_bench --database-url postgresql://...
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.models import StoryLLMResponse, StoryNodeLLM
+from core.story_persistence import persist_story_tree
+from db.database import Base
+from models.story import Story, StoryNode
+
+
+def build_synthetic_story(depth: int, branching: int) -> StoryLLMResponse:
+    """
+    Construye una respuesta del LLM sintética con un árbol completo.
+
+    Args:
+        depth: Niveles del árbol (incluyendo la raíz).
+        branching: Opciones por cada nodo que no es final.
+    """
+    def build_node(level: int, label: str) -> Dict[str, Any]:
+        is_ending = level == depth
+        node = {
+            "content": f"Nodo {label}: " + "texto de la historia " * 20,
+            "isEnding": is_ending,
+            "isWinningEnding": is_ending and label.endswith("0"),
+            "options": None
+        }
+        if not is_ending:
+            node["options"] = [
+                {"text": f"Opción {label}.{i}", "next_node": build_node(level + 1, f"{label}.{i}")}
+                for i in range(branching)
+            ]
+        return node
+
+    return StoryLLMResponse.model_validate({"title": "Historia de prueba", "rootNode": build_node(1, "0")})
+
+
+def legacy_persist(db: Session, session_id: str, story_structure: StoryLLMResponse) -> Story:
+    """Réplica del camino recursivo anterior (`_process_story_node`)."""
+    def process_node(node_data, is_root=False):
+        if isinstance(node_data, dict):
+            node_data = StoryNodeLLM.model_validate(node_data)
+        node = StoryNode(
+            story_id=story_db.id,
+            content=node_data.content,
+            is_root=is_root,
+            is_ending=node_data.isEnding,
+            is_winning_ending=node_data.isWinningEnding,
+            options=[]
+        )
+        db.add(node)
+        db.flush()
+
+        if not node.is_ending and node_data.options:
+            options_list = []
+            for option_data in node_data.options:
+                child_node = process_node(option_data.next_node)
+                options_list.append({"text": option_data.text, "node_id": child_node.id})
+            node.options = options_list
+
+        db.flush()
+        return node
+
+    story_db = Story(title=story_structure.title, session_id=session_id)
+    db.add(story_db)
+    db.flush()
+    process_node(story_structure.rootNode, is_root=True)
+    return story_db
+
+
+def run_benchmark(database_url: str, depth: int, branching: int, runs: int) -> Dict[str, Any]:
+    """Ejecuta ambos caminos `runs` veces y devuelve las métricas."""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    round_trips = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_round_trip(conn, cursor, statement, parameters, context, executemany):
+        round_trips["count"] += 1
+
+    story_structure = build_synthetic_story(depth, branching)
+    results: Dict[str, Any] = {
+        "database": engine.dialect.name,
+        "depth": depth,
+        "branching": branching,
+        "runs": runs
+    }
+
+    for name, persist in (("recursive", legacy_persist), ("bulk", persist_story_tree)):
+        timings = []
+        trips = []
+        for _ in range(runs):
+            db = SessionFactory()
+            try:
+                round_trips["count"] = 0
+                start = time.perf_counter()
+                persist(db, "benchmark", story_structure)
+                db.commit()
+                timings.append(time.perf_counter() - start)
+                trips.append(round_trips["count"])
+            finally:
+                db.close()
+
+        results[name] = {
+            "round_trips": statistics.median(trips),
+            "mean_ms": statistics.mean(timings) * 1000,
+            "median_ms": statistics.median(timings) * 1000
+        }
+
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de persistencia de historias")
+    parser.add_argument("--database-url", help="URL de la base de datos (por defecto un SQLite temporal)")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        results = run_benchmark(database_url, args.depth, args.branching, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Base de datos: {results['database']} | profundidad={args.depth} ramas={args.branching} runs={args.runs}")
+    for name in ("recursive", "bulk"):
+        r = results[name]
+        print(f"{name:>10}: {r['round_trips']:>5} viajes  media={r['mean_ms']:.2f} ms  mediana={r['median_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark de formatos de almacenamiento de historias.
+
+Compara el formato de una fila por nodo ("rows") con el blob compacto de
+`core.story_blob` en varias combinaciones de códec y serialización. Mide el
+tamaño de la base de datos tras un VACUUM y la latencia de lectura de la
+historia completa y de un subárbol (raíz + 2 niveles).
+
+Uso (desde el directorio backend):
+    python -m benchmarks.story_storage_bench --stories 200 --depth 5 --branching 3
+    python -m benchmarks.story_storage_bench --json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from core.llm_providers import build_fake_story
+from core.models import StoryLLMResponse
+from core.story_blob import blob_nodes_from_flat, encode_story_blob, format_name
+from core.story_persistence import flatten_story_tree, persist_story_tree
+from core.story_store import load_complete_story, load_node_subtree
+from db.database import Base
+from models.story import Story
+
+# (nombre, códec, serialización); None = una fila por nodo
+LAYOUTS: List[Tuple[str, Optional[str], Optional[str]]] = [
+    ("rows", None, None),
+    ("blob none+json", "none", "json"),
+    ("blob zlib+json", "zlib", "json"),
+    ("blob zstd+json", "zstd", "json"),
+    ("blob zstd+msgpack", "zstd", "msgpack"),
+]
+
+_REQUIRED_MODULES = {"zstd": "zstandard", "msgpack": "msgpack"}
+
+
+def _available(codec: Optional[str], serialization: Optional[str]) -> bool:
+    """Los formatos con dependencias opcionales no instaladas se omiten."""
+    return all(
+        importlib.util.find_spec(_REQUIRED_MODULES[name]) is not None
+        for name in (codec, serialization)
+        if name in _REQUIRED_MODULES
+    )
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_layout(database_path: str, codec: Optional[str], serialization: Optional[str],
+               stories: int, depth: int, branching: int, reads: int) -> Dict[str, Any]:
+    """Guarda `stories` historias en un formato y mide tamaño y lecturas."""
+    engine = create_engine(f"sqlite:///{database_path}")
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    db = SessionFactory()
+    try:
+        story_ids = []
+        blob_sizes = []
+        for index in range(stories):
+            # Historias distintas (las del proveedor "fake") para no inflar la compresión
+            story_structure = StoryLLMResponse.model_validate(build_fake_story(f"benchmark-{index}", depth, branching))
+            if codec is None:
+                story = persist_story_tree(db, "benchmark", story_structure)
+            else:
+                nodes = blob_nodes_from_flat(flatten_story_tree(story_structure.rootNode))
+                story = Story(
+                    title=story_structure.title,
+                    session_id="benchmark",
+                    tree_blob=encode_story_blob(nodes, codec, serialization),
+                    tree_format=format_name(codec, serialization)
+                )
+                db.add(story)
+                db.flush()
+                blob_sizes.append(len(story.tree_blob))
+            story_ids.append(story.id)
+        db.commit()
+    finally:
+        db.close()
+
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    size_bytes = os.path.getsize(database_path)
+
+    rng = random.Random(42)
+    complete_ms, subtree_ms = [], []
+    db = SessionFactory()
+    try:
+        for _ in range(reads):
+            story_id = rng.choice(story_ids)
+            db.expire_all()
+
+            start = time.perf_counter()
+            story = db.get(Story, story_id)
+            load_complete_story(db, story)
+            complete_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            load_node_subtree(db, story_id, None, 2)
+            subtree_ms.append((time.perf_counter() - start) * 1000)
+    finally:
+        db.close()
+    engine.dispose()
+
+    return {
+        "db_bytes": size_bytes,
+        "bytes_per_story": size_bytes / stories,
+        # Tamaño del blob en sí (el archivo de SQLite crece por páginas completas)
+        "blob_bytes_per_story": statistics.mean(blob_sizes) if blob_sizes else None,
+        "complete_p50_ms": statistics.median(complete_ms),
+        "complete_p95_ms": _percentile(complete_ms, 0.95),
+        "subtree_p50_ms": statistics.median(subtree_ms),
+        "subtree_p95_ms": _percentile(subtree_ms, 0.95),
+    }
+
+
+def run_benchmark(stories: int, depth: int, branching: int, reads: int) -> Dict[str, Any]:
+    """Ejecuta todos los formatos disponibles y devuelve las métricas."""
+    results: Dict[str, Any] = {"stories": stories, "depth": depth, "branching": branching, "reads": reads, "layouts": {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for index, (name, codec, serialization) in enumerate(LAYOUTS):
+            if not _available(codec, serialization):
+                continue
+            database_path = os.path.join(tmp_dir, f"layout-{index}.db")
+            results["layouts"][name] = run_layout(database_path, codec, serialization, stories, depth, branching, reads)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de formatos de almacenamiento de historias")
+    parser.add_argument("--stories", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.stories, args.depth, args.branching, args.reads)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.stories} historias | profundidad={args.depth} ramas={args.branching} lecturas={args.reads}")
+    for name, r in results["layouts"].items():
+        blob = f"{r['blob_bytes_per_story']:.0f}" if r["blob_bytes_per_story"] else "-"
+        print(
+            f"{name:>18}: {r['bytes_per_story']:>9.0f} B/historia (blob {blob:>6})  "
+            f"completa p50={r['complete_p50_ms']:.2f} ms p95={r['complete_p95_ms']:.2f} ms  "
+            f"subárbol p50={r['subtree_p50_ms']:.2f} ms p95={r['subtree_p95_ms']:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,11 @@
 
 # Instalar dependencias
 pip install -r requirements.txt
+
+# Dependencias opcionales de rendimiento (orjson, msgpack, zstandard, brotli)
+if [ "${INSTALL_PERF_DEPS:-0}" = "1" ]; then
+    pip install -r requirements-perf.txt
+fi
+
+# Aplicar las migraciones del esquema
+python -m migrations upgrade
@@ -0,0 +1,336 @@
+"""
+Control de admisión de `POST /story/create`.
+
+Cada historia nueva cuesta una llamada al LLM. Sin límites, una ráfaga (o un
+cliente en un bucle) agota la cuota del proveedor y todos los jobs se vuelven
+lentos. Antes de crear el job se comprueba, en este orden:
+
+1. Un token bucket por session_id y otro por IP (ADMISSION_SESSION_PER_MINUTE,
+   ADMISSION_IP_PER_MINUTE). Se reutiliza el RateLimiter de core/llm_providers.py.
+2. La capacidad global: jobs en proceso más jobs en cola, contados en
+   `story_jobs` (así el límite vale para todos los procesos y para la cola
+   durable). Como máximo ADMISSION_MAX_IN_FLIGHT en proceso más
+   ADMISSION_MAX_PENDING esperando.
+
+Si se rechaza, la respuesta es 429 con `Retry-After`: la espera del bucket o,
+si la cola está llena, una estimación a partir de la duración de las
+generaciones recientes en `story_jobs`. Una historia del stock pregenerado no
+pasa por el punto 2, porque no llama al LLM.
+
+Con JOB_QUEUE_BACKEND="background", `generation_queue` limita además las
+generaciones simultáneas del proceso: los jobs admitidos esperan en "pending"
+hasta tener un lugar, como en la cola durable con WORKER_CONCURRENCY. Mientras
+esperan no ocupan un thread ni una conexión (ver `GenerationQueue`).
+
+Cada generación en curso puede retener una conexión del pool (p. ej. en
+streaming), así que el límite efectivo de generaciones simultáneas es
+ADMISSION_MAX_IN_FLIGHT acotado por el pool menos ADMISSION_RESERVED_CONNECTIONS,
+que quedan para las peticiones (ver `generation_capacity`).
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import HTTPException, Request  # Respuesta 429 e IP del cliente
+from sqlalchemy import func, select  # Construcción de consultas SQL
+from sqlalchemy.pool import QueuePool  # Pool con límite de conexiones
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.config import settings  # Límites de admisión
+from core.llm_providers import RateLimiter  # Token bucket seguro entre threads
+from core.metrics import registry  # Registro global de métricas
+from db.database import engine  # Pool de conexiones que acota las generaciones simultáneas
+from models.job import StoryJob  # Modelo ORM del trabajo
+
+logger = logging.getLogger(__name__)
+
+# Estados de un job que ocupa capacidad
+IN_FLIGHT_STATUSES = ("procesando", "parcial")
+PENDING_STATUS = "pending"
+
+ADMISSION_REJECTIONS = registry.counter(
+    "story_admission_rejections_total", "Peticiones de /story/create rechazadas con 429", ("reason",)
+)
+
+
+@dataclass
+class AdmissionRejected(Exception):
+    """La petición no se admite: se responde 429 con `Retry-After`."""
+    reason: str  # "session", "ip" o "capacity"
+    retry_after: float  # Segundos hasta que conviene reintentar
+    estimated_wait: Optional[float] = None  # Espera estimada de la cola (solo por capacidad)
+
+    def http_exception(self) -> HTTPException:
+        """429 con `Retry-After` (segundos enteros) y el motivo en el detalle."""
+        retry_after = max(1, math.ceil(self.retry_after))
+        detail = {"message": "Too many story requests", "reason": self.reason, "retry_after": retry_after}
+        if self.estimated_wait is not None:
+            detail["estimated_wait_seconds"] = math.ceil(self.estimated_wait)
+        return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+class KeyedRateLimiter:
+    """Un token bucket por clave (sesión o IP), con las claves acotadas por LRU."""
+
+    def __init__(self, requests_per_minute: int, max_keys: int):
+        self.requests_per_minute = requests_per_minute
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, RateLimiter]" = OrderedDict()
+
+    def try_acquire(self, key: str) -> float:
+        """Consume una petición de la clave. Devuelve 0 si se admite o los segundos a esperar."""
+        if not self.requests_per_minute:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # Una clave desalojada vuelve con el bucket lleno: el LRU solo acota la memoria
+                bucket = self._buckets[key] = RateLimiter(requests_per_minute=self.requests_per_minute)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        return bucket.try_acquire()
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Todas las fechas de los jobs se escriben en UTC; SQLite las devuelve sin zona."""
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class GenerationDurations:
+    """
+    Duración típica de una generación, leída de los jobs completados recientes
+    y guardada unos segundos para no consultar la tabla en cada rechazo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value: Optional[float] = None
+        self._updated = 0.0
+
+    def _load(self, db: Session) -> Optional[float]:
+        rows = db.execute(
+            select(StoryJob.created_at, StoryJob.started_at, StoryJob.completed_at)
+            .where(StoryJob.status == "completado", StoryJob.completed_at.is_not(None))
+            .order_by(StoryJob.created_at.desc())
+            .limit(settings.ADMISSION_DURATION_SAMPLE)
+        ).all()
+        durations = []
+        for created_at, started_at, completed_at in rows:
+            # started_at solo existe con la cola durable; si falta se cuenta desde la creación
+            start = started_at or created_at
+            if start is None:
+                continue
+            seconds = (_as_utc(completed_at) - _as_utc(start)).total_seconds()
+            if seconds >= 0:
+                durations.append(seconds)
+        return statistics.median(durations) if durations else None
+
+    def get(self, db: Session) -> float:
+        """Mediana de las generaciones recientes (o ADMISSION_DEFAULT_GENERATION_SECONDS si no hay)."""
+        with self._lock:
+            fresh = time.monotonic() - self._updated < settings.ADMISSION_DURATION_CACHE_SECONDS
+            if fresh and self._value is not None:
+                return self._value
+        value = self._load(db) or float(settings.ADMISSION_DEFAULT_GENERATION_SECONDS)
+        with self._lock:
+            self._value, self._updated = value, time.monotonic()
+        return value
+
+
+def generation_capacity() -> int:
+    """
+    Generaciones simultáneas por proceso: ADMISSION_MAX_IN_FLIGHT, sin superar
+    las conexiones del pool (DB_POOL_SIZE + DB_MAX_OVERFLOW) menos las
+    ADMISSION_RESERVED_CONNECTIONS que quedan para las peticiones. Con
+    ADMISSION_MAX_IN_FLIGHT=0 se usa todo lo que permite el pool. Un pool sin
+    límite (SQLite en memoria, DB_MAX_OVERFLOW < 0) no acota el valor.
+    Se aplica aunque ADMISSION_ENABLED sea False: sin límite, las generaciones
+    agotan el pool igual.
+    """
+    configured = settings.ADMISSION_MAX_IN_FLIGHT
+    if not isinstance(engine.pool, QueuePool) or settings.DB_MAX_OVERFLOW < 0:
+        return max(1, configured or settings.DB_POOL_SIZE)
+    available = max(1, settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW - settings.ADMISSION_RESERVED_CONNECTIONS)
+    if configured and configured <= available:
+        return configured
+    if configured:
+        logger.warning(
+            "ADMISSION_MAX_IN_FLIGHT=%s supera las conexiones que deja el pool; se usa %s", configured, available
+        )
+    return available
+
+
+def client_ip(request: Request) -> str:
+    """IP del cliente (la primera de X-Forwarded-For si ADMISSION_TRUST_FORWARDED_FOR)."""
+    if settings.ADMISSION_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def job_load(db: Session) -> Dict[str, int]:
+    """
+    Jobs en cola y en proceso. Solo cuentan los creados dentro de
+    ADMISSION_STALE_SECONDS: un job huérfano (p. ej. de un proceso caído) no
+    debe ocupar capacidad para siempre.
+    """
+    since = datetime.now(timezone.utc) - timedelta(seconds=settings.ADMISSION_STALE_SECONDS)
+    counts = dict(db.execute(
+        select(StoryJob.status, func.count())
+        .where(StoryJob.status.in_((PENDING_STATUS,) + IN_FLIGHT_STATUSES), StoryJob.created_at >= since)
+        .group_by(StoryJob.status)
+    ).all())
+    return {
+        "pending": counts.get(PENDING_STATUS, 0),
+        "in_flight": sum(counts.get(status, 0) for status in IN_FLIGHT_STATUSES)
+    }
+
+
+class AdmissionController:
+    """Decide si se admite una nueva generación (ver el docstring del módulo)."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.sessions = KeyedRateLimiter(settings.ADMISSION_SESSION_PER_MINUTE, settings.ADMISSION_MAX_TRACKED_KEYS)
+        self.ips = KeyedRateLimiter(settings.ADMISSION_IP_PER_MINUTE, settings.ADMISSION_MAX_TRACKED_KEYS)
+        self.durations = GenerationDurations()
+
+    def _reject(self, reason: str, retry_after: float, estimated_wait: Optional[float] = None):
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason, retry_after, estimated_wait)
+
+    def check_rate(self, session_id: str, ip: str):
+        """
+        Token buckets por sesión y por IP.
+
+        Raises:
+            AdmissionRejected: Si alguno de los dos está vacío.
+        """
+        if not settings.ADMISSION_ENABLED:
+            return
+        wait = self.sessions.try_acquire(session_id)
+        if wait > 0:
+            self._reject("session", wait)
+        wait = self.ips.try_acquire(ip)
+        if wait > 0:
+            self._reject("ip", wait)
+
+    def estimated_wait(self, db: Session, pending: int) -> float:
+        """Espera estimada de un job nuevo: las tandas de la cola por delante por la duración típica."""
+        return (pending // self.max_in_flight + 1) * self.durations.get(db)
+
+    def check_capacity(self, db: Session):
+        """
+        Capacidad global de generaciones (jobs en proceso más en cola). Sin
+        autoflush: el job que se está creando todavía no cuenta.
+
+        Raises:
+            AdmissionRejected: Si no queda lugar, con la espera estimada.
+        """
+        max_in_flight, max_pending = self.max_in_flight, settings.ADMISSION_MAX_PENDING
+        if not settings.ADMISSION_ENABLED:
+            return
+        with db.no_autoflush:
+            load = job_load(db)
+        if load["in_flight"] + load["pending"] < max_in_flight + max_pending:
+            return
+        # Cuando haya lugar, el job nuevo espera además a los que ya están en cola
+        with db.no_autoflush:
+            estimated = self.estimated_wait(db, load["pending"])
+            retry_after = self.durations.get(db) / max_in_flight
+        self._reject("capacity", retry_after, estimated)
+
+
+def _task_name(function: Callable) -> str:
+    return getattr(function, "__name__", repr(function))
+
+
+class GenerationQueue:
+    """
+    Generaciones del proceso con JOB_QUEUE_BACKEND="background": como máximo
+    `limit` a la vez y el resto en cola, sin ocupar un thread ni una conexión
+    mientras esperan.
+
+    - Las síncronas corren en un ThreadPoolExecutor propio de `limit` threads
+      (no en el threadpool de las peticiones); las pendientes son entradas de
+      su cola.
+    - Las asíncronas son tareas del event loop que esperan un semáforo.
+
+    `submit` y `submit_async` vuelven enseguida: la petición que creó el job
+    termina (y libera su sesión) sin esperar a la generación. Como con
+    BackgroundTasks, las tareas heredan el contexto (contextvars) de la petición.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _log_failure(name: str, error: Optional[BaseException]):
+        if error is not None and not isinstance(error, asyncio.CancelledError):
+            logger.error("La generación en segundo plano %s falló", name, exc_info=error)
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> Future:
+        """Encola una generación síncrona."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix="generation")
+            executor = self._executor
+        future = executor.submit(contextvars.copy_context().run, function, *args)
+        future.add_done_callback(lambda done: self._log_failure(_task_name(function), done.exception()))
+        return future
+
+    async def submit_async(self, function: Callable[..., Awaitable[Any]], *args: Any) -> asyncio.Task:
+        """Encola una generación asíncrona (llamar desde el event loop)."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            # Un semáforo por event loop (TestClient crea uno nuevo en cada `with`)
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+
+        async def run():
+            async with semaphore:
+                await function(*args)
+
+        task = loop.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(
+            lambda done: self._log_failure(_task_name(function), None if done.cancelled() else done.exception())
+        )
+        return task
+
+    async def drain(self):
+        """
+        Espera a que terminen las generaciones encoladas (al apagar el proceso,
+        como antes esperaba uvicorn a las BackgroundTasks).
+        """
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown)
+        self._semaphores.pop(asyncio.get_running_loop(), None)
+
+
+# Instancias globales del proceso
+admission_controller = AdmissionController(generation_capacity())
+generation_queue = GenerationQueue(admission_controller.max_in_flight)
@@ -5,7 +5,11 @@ Lee variables de entorno desde el archivo .env y las valida usando Pydantic.
 
 from typing import List
 from pydantic_settings import BaseSettings  # Para leer configuración desde variables de entorno
-from pydantic import field_validator  # Para validar y transformar campos
+from pydantic import field_validator, model_validator  # Para validar y transformar campos
+
+# Modos de generación que implementa el pipeline asíncrono (AsyncStoryGenerator)
+ASYNC_GENERATION_MODES = ("single", "fanout")
+
 
 class Settings(BaseSettings):
     """
@@ -22,6 +26,29 @@ class Settings(BaseSettings):
     # URL de conexión a la base de datos
     DATABASE_URL: str = "sqlite:////tmp/database.db"
 
+    # Aplica las migraciones pendientes (migrations/) al arrancar la API y el worker
+    AUTO_MIGRATE: bool = True
+
+    # Réplica de solo lectura opcional para los GET de /story y /job (vacío = usar la primaria)
+    DATABASE_REPLICA_URL: str = ""
+
+    # Pool de conexiones: tamaño, conexiones extra en picos, espera máxima por una
+    # conexión libre (s), reciclado de conexiones viejas (s) y verificación antes de usarlas
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
+    # SQLite: WAL (lecturas concurrentes con una escritura), espera por el lock (ms)
+    # y nivel de sincronización ("NORMAL" es seguro con WAL y mucho más rápido que "FULL")
+    SQLITE_WAL: bool = True
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+
+    # PostgreSQL: tiempo máximo por sentencia en ms (0 = sin límite)
+    POSTGRES_STATEMENT_TIMEOUT_MS: int = 30000
+
     # Orígenes permitidos para CORS (separados por comas en .env)
     ALLOWED_ORIGINS: str = ''
 
@@ -31,6 +58,204 @@ class Settings(BaseSettings):
     # Clave de API de Google Gemini (requerido si se usa Gemini)
     GEMINI_API_KEY: str = "" 
 
+    # Proveedor de LLM: "gemini", "openai" o "fake" (local, sin red)
+    LLM_PROVIDER: str = "gemini"
+
+    # Modelo a usar (vacío = el predeterminado del proveedor)
+    LLM_MODEL: str = ""
+
+    # Temperatura de generación
+    LLM_TEMPERATURE: float = 0.7
+
+    # Presupuesto compartido por proceso (0 = sin límite)
+    LLM_REQUESTS_PER_MINUTE: int = 0
+    LLM_TOKENS_PER_MINUTE: int = 0
+
+    # Parámetros del proveedor "fake": latencia simulada y forma del árbol.
+    # Los *_JITTER reparten la latencia (± ms, uniforme) y la profundidad (+ niveles);
+    # *_PER_TOKEN_MS suma latencia por token de salida (respuestas largas tardan más)
+    FAKE_LLM_LATENCY_MS: int = 0
+    FAKE_LLM_LATENCY_JITTER_MS: int = 0
+    FAKE_LLM_LATENCY_PER_TOKEN_MS: float = 0
+    FAKE_LLM_DEPTH: int = 3
+    FAKE_LLM_DEPTH_JITTER: int = 0
+    FAKE_LLM_BRANCHING: int = 2
+
+    # Usa el pipeline asíncrono (ainvoke + AsyncSession) para generar historias
+    ASYNC_GENERATION: bool = False
+
+    # Modo de generación del pipeline síncrono:
+    # "single" (una llamada, se guarda al final), "streaming" (se guarda nodo a nodo
+    # y la historia es jugable desde que la raíz tiene su primera opción),
+    # "incremental" (solo los primeros niveles; el resto se genera al acercarse el jugador)
+    # o "fanout" (un esquema y luego cada rama de primer nivel en paralelo). El pipeline
+    # asíncrono solo implementa "single" y "fanout": con ASYNC_GENERATION los otros se rechazan
+    # al arrancar
+    GENERATION_MODE: str = "single"
+
+    # Modo "incremental" (ver core/story_expansion.py): niveles de la generación inicial
+    # (la raíz es el nivel 1), niveles que agrega cada expansión y niveles máximos de la
+    # historia (al llegar, la expansión solo genera finales)
+    INCREMENTAL_INITIAL_LEVELS: int = 2
+    INCREMENTAL_EXPAND_LEVELS: int = 2
+    INCREMENTAL_MAX_LEVELS: int = 8
+
+    # Segundos tras los cuales una expansión sin terminar (p. ej. un proceso caído) se puede reintentar
+    INCREMENTAL_EXPANSION_LEASE_SECONDS: int = 120
+
+    # Modo "fanout" (ver StoryGenerator.generate_story_fanout): llamadas al LLM en paralelo
+    # por historia (una por rama de primer nivel), reintentos de cada rama que falle
+    # y niveles de cada rama (incluyendo su primera escena; la raíz queda por encima)
+    FANOUT_CONCURRENCY: int = 3
+    FANOUT_BRANCH_RETRIES: int = 1
+    FANOUT_BRANCH_LEVELS: int = 3
+
+    # Límites de la respuesta del LLM (ver core/story_parser.py): niveles (la raíz es
+    # el nivel 1) y nodos máximos; una historia más grande falla sin llegar a validarse
+    STORY_MAX_DEPTH: int = 10
+    STORY_MAX_NODES: int = 500
+
+    # Caché de historias por tema (ver core/story_cache.py)
+    STORY_CACHE_ENABLED: bool = True
+
+    # Historias distintas que se generan por clave antes de empezar a reutilizarlas
+    # (0 = nunca reutilizar; solo se agrupan las peticiones concurrentes). Con K > 0
+    # una sesión puede recibir una historia generada para otra (nunca una que ya tiene)
+    STORY_CACHE_REUSE_K: int = 0
+
+    # Claves máximas en memoria (desalojo LRU) y vida de cada clave en segundos
+    STORY_CACHE_MAX_KEYS: int = 1000
+    STORY_CACHE_TTL_SECONDS: int = 6 * 60 * 60
+
+    # Stock de historias pregeneradas para los temas más populares (ver core/story_pool.py)
+    STORY_POOL_ENABLED: bool = False
+    STORY_POOL_TOP_THEMES: int = 10
+    STORY_POOL_SIZE_PER_THEME: int = 3
+    STORY_POOL_THEME_WINDOW_DAYS: int = 7
+    STORY_POOL_MAX_GENERATIONS_PER_HOUR: int = 30
+    STORY_POOL_REFILL_INTERVAL_SECONDS: int = 60
+
+    # Caché de respuestas de /story/{id}/complete ya serializadas (ver core/response_cache.py)
+    # Bytes máximos en memoria y directorio opcional para el nivel en disco (vacío = desactivado)
+    STORY_RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    STORY_RESPONSE_CACHE_DIR: str = ""
+
+    # Negociación de contenido de historias y jobs (ver core/response_encoding.py):
+    # bytes mínimos para comprimir, niveles de gzip (1-9) y brotli (0-11) de las
+    # respuestas que se comprimen por request (las precalculadas usan el máximo)
+    # y si se acepta `Accept: application/msgpack` (requiere msgpack)
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 1024
+    RESPONSE_GZIP_LEVEL: int = 6
+    RESPONSE_BROTLI_QUALITY: int = 4
+    RESPONSE_MSGPACK_ENABLED: bool = True
+
+    # Formato de almacenamiento de las historias nuevas (ver core/story_store.py):
+    # "rows" (una fila de story_nodes por nodo) o "blob" (árbol comprimido en stories.tree_blob)
+    STORY_STORAGE_BACKEND: str = "rows"
+
+    # Formato del blob: códec "none", "zlib" o "zstd" (requiere zstandard)
+    # y serialización "json" o "msgpack" (requiere msgpack)
+    STORY_BLOB_CODEC: str = "zlib"
+    STORY_BLOB_SERIALIZATION: str = "json"
+
+    # Niveles de hijos que puede pedir /story/{id}/node/{node_id}?prefetch=k
+    STORY_NODE_MAX_PREFETCH: int = 5
+
+    # Historias por página de la biblioteca de la sesión (GET /story?limit=n): por defecto y máximo
+    STORY_LIBRARY_DEFAULT_LIMIT: int = 20
+    STORY_LIBRARY_MAX_LIMIT: int = 100
+
+    # Control de admisión de /story/create (ver core/admission.py). Peticiones por minuto
+    # por sesión y por IP (token buckets; 0 = sin límite) y claves recordadas por proceso
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_SESSION_PER_MINUTE: int = 10
+    ADMISSION_IP_PER_MINUTE: int = 60
+    ADMISSION_MAX_TRACKED_KEYS: int = 10000
+    # Usar la primera IP de X-Forwarded-For (solo detrás de un proxy de confianza)
+    ADMISSION_TRUST_FORWARDED_FOR: bool = False
+    # Capacidad global: generaciones en proceso (también el límite por proceso con la cola
+    # "background") y jobs esperando en cola; más allá se responde 429. Las generaciones en
+    # proceso se acotan siempre por el pool (DB_POOL_SIZE + DB_MAX_OVERFLOW) menos las
+    # conexiones reservadas para las peticiones (0 = todo lo que permite el pool). Los jobs
+    # en cola no ocupan conexiones ni threads
+    ADMISSION_MAX_IN_FLIGHT: int = 8
+    ADMISSION_MAX_PENDING: int = 32
+    ADMISSION_RESERVED_CONNECTIONS: int = 5
+    # Los jobs creados hace más de estos segundos no cuentan (huérfanos de un proceso caído)
+    ADMISSION_STALE_SECONDS: int = 900
+    # Estimación de la espera: jobs completados que se miran, segundos que se reutiliza
+    # la mediana y duración supuesta si todavía no hay jobs completados
+    ADMISSION_DURATION_SAMPLE: int = 50
+    ADMISSION_DURATION_CACHE_SECONDS: int = 30
+    ADMISSION_DEFAULT_GENERATION_SECONDS: int = 20
+
+    # Cola de trabajos: "background" (BackgroundTasks en el proceso de la API)
+    # o "sql" (tabla story_jobs procesada por worker.py)
+    JOB_QUEUE_BACKEND: str = "background"
+
+    # Cantidad de trabajos que procesa en paralelo cada worker
+    WORKER_CONCURRENCY: int = 2
+
+    # Segundos entre consultas a la cola cuando no hay trabajos pendientes
+    WORKER_POLL_INTERVAL: float = 1.0
+
+    # Duración del lease de un trabajo reclamado (se renueva con latidos)
+    JOB_LEASE_SECONDS: int = 120
+
+    # Intentos máximos antes de marcar un trabajo abandonado como error
+    JOB_MAX_ATTEMPTS: int = 3
+
+    # Cada cuántos segundos los endpoints SSE/long-poll revisan la DB como respaldo
+    # (los cambios hechos por worker.py en otro proceso no pasan por el notificador)
+    JOB_EVENTS_DB_POLL_SECONDS: float = 5.0
+
+    # Caché write-through del estado de los jobs para GET /job/{id} (ver core/job_status_cache.py):
+    # entradas en memoria por proceso, segundos que se conserva un job terminado y segundos
+    # tras los que un estado intermedio sin cambios se vuelve a leer de la base de datos
+    JOB_STATUS_CACHE_ENABLED: bool = True
+    JOB_STATUS_CACHE_MAX_ENTRIES: int = 10000
+    JOB_STATUS_CACHE_TTL_SECONDS: int = 600
+    JOB_STATUS_CACHE_REFRESH_SECONDS: int = 60
+    # Directorio del nivel compartido entre procesos, idealmente en tmpfs
+    # (p. ej. /dev/shm/cuentos-jobs; vacío = solo memoria del proceso)
+    JOB_STATUS_CACHE_DIR: str = ""
+
+    # Retención de story_jobs (ver core/retention.py): días que se conserva un job
+    # según su estado, contados desde que terminó (0 = para siempre). "Atascados" son
+    # los que siguen en pending/procesando/parcial (p. ej. tras una caída sin worker).
+    # La biblioteca de la sesión (GET /story) se lee de los jobs completados, así que
+    # JOB_RETENTION_COMPLETED_DAYS es también lo que una historia dura en ella
+    JOB_RETENTION_COMPLETED_DAYS: int = 30
+    JOB_RETENTION_ERROR_DAYS: int = 7
+    JOB_RETENTION_STUCK_DAYS: int = 2
+
+    # Qué hacer con los jobs vencidos antes de borrarlos: "none", "table"
+    # (tabla story_jobs_archive) o "ndjson" (se agregan a RETENTION_ARCHIVE_PATH)
+    RETENTION_ARCHIVE: str = "none"
+    RETENTION_ARCHIVE_PATH: str = "story_jobs_archive.ndjson"
+
+    # Filas por transacción (lotes cortos para no bloquear la tabla)
+    RETENTION_BATCH_SIZE: int = 500
+
+    # Horas que se respeta una historia huérfana antes de borrarla (evita
+    # competir con generaciones que todavía están guardando nodos)
+    STORY_ORPHAN_GRACE_HOURS: int = 24
+
+    # Cada cuántos segundos worker.py ejecuta la retención (0 = solo a mano)
+    RETENTION_INTERVAL_SECONDS: int = 0
+
+    # Token de los endpoints /admin y de la cabecera X-Profile (vacío = administración desactivada)
+    ADMIN_TOKEN: str = ""
+
+    # Perfilado bajo demanda (ver core/profiling.py). Desactivado no agrega ningún envoltorio.
+    # Modo "cprofile" (descarga .pstats) o "sampling" (descarga speedscope), fracción de
+    # requests/generaciones perfiladas al azar, intervalo del muestreo y perfiles guardados
+    PROFILING_ENABLED: bool = False
+    PROFILING_MODE: str = "cprofile"
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILING_BUFFER_SIZE: int = 50
+
     @field_validator('ALLOWED_ORIGINS')
     def parse_allowed_origins(cls, v: str) -> List[str]:
         """
@@ -39,6 +264,19 @@ class Settings(BaseSettings):
         """
         return v.split(',') if v else []
 
+    @model_validator(mode='after')
+    def check_async_generation_mode(self) -> 'Settings':
+        """
+        Rechaza al arrancar los modos que el pipeline asíncrono no implementa:
+        sin esto, "streaming" e "incremental" se generaban en silencio como "single".
+        """
+        if self.ASYNC_GENERATION and self.GENERATION_MODE not in ASYNC_GENERATION_MODES:
+            raise ValueError(
+                f'GENERATION_MODE="{self.GENERATION_MODE}" no está disponible con ASYNC_GENERATION=true '
+                f'(modos asíncronos: {", ".join(ASYNC_GENERATION_MODES)})'
+            )
+        return self
+
     class Config:
         """Configuración de cómo Pydantic lee las variables de entorno"""
         env_file = '.env'  # Archivo desde donde leer las variables
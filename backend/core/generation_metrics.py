@@ -0,0 +1,70 @@
+"""
+Métricas del pipeline de generación de historias (expuestas en `GET /metrics`).
+
+Permiten ver en qué etapa se va el tiempo de una historia lenta:
+
+- `story_generation_stage_seconds{mode, stage}`: duración de cada etapa de
+  `StoryGenerator` ("prompt", "llm", "first_chunk", "parse", "persist" y "total").
+- `story_job_queue_wait_seconds{backend}`: desde que se crea el job hasta que
+  pasa a "procesando" (espera en BackgroundTasks o en la cola durable).
+- `llm_tokens_total{model, direction}`: tokens de entrada y de salida.
+- `story_nodes_per_story`: tamaño de las historias generadas.
+- `story_parse_failures_total{mode}`: respuestas del LLM que no validan el esquema.
+- `story_jobs_finished_total{status}`: jobs terminados por estado final.
+- `story_fanout_branch_retries_total`: ramas del modo "fanout" que se reintentaron.
+
+Cada observación es una suma bajo un lock, así que se pueden dejar activas en producción.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from core.metrics import registry  # Registro global de métricas
+
+STAGE_SECONDS = registry.histogram(
+    "story_generation_stage_seconds", "Duración de cada etapa de la generación de una historia", ("mode", "stage")
+)
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "story_job_queue_wait_seconds", "Espera del job desde su creación hasta que empieza a procesarse", ("backend",)
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Tokens enviados y recibidos del LLM", ("model", "direction")
+)
+NODES_PER_STORY = registry.histogram(
+    "story_nodes_per_story", "Nodos por historia generada", (),
+    buckets=(1, 3, 7, 15, 31, 63, 127, 255, 511)
+)
+PARSE_FAILURES = registry.counter(
+    "story_parse_failures_total", "Respuestas del LLM que no cumplen el esquema de la historia", ("mode",)
+)
+JOBS_FINISHED = registry.counter(
+    "story_jobs_finished_total", "Jobs de generación terminados por estado final", ("status",)
+)
+FANOUT_BRANCH_RETRIES = registry.counter(
+    "story_fanout_branch_retries_total", "Ramas del modo fanout que fallaron y se reintentaron", ()
+)
+
+
+def observe_queue_wait(created_at: Optional[datetime], backend: str):
+    """Registra la espera en cola de un job (las fechas sin zona se asumen UTC, como las de SQLite)."""
+    if created_at is None:
+        return
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    wait = (datetime.now(timezone.utc) - created_at).total_seconds()
+    QUEUE_WAIT_SECONDS.observe(max(0.0, wait), backend=backend)
+
+
+def count_story_nodes(root_node) -> int:
+    """
+    Cantidad de nodos que se guardan de un árbol ya validado (recorrido
+    iterativo). Como en `flatten_story_tree`, los finales no aportan sus opciones.
+    """
+    count = 0
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if not node.isEnding and node.options:
+            stack.extend(option.next_node for option in node.options)
+    return count
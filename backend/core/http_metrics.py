@@ -0,0 +1,60 @@
+"""
+Latencia HTTP por ruta (`http_request_duration_seconds`, expuesta en `GET /metrics`).
+
+Middleware ASGI puro: no envuelve la respuesta ni la lee en memoria, así que
+no afecta a los streams SSE. Usa la plantilla de la ruta
+(p. ej. `/job/{job_id}`) y no la URL concreta, para que la cantidad de series
+no crezca con los IDs.
+"""
+
+import time
+
+from core.metrics import registry  # Registro global de métricas
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Duración de las requests HTTP por ruta", ("method", "route", "status")
+)
+
+
+class HTTPMetricsMiddleware:
+    """
+    Mide desde que llega la request hasta que se envía el último fragmento
+    de la respuesta (sin contar las tareas en segundo plano que corren después).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500, "observed": False}
+
+        def observe():
+            status["observed"] = True
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route.path if route is not None else "sin_ruta",
+                status=str(status["code"])
+            )
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                observe()
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            # Una excepción sin manejar no envía el último fragmento: se registra como 500
+            # antes de propagarla, salvo que la respuesta ya se hubiera medido
+            if not status["observed"]:
+                observe()
+            raise
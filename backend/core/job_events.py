@@ -0,0 +1,79 @@
+"""
+Notificador en proceso de cambios de estado de los jobs.
+
+La tarea de generación publica cada transición (pending -> procesando ->
+completado/error) y los endpoints SSE / long-poll de `routers/job.py` la
+reciben sin tener que consultar la base de datos en cada intervalo.
+
+Las tareas pueden correr en threads (BackgroundTasks síncronas) mientras que
+los suscriptores viven en el event loop, por eso la publicación usa
+`call_soon_threadsafe`.
+"""
+
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple
+
+from core.job_status_cache import TERMINAL_STATUSES, job_status_cache  # Caché write-through del estado
+from schemas.job import StoryJobResponse  # Schema con el que se serializa el estado del job
+
+
+def job_payload(job) -> Dict[str, Any]:
+    """Serializa un StoryJob al mismo formato que devuelve GET /job/{job_id}."""
+    return StoryJobResponse.model_validate(job).model_dump(mode="json")
+
+
+class JobNotifier:
+    """
+    Registro de suscriptores por job_id.
+    Cada suscriptor es una asyncio.Queue ligada al event loop que la creó.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Crea una cola que recibirá los cambios de estado del job (llamar desde el event loop)."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        """Elimina una suscripción creada con `subscribe`."""
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(job_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[job_id] = subscribers
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def publish(self, job_id: str, payload: Dict[str, Any]):
+        """Envía el nuevo estado a todos los suscriptores del job. Es seguro llamarlo desde cualquier thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, payload)
+            except RuntimeError:
+                # El event loop del suscriptor ya se cerró
+                pass
+
+
+# Instancia global compartida por las tareas de generación y los routers
+job_notifier = JobNotifier()
+
+
+def publish_job_update(job):
+    """
+    Publica el estado actual de un StoryJob a los suscriptores y a la caché
+    de estados (llamar después del commit).
+    """
+    publish_job_payload(job.job_id, job_payload(job))
+
+
+def publish_job_payload(job_id: str, payload: Dict[str, Any]):
+    """Como `publish_job_update`, con el estado ya serializado por `job_payload`."""
+    job_status_cache.write_through(job_id, payload)
+    job_notifier.publish(job_id, payload)
@@ -0,0 +1,280 @@
+"""
+Cola durable de trabajos de generación sobre la tabla `story_jobs`.
+
+Los trabajos 'pending' sobreviven a reinicios de la API y son procesados por
+workers independientes (ver worker.py):
+- Reclamo atómico: `SELECT ... FOR UPDATE SKIP LOCKED` en PostgreSQL y un
+  UPDATE condicional en SQLite (que ya serializa las escrituras).
+- Lease con latidos: mientras el worker procesa, renueva `lease_expires_at`.
+  Sin cola durable, la API reclama con `claim_job` los trabajos que genera en
+  el proceso y `api_lease_renewer` renueva sus leases.
+- Recuperación: los trabajos 'procesando' con el lease vencido vuelven a
+  'pending' (o pasan a 'error' si agotaron sus intentos).
+- Dueño: cada transición posterior al reclamo (`update_owned_job`) exige que el
+  trabajo siga reclamado por quien lo procesa; un trabajo recuperado no se pisa.
+"""
+
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, select, update  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from models.job import StoryJob  # Modelo ORM del trabajo
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo que un worker está procesando ('parcial' = streaming con raíz jugable)
+ACTIVE_STATUSES = ("procesando", "parcial")
+
+
+class JobOwnershipLost(Exception):
+    """El trabajo ya no pertenece a quien lo procesa (se recuperó tras vencer su lease)."""
+
+
+def _utcnow() -> datetime:
+    """Hora actual en UTC (los leases se comparan siempre en UTC)."""
+    return datetime.now(timezone.utc)
+
+
+def api_owner_id() -> str:
+    """Dueño de los trabajos que genera este proceso de la API (se calcula tras el fork)."""
+    return f"api-{socket.gethostname()}-{os.getpid()}"
+
+
+def _claim_values(owner_id: str, now: datetime, lease_seconds: int) -> Dict[str, Any]:
+    return dict(
+        status="procesando",
+        claimed_by=owner_id,
+        started_at=now,
+        heartbeat_at=now,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+    )
+
+
+def claim_next_job(db: Session, worker_id: str, lease_seconds: int) -> Optional[StoryJob]:
+    """
+    Reclama atómicamente el trabajo 'pending' más antiguo.
+
+    Args:
+        db: Sesión de base de datos.
+        worker_id: Identificador único del worker que reclama.
+        lease_seconds: Duración inicial del lease.
+
+    Returns:
+        El StoryJob reclamado (ya en estado 'procesando') o None si no hay trabajos.
+    """
+    now = _utcnow()
+    claim_values = _claim_values(worker_id, now, lease_seconds)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Los workers concurrentes se saltan las filas ya bloqueadas por otro
+        job = db.execute(
+            select(StoryJob)
+            .where(StoryJob.status == "pending")
+            .order_by(StoryJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+        if job is None:
+            db.rollback()
+            return None
+
+        for field, value in claim_values.items():
+            setattr(job, field, value)
+        job.attempts = (job.attempts or 0) + 1
+        db.commit()
+        return job
+
+    # SQLite: el UPDATE con subconsulta es atómico porque SQLite tiene un único escritor
+    oldest_pending = (
+        select(StoryJob.id)
+        .where(StoryJob.status == "pending")
+        .order_by(StoryJob.created_at)
+        .limit(1)
+        .scalar_subquery()
+    )
+    claimed_id = db.execute(
+        update(StoryJob)
+        .where(StoryJob.id == oldest_pending, StoryJob.status == "pending")
+        .values(attempts=StoryJob.attempts + 1, **claim_values)
+        .returning(StoryJob.id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    db.commit()
+
+    if claimed_id is None:
+        return None
+    return db.get(StoryJob, claimed_id)
+
+
+def claim_job(db: Session, job_id: str, owner_id: str, lease_seconds: int) -> bool:
+    """
+    Reclama un trabajo 'pending' concreto: el que la API encoló en su propio
+    proceso (JOB_QUEUE_BACKEND="background"). Desde ahí tiene lease como los
+    de los workers y se recupera si el proceso muere.
+    No hace commit: el llamador confirma al publicar el nuevo estado.
+
+    Returns:
+        bool: False si otro proceso ya lo reclamó.
+    """
+    result = db.execute(
+        update(StoryJob)
+        .where(StoryJob.job_id == job_id, StoryJob.status == "pending")
+        .values(attempts=StoryJob.attempts + 1, **_claim_values(owner_id, _utcnow(), lease_seconds))
+        .execution_options(synchronize_session="fetch")
+    )
+    return result.rowcount > 0
+
+
+def update_owned_job(db: Session, job_id: str, owner_id: str, **values: Any) -> bool:
+    """
+    Actualiza un trabajo solo si sigue reclamado por `owner_id` y activo.
+    También actualiza el StoryJob cargado en la sesión.
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Returns:
+        bool: False si el trabajo fue recuperado y ahora pertenece a otro.
+    """
+    result = db.execute(
+        update(StoryJob)
+        .where(
+            StoryJob.job_id == job_id,
+            StoryJob.claimed_by == owner_id,
+            StoryJob.status.in_(ACTIVE_STATUSES),
+        )
+        .values(**values)
+    )
+    return result.rowcount > 0
+
+
+def heartbeat(db: Session, job_id: str, worker_id: str, lease_seconds: int) -> bool:
+    """
+    Renueva el lease de un trabajo que el worker sigue procesando.
+
+    Returns:
+        bool: False si el trabajo ya no pertenece a este worker (fue recuperado).
+    """
+    now = _utcnow()
+    result = db.execute(
+        update(StoryJob)
+        .where(
+            StoryJob.job_id == job_id,
+            StoryJob.claimed_by == worker_id,
+            StoryJob.status.in_(ACTIVE_STATUSES),
+        )
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def renew_leases(db: Session, owner_id: str, lease_seconds: int) -> int:
+    """
+    Renueva de una vez los leases de todos los trabajos activos de `owner_id`.
+
+    Returns:
+        int: Cantidad de trabajos renovados.
+    """
+    now = _utcnow()
+    result = db.execute(
+        update(StoryJob)
+        .where(StoryJob.claimed_by == owner_id, StoryJob.status.in_(ACTIVE_STATUSES))
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+class LeaseRenewer:
+    """
+    Thread que renueva los leases de los trabajos que genera este proceso de la
+    API: un único UPDATE por latido, sin importar cuántos trabajos haya en curso.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self, lease_seconds: int):
+        # Import diferido: db.database crea el engine al importarse
+        from db.database import SessionLocal
+
+        # Se late tres veces por lease para tolerar algún retraso
+        while not self._stop.wait(lease_seconds / 3):
+            db = SessionLocal()
+            try:
+                renew_leases(db, api_owner_id(), lease_seconds)
+            except Exception:
+                logger.exception("Error renovando los leases de %s", api_owner_id())
+            finally:
+                db.close()
+
+    def start(self, lease_seconds: int):
+        """Arranca el thread (idempotente)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(lease_seconds,), name="job-lease-renewer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el thread; los leases vencen solos si el proceso no termina sus trabajos."""
+        self._stop.set()
+
+
+api_lease_renewer = LeaseRenewer()
+
+
+def recover_stale_jobs(db: Session, max_attempts: int) -> int:
+    """
+    Recupera los trabajos abandonados (worker caído o API reiniciada).
+
+    Un trabajo 'procesando' (o 'parcial') está abandonado si su lease venció. Los
+    que no tienen lease (reclamados por una versión anterior de la API, que no
+    los renovaba) no se tocan: ningún worker puede saber si su proceso sigue
+    generándolos, y la retención los limpia pasado `JOB_RETENTION_STUCK_DAYS`.
+
+    Args:
+        db: Sesión de base de datos.
+        max_attempts: Intentos máximos antes de marcar el trabajo como error.
+
+    Returns:
+        int: Cantidad de trabajos recuperados o marcados como error.
+    """
+    now = _utcnow()
+    stale = and_(
+        StoryJob.status.in_(ACTIVE_STATUSES),
+        StoryJob.lease_expires_at < now,
+    )
+
+    requeued = db.execute(
+        update(StoryJob)
+        .where(stale, StoryJob.attempts < max_attempts)
+        # Una generación en streaming abandonada ya había publicado su historia a medias
+        .values(status="pending", claimed_by=None, lease_expires_at=None, story_id=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    failed = db.execute(
+        update(StoryJob)
+        .where(stale, StoryJob.attempts >= max_attempts)
+        .values(
+            status="error",
+            error="El trabajo fue abandonado demasiadas veces",
+            completed_at=now,
+            lease_expires_at=None,
+            story_id=None,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.commit()
+    return requeued + failed
@@ -0,0 +1,174 @@
+"""
+Caché write-through del estado de los jobs.
+
+El frontend consulta `GET /job/{job_id}` cada pocos segundos, pero un job
+cambia de estado unas tres veces (pending -> procesando -> completado/error).
+Cada transición se escribe aquí al publicarse (`publish_job_update`) y las
+consultas se responden sin abrir una sesión de base de datos:
+- Nivel en memoria: LRU acotado (JOB_STATUS_CACHE_MAX_ENTRIES).
+- Nivel compartido opcional (JOB_STATUS_CACHE_DIR): un archivo JSON por job,
+  pensado para un tmpfs como /dev/shm, que ven todos los procesos de la máquina.
+
+Un estado final no cambia: se guarda JOB_STATUS_CACHE_TTL_SECONDS y luego se
+desaloja. Un estado intermedio solo vale si lo escribió quien ejecuta el job:
+- Sin nivel compartido, solo con JOB_QUEUE_BACKEND="background" (la tarea
+  corre en este proceso); con la cola "sql" lo actualiza worker.py en otro proceso.
+- Con nivel compartido, solo ahí (la memoria de cada proceso tendría el
+  estado viejo cuando otro proceso escribe la transición).
+Lo que se lee de la base de datos solo se guarda si es un estado final, y
+un estado intermedio con más de JOB_STATUS_CACHE_REFRESH_SECONDS sin cambios
+se vuelve a leer (p. ej. un job recuperado por `recover_stale_jobs`, que
+actualiza la tabla sin publicar).
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings  # Límites y nivel compartido de la caché
+from core.metrics import registry  # Registro global de métricas
+
+# Estados a partir de los cuales el job ya no cambia
+TERMINAL_STATUSES = {"completado", "error"}
+
+# Solo los IDs con esta forma se usan como nombre de archivo (job_id llega en la URL)
+_SAFE_JOB_ID = re.compile(r"[A-Za-z0-9-]{1,64}")
+
+JOB_STATUS_CACHE_LOOKUPS = registry.counter(
+    "job_status_cache_lookups_total", "Consultas a la caché de estados de jobs", ("result",)
+)
+
+
+class JobStatusCache:
+    """LRU en memoria con vencimiento por entrada y nivel compartido opcional en archivos."""
+
+    def __init__(self, max_entries: int, shared_dir: str = ""):
+        self.max_entries = max_entries
+        self.shared_dir = shared_dir
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._last_sweep = 0.0
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    @staticmethod
+    def _lifetime(payload: Dict[str, Any]) -> float:
+        """Segundos que vale una entrada según su estado."""
+        if payload.get("status") in TERMINAL_STATUSES:
+            return settings.JOB_STATUS_CACHE_TTL_SECONDS
+        return settings.JOB_STATUS_CACHE_REFRESH_SECONDS
+
+    def _shared_path(self, job_id: str) -> Optional[str]:
+        if not self.shared_dir or not _SAFE_JOB_ID.fullmatch(job_id):
+            return None
+        return os.path.join(self.shared_dir, f"job-{job_id}.json")
+
+    def _remember(self, job_id: str, payload: Dict[str, Any]):
+        """Guarda en memoria y desaloja las entradas menos usadas."""
+        expires_at = time.monotonic() + self._lifetime(payload)
+        with self._lock:
+            self._entries[job_id] = (expires_at, payload)
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_memory(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                del self._entries[job_id]
+                return None
+            self._entries.move_to_end(job_id)
+            return payload
+
+    def _get_shared(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self._shared_path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                age = time.time() - os.fstat(f.fileno()).st_mtime
+                payload = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        if age >= self._lifetime(payload):
+            return None
+        if payload.get("status") in TERMINAL_STATUSES:
+            # Ya no cambia: las siguientes consultas de este proceso no leen el archivo
+            self._remember(job_id, payload)
+        return payload
+
+    def _write_shared(self, path: str, payload: Dict[str, Any]):
+        # Escritura atómica: otros procesos nunca leen un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=self.shared_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self._sweep_shared()
+
+    def _sweep_shared(self):
+        """Borra los archivos vencidos (como mucho una vez por JOB_STATUS_CACHE_REFRESH_SECONDS)."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < settings.JOB_STATUS_CACHE_REFRESH_SECONDS:
+                return
+            self._last_sweep = now
+        max_age = max(settings.JOB_STATUS_CACHE_TTL_SECONDS, settings.JOB_STATUS_CACHE_REFRESH_SECONDS)
+        for entry in os.scandir(self.shared_dir):
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado del job en memoria y luego en el nivel compartido (None si no está o venció)."""
+        if not settings.JOB_STATUS_CACHE_ENABLED:
+            return None
+        payload = self._get_memory(job_id)
+        if payload is not None:
+            JOB_STATUS_CACHE_LOOKUPS.inc(result="memory")
+            return payload
+        payload = self._get_shared(job_id)
+        JOB_STATUS_CACHE_LOOKUPS.inc(result="miss" if payload is None else "shared")
+        return payload
+
+    def write_through(self, job_id: str, payload: Dict[str, Any]):
+        """
+        Guarda una transición del job (llamar después del commit, desde quien lo ejecuta).
+
+        Args:
+            job_id: UUID del trabajo.
+            payload: Estado serializado como en GET /job/{job_id} (`job_payload`).
+        """
+        if not settings.JOB_STATUS_CACHE_ENABLED:
+            return
+        terminal = payload.get("status") in TERMINAL_STATUSES
+        path = self._shared_path(job_id)
+        if path is not None:
+            self._write_shared(path, payload)
+            if not terminal:
+                # La memoria de este proceso no debe tapar la próxima transición escrita por otro
+                with self._lock:
+                    self._entries.pop(job_id, None)
+                return
+        elif not terminal and settings.JOB_QUEUE_BACKEND != "background":
+            return
+        self._remember(job_id, payload)
+
+    def remember_read(self, job_id: str, payload: Dict[str, Any]):
+        """Guarda un estado leído de la base de datos (solo si es final: otro proceso puede cambiarlo)."""
+        if settings.JOB_STATUS_CACHE_ENABLED and payload.get("status") in TERMINAL_STATUSES:
+            self._remember(job_id, payload)
+
+
+# Instancia global compartida por las tareas de generación y los routers
+job_status_cache = JobStatusCache(settings.JOB_STATUS_CACHE_MAX_ENTRIES, settings.JOB_STATUS_CACHE_DIR)
@@ -0,0 +1,344 @@
+"""
+Capa de proveedores de LLM.
+
+- Registro de clientes de larga vida: se crea un cliente (con su pool HTTP) por
+  proveedor/modelo/temperatura y se reutiliza en todas las historias.
+- Presupuesto compartido de requests por minuto (RPM) y tokens por minuto (TPM)
+  para todas las generaciones del proceso.
+- Proveedor "fake" local y determinista para pruebas de carga y CI sin red.
+
+Proveedores disponibles (LLM_PROVIDER): "gemini", "openai", "fake".
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel  # Base de los modelos de chat de LangChain
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage  # Mensajes de LangChain
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult  # Resultados de generación
+
+from core.config import settings  # Configuración de la aplicación
+from core.generation_metrics import LLM_TOKENS  # Contador de tokens por modelo
+
+# Modelo por defecto de cada proveedor cuando LLM_MODEL está vacío
+DEFAULT_MODELS = {
+    "gemini": "gemini-2.0-flash",
+    "openai": "gpt-4o-mini",
+    "fake": "fake-story",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token)."""
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """
+    Doble token bucket (requests y tokens por minuto) seguro entre threads.
+    Un límite en 0 significa "sin límite".
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """Intenta consumir el presupuesto. Devuelve 0 si lo logró o los segundos a esperar."""
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            if self.requests_per_minute and self._requests < 1:
+                wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                # Una petición más grande que el bucket completo solo espera a que se llene
+                needed = min(tokens, self.tokens_per_minute)
+                if self._tokens < needed:
+                    wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                return wait
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int = 0):
+        """Bloquea el thread hasta que haya presupuesto para una request de `tokens` tokens."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """Variante asíncrona de `acquire` (no bloquea el event loop)."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def consume(self, tokens: int):
+        """Descuenta tokens usados después de la llamada (p. ej. los de salida)."""
+        if not self.tokens_per_minute:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+
+def build_fake_story(seed_text: str, depth: int, branching: int) -> Dict[str, Any]:
+    """
+    Construye una historia determinista (mismo texto de entrada -> misma historia).
+
+    Args:
+        seed_text: Texto del que se deriva la semilla (p. ej. el mensaje con el tema).
+        depth: Niveles máximos del árbol (incluyendo la raíz).
+        branching: Opciones por cada nodo que no es final.
+
+    Returns:
+        Diccionario con la estructura de StoryLLMResponse.
+    """
+    rng = random.Random(hashlib.sha256(seed_text.encode("utf-8")).hexdigest())
+    places = ["un bosque antiguo", "una ciudad sumergida", "una nave a la deriva", "un castillo en ruinas", "un mercado nocturno"]
+    actions = ["Explorar", "Esconderse", "Negociar", "Huir", "Investigar", "Pedir ayuda"]
+
+    def build_node(level: int, path: str, winning_path: bool) -> Dict[str, Any]:
+        # Los caminos terminan a distintas profundidades; la primera rama siempre llega al final ganador
+        is_ending = level == depth or (level > 2 and not winning_path and rng.random() < 0.3)
+        node = {
+            "content": f"[{path}] Llegas a {rng.choice(places)}. " + " ".join(
+                rng.choice(["El viento sopla.", "Algo se mueve.", "Escuchas pasos.", "Una luz parpadea."])
+                for _ in range(rng.randint(2, 6))
+            ),
+            "isEnding": is_ending,
+            "isWinningEnding": is_ending and (winning_path or rng.random() < 0.25),
+            "options": None
+        }
+        if not is_ending:
+            node["options"] = [
+                {
+                    "text": f"{rng.choice(actions)} ({path}.{i})",
+                    "next_node": build_node(level + 1, f"{path}.{i}", winning_path and i == 0)
+                }
+                for i in range(branching)
+            ]
+        return node
+
+    return {"title": f"Aventura {rng.randint(1, 9999)}", "rootNode": build_node(1, "0", True)}
+
+
+# Cómo reconoce el proveedor "fake" los prompts del modo "fanout": las instrucciones
+# de formato del esquema incluyen "synopsis" y el mensaje de cada rama la opción elegida
+# Formas de respuesta que sabe construir el modelo falso; quien llama elige una
+# (ManagedLLM se la pasa solo al modelo falso, los reales siguen el prompt)
+FAKE_RESPONSE_SHAPES = ("story", "outline", "branch")
+
+
+class FakeStoryChatModel(BaseChatModel):
+    """
+    Modelo de chat local que devuelve historias JSON deterministas.
+    Simula la latencia configurada y soporta invoke/ainvoke/stream.
+
+    Para pruebas de carga la latencia puede variar de forma uniforme en
+    `latency_ms ± latency_jitter_ms`, y la profundidad entre `depth` y
+    `depth + depth_jitter` (elegida a partir del prompt, así que sigue
+    siendo determinista). Con `latency_per_token_ms` la latencia crece con la
+    respuesta, como en un LLM real que emite los tokens en secuencia.
+    """
+
+    latency_ms: int = 0
+    latency_jitter_ms: int = 0
+    latency_per_token_ms: float = 0
+    depth: int = 3
+    depth_jitter: int = 0
+    branching: int = 2
+    chunk_size: int = 64  # Caracteres por fragmento en modo streaming
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-story"
+
+    def _latency_seconds(self, text: str) -> float:
+        latency_ms = self.latency_ms + self.latency_per_token_ms * estimate_tokens(text)
+        if self.latency_jitter_ms:
+            latency_ms += random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+        return max(0.0, latency_ms) / 1000
+
+    def _story_json(self, messages: List[BaseMessage], shape: str = "story") -> str:
+        if shape not in FAKE_RESPONSE_SHAPES:
+            raise ValueError(f"Forma de respuesta desconocida: {shape}")
+        seed_text = str(messages[-1].content) if messages else ""
+        depth = self.depth
+        if self.depth_jitter:
+            depth += random.Random(seed_text).randint(0, self.depth_jitter)
+
+        # Modo "fanout": el esquema es solo la raíz y sus opciones, y cada rama
+        # tiene un nivel menos, como la historia completa que se reparte
+        if shape == "outline":
+            story = build_fake_story(seed_text, 2, self.branching)
+            story["synopsis"] = story["rootNode"]["content"]
+            story["rootNode"]["options"] = [
+                {"text": option["text"], "summary": option["next_node"]["content"], "canWin": i == 0}
+                for i, option in enumerate(story["rootNode"]["options"])
+            ]
+            return json.dumps(story, ensure_ascii=False)
+        if shape == "branch":
+            depth = max(1, depth - 1)
+        return json.dumps(build_fake_story(seed_text, depth, self.branching), ensure_ascii=False)
+
+    def _result(self, messages: List[BaseMessage], text: str) -> ChatResult:
+        input_tokens = estimate_tokens("".join(str(m.content) for m in messages))
+        output_tokens = estimate_tokens(text)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._story_json(messages, kwargs.get("shape", "story"))
+        latency = self._latency_seconds(text)
+        if latency:
+            time.sleep(latency)
+        return self._result(messages, text)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._story_json(messages, kwargs.get("shape", "story"))
+        latency = self._latency_seconds(text)
+        if latency:
+            await asyncio.sleep(latency)
+        return self._result(messages, text)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text = self._story_json(messages, kwargs.get("shape", "story"))
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        # La latencia total se reparte entre los fragmentos
+        delay = self._latency_seconds(text) / max(1, len(chunks))
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+
+class ManagedLLM:
+    """
+    Envoltorio de un modelo de chat que aplica el presupuesto compartido
+    antes de cada llamada y descuenta los tokens de salida al terminar.
+    """
+
+    def __init__(self, model: BaseChatModel, limiter: RateLimiter):
+        self.model = model
+        self.limiter = limiter
+
+    @staticmethod
+    def _prompt_tokens(prompt) -> int:
+        return estimate_tokens(prompt.to_string() if hasattr(prompt, "to_string") else str(prompt))
+
+    def _count_tokens(self, input_tokens: int, output_tokens: int):
+        model = self.model._llm_type
+        LLM_TOKENS.inc(input_tokens, model=model, direction="input")
+        LLM_TOKENS.inc(output_tokens, model=model, direction="output")
+
+    def _record(self, response, prompt_tokens: int):
+        usage = getattr(response, "usage_metadata", None) or {}
+        output_tokens = usage.get("output_tokens") or estimate_tokens(str(getattr(response, "content", "")))
+        self.limiter.consume(output_tokens)
+        self._count_tokens(usage.get("input_tokens") or prompt_tokens, output_tokens)
+
+    def _model_kwargs(self, shape: str) -> Dict[str, Any]:
+        """`shape` ("story", "outline" o "branch") solo lo usa el modelo falso."""
+        return {"shape": shape} if isinstance(self.model, FakeStoryChatModel) else {}
+
+    def invoke(self, prompt, shape: str = "story"):
+        prompt_tokens = self._prompt_tokens(prompt)
+        self.limiter.acquire(prompt_tokens)
+        response = self.model.invoke(prompt, **self._model_kwargs(shape))
+        self._record(response, prompt_tokens)
+        return response
+
+    async def ainvoke(self, prompt, shape: str = "story"):
+        prompt_tokens = self._prompt_tokens(prompt)
+        await self.limiter.acquire_async(prompt_tokens)
+        response = await self.model.ainvoke(prompt, **self._model_kwargs(shape))
+        self._record(response, prompt_tokens)
+        return response
+
+    def stream(self, prompt, shape: str = "story"):
+        prompt_tokens = self._prompt_tokens(prompt)
+        self.limiter.acquire(prompt_tokens)
+        output_chars = 0
+        for chunk in self.model.stream(prompt, **self._model_kwargs(shape)):
+            output_chars += len(str(chunk.content))
+            yield chunk
+        output_tokens = max(1, output_chars // 4)
+        self.limiter.consume(output_tokens)
+        self._count_tokens(prompt_tokens, output_tokens)
+
+
+def _create_chat_model(provider: str, model: str, temperature: float) -> BaseChatModel:
+    """Crea el cliente de LangChain del proveedor indicado."""
+    if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model=model, google_api_key=settings.GEMINI_API_KEY, temperature=temperature)
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model=model, api_key=settings.OPENAI_API_KEY, temperature=temperature)
+    if provider == "fake":
+        return FakeStoryChatModel(
+            latency_ms=settings.FAKE_LLM_LATENCY_MS,
+            latency_jitter_ms=settings.FAKE_LLM_LATENCY_JITTER_MS,
+            latency_per_token_ms=settings.FAKE_LLM_LATENCY_PER_TOKEN_MS,
+            depth=settings.FAKE_LLM_DEPTH,
+            depth_jitter=settings.FAKE_LLM_DEPTH_JITTER,
+            branching=settings.FAKE_LLM_BRANCHING
+        )
+    raise ValueError(f"Proveedor de LLM desconocido: '{provider}'")
+
+
+class LLMProviderRegistry:
+    """
+    Mantiene un cliente por (proveedor, modelo, temperatura) y un único
+    limitador compartido por todas las llamadas del proceso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str, float], ManagedLLM] = {}
+        self.limiter = RateLimiter(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+
+    def get(self, provider: Optional[str] = None, model: Optional[str] = None, temperature: Optional[float] = None) -> ManagedLLM:
+        """Devuelve el cliente reutilizable del proveedor (por defecto el configurado)."""
+        provider = provider or settings.LLM_PROVIDER
+        model = model or settings.LLM_MODEL or DEFAULT_MODELS.get(provider, "")
+        temperature = settings.LLM_TEMPERATURE if temperature is None else temperature
+        key = (provider, model, temperature)
+
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = ManagedLLM(_create_chat_model(provider, model, temperature), self.limiter)
+            return self._clients[key]
+
+
+# Registro global compartido por todos los generadores del proceso
+llm_registry = LLMProviderRegistry()
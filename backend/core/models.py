@@ -5,11 +5,12 @@ cuando genera una historia interactiva.
 """
 
 # Imports de typing para definir tipos complejos
-from typing import List, Dict, Any, Optional
+from typing import List, Optional
 
 # Imports de Pydantic para validación de datos
 from pydantic import BaseModel  # Clase base para crear modelos de datos
 from pydantic import Field  # Para agregar metadatos y validaciones a los campos
+from pydantic import AliasChoices  # Nombres alternativos aceptados al validar
 
 
 class StoryOptionLLM(BaseModel):
@@ -21,7 +22,12 @@ class StoryOptionLLM(BaseModel):
     o un nodo final).
     """
     text: str = Field(description="the text of the option shown to the user")
-    next_node: Dict[str, Any] = Field(description="the next node and its options")
+    # Esquema recursivo: el árbol completo se valida en una sola pasada.
+    # Se acepta también "nextNode" (la forma que suelen usar los LLM y el ejemplo del prompt)
+    next_node: "StoryNodeLLM" = Field(
+        description="the next node and its options",
+        validation_alias=AliasChoices("next_node", "nextNode")
+    )
 
 
 class StoryNodeLLM(BaseModel):
@@ -38,7 +44,11 @@ class StoryNodeLLM(BaseModel):
     content: str = Field(description="The main content of the story node")
     isEnding: bool = Field(description="Whether this node is an ending node")
     isWinningEnding: bool = Field(description="Whether this node is a winning ending node")
-    options: Optional[List[StoryOptionLLM]] = Field(default=None, description="The options for this node")   
+    options: Optional[List[StoryOptionLLM]] = Field(default=None, description="The options for this node")
+
+
+# Resuelve la referencia adelantada de StoryOptionLLM.next_node
+StoryOptionLLM.model_rebuild()
 
 
 class StoryLLMResponse(BaseModel):
@@ -53,4 +63,32 @@ class StoryLLMResponse(BaseModel):
     se encarga de validar que la respuesta sea correcta y convertirla a objetos Python.
     """
     title: str = Field(description="The title of the story")
-    rootNode: StoryNodeLLM = Field(description="The root node of the story")
\ No newline at end of file
+    rootNode: StoryNodeLLM = Field(description="The root node of the story")
+
+class StoryOutlineOptionLLM(BaseModel):
+    """
+    Opción de primer nivel en el esquema del modo "fanout".
+
+    El resumen anticipa adónde lleva la rama: cada rama se genera en una
+    llamada aparte y los resúmenes de sus hermanas mantienen la historia coherente.
+    """
+    text: str = Field(description="the text of the option shown to the user")
+    summary: str = Field(default="", description="one or two sentences about where this branch leads")
+    canWin: bool = Field(default=True, description="whether this branch contains at least one winning ending")
+
+
+class StoryOutlineRootLLM(BaseModel):
+    """Nodo raíz del esquema: la situación inicial y sus opciones, sin los subárboles."""
+    content: str = Field(description="The main content of the story node")
+    options: List[StoryOutlineOptionLLM] = Field(description="The first-level options of the story")
+
+
+class StoryOutlineLLM(BaseModel):
+    """
+    Esquema de la historia en el modo "fanout": título, sinopsis compartida,
+    raíz y opciones de primer nivel. Cada opción se desarrolla después en su
+    propia llamada al LLM y el resultado se une en un StoryLLMResponse.
+    """
+    title: str = Field(description="The title of the story")
+    synopsis: str = Field(default="", description="Setting, main characters and tone shared by every branch")
+    rootNode: StoryOutlineRootLLM = Field(description="The root node of the story")
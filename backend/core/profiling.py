@@ -0,0 +1,307 @@
+"""
+Perfilado bajo demanda de endpoints y de la generación en segundo plano.
+
+Las métricas dicen qué está lento; un perfil dice qué funciones de Python.
+Con PROFILING_ENABLED se perfila:
+
+- una request concreta, enviando `X-Profile: 1` (o el modo, "cprofile" o
+  "sampling") junto con `X-Admin-Token: <ADMIN_TOKEN>`; la generación que esa
+  request lanza en segundo plano también se perfila;
+- una fracción PROFILING_SAMPLE_RATE de las requests y de las generaciones.
+
+Modos:
+- "cprofile": determinista (cada llamada), se descarga como .pstats
+  (`python -m pstats archivo`, snakeviz, etc.).
+- "sampling": un thread toma la pila del thread perfilado cada
+  PROFILING_SAMPLE_INTERVAL_MS; sobrecarga casi nula y se descarga como perfil
+  de speedscope (https://www.speedscope.app).
+
+Los perfiles se guardan en un buffer circular en memoria de PROFILING_BUFFER_SIZE
+entradas y se descargan desde `/admin/profiles` (ver routers/admin.py).
+
+Con PROFILING_ENABLED=false no se envuelve nada: `ProfiledRoute` y
+`profiled_task` devuelven los endpoints y funciones originales.
+"""
+
+import asyncio
+import cProfile
+import contextvars
+import functools
+import hmac
+import itertools
+import json
+import marshal
+import random
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+from core.config import settings  # Configuración de la aplicación
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+# Formato de descarga de cada modo
+PROFILE_FORMATS = {"cprofile": "pstats", "sampling": "speedscope"}
+
+# (modo, disparador) de la request en curso (None = no perfilar); lo heredan sus tareas en segundo plano
+_requested_profile: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("requested_profile", default=None)
+
+
+@dataclass
+class ProfileRecord:
+    """Un perfil capturado."""
+    id: int
+    name: str
+    mode: str
+    trigger: str  # "header" o "sampled"
+    started_at: datetime
+    duration_ms: float
+    data: bytes = field(repr=False)
+
+    @property
+    def format(self) -> str:
+        return PROFILE_FORMATS[self.mode]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "mode": self.mode,
+            "format": self.format,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "bytes": len(self.data),
+        }
+
+
+class ProfileStore:
+    """Buffer circular de perfiles (los más viejos se descartan)."""
+
+    def __init__(self, max_profiles: int):
+        self._lock = threading.Lock()
+        self._profiles: deque = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+
+    def add(self, name: str, mode: str, trigger: str, started_at: datetime, duration_ms: float, data: bytes) -> ProfileRecord:
+        with self._lock:
+            record = ProfileRecord(next(self._ids), name, mode, trigger, started_at, duration_ms, data)
+            self._profiles.append(record)
+            return record
+
+    def list(self) -> List[ProfileRecord]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> Optional[ProfileRecord]:
+        with self._lock:
+            return next((record for record in self._profiles if record.id == profile_id), None)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._profiles)
+            self._profiles.clear()
+            return count
+
+
+profile_store = ProfileStore(settings.PROFILING_BUFFER_SIZE)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Compara el token de administración en tiempo constante (sin ADMIN_TOKEN no hay administración)."""
+    return bool(settings.ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+def _requested_by_headers(request: Request) -> Optional[str]:
+    """Modo pedido por la cabecera X-Profile (solo con un X-Admin-Token válido)."""
+    value = request.headers.get("x-profile")
+    if not value or not is_admin(request.headers.get("x-admin-token")):
+        return None
+    return value if value in PROFILE_MODES else settings.PROFILING_MODE
+
+
+def _sampled_mode() -> Optional[str]:
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate > 0 and random.random() < rate:
+        return settings.PROFILING_MODE
+    return None
+
+
+class _StackSampler:
+    """Toma la pila de un thread a intervalos fijos desde un thread aparte."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: List[Tuple[Tuple[str, str, int], ...]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_frame_files = {__file__}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename not in own_frame_files:
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples.append(tuple(reversed(stack)))
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _speedscope(name: str, samples: List[Tuple[Tuple[str, str, int], ...]], interval_ms: float, duration_ms: float) -> bytes:
+    """Perfil muestreado en el formato de archivo de speedscope."""
+    frames: List[Dict[str, Any]] = []
+    frame_index: Dict[Tuple[str, str, int], int] = {}
+    encoded = []
+    for stack in samples:
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            indices.append(frame_index[frame])
+        encoded.append(indices)
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "crea-tu-propia-aventura",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": duration_ms,
+            "samples": encoded,
+            "weights": [interval_ms] * len(encoded),
+        }],
+    }
+    return json.dumps(document).encode("utf-8")
+
+
+class _Capture:
+    """Perfil en curso de una llamada (en el thread actual)."""
+
+    def __init__(self, name: str, mode: str, trigger: str):
+        self.name = name
+        self.mode = mode
+        self.trigger = trigger
+
+    def __enter__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = _StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+            self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.mode == "cprofile":
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        if self.mode == "cprofile":
+            self.profiler.create_stats()
+            data = marshal.dumps(self.profiler.stats)  # Mismo contenido que pstats.Stats.dump_stats
+        else:
+            data = _speedscope(self.name, self.sampler.samples, settings.PROFILING_SAMPLE_INTERVAL_MS, duration_ms)
+        profile_store.add(self.name, self.mode, self.trigger, self.started_at, duration_ms, data)
+
+
+def _wrap(function: Callable, name: str, decide: Callable[[], Tuple[Optional[str], str]]) -> Callable:
+    """Envuelve una función sync o async para perfilarla cuando `decide` devuelve un modo."""
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            mode, trigger = decide()
+            if mode is None:
+                return await function(*args, **kwargs)
+            # En el event loop el perfil incluye otras corrutinas que se intercalen
+            with _Capture(name, mode, trigger):
+                return await function(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        mode, trigger = decide()
+        if mode is None:
+            return function(*args, **kwargs)
+        with _Capture(name, mode, trigger):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def _decide_for_request() -> Tuple[Optional[str], str]:
+    return _requested_profile.get() or (None, "")
+
+
+def _decide_for_task() -> Tuple[Optional[str], str]:
+    return _requested_profile.get() or (_sampled_mode(), "sampled")
+
+
+def profiled_task(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorador para tareas en segundo plano (p. ej. `generate_story_task`).
+    Se perfilan si la request que las lanzó pidió perfil o por muestreo.
+    """
+    def decorator(function: Callable) -> Callable:
+        if not settings.PROFILING_ENABLED:
+            return function
+        return _wrap(function, name, _decide_for_task)
+    return decorator
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Clase de ruta que permite perfilar el endpoint (se usa como `route_class`
+    del router). Perfila la función del endpoint en el thread donde corre, así
+    que con los endpoints sync el perfil es el del thread del threadpool.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if settings.PROFILING_ENABLED:
+            methods = ",".join(sorted(kwargs.get("methods") or []))
+            endpoint = _wrap(endpoint, f"{methods} {path}".strip(), _decide_for_request)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not settings.PROFILING_ENABLED:
+            return handler
+
+        async def profiling_handler(request: Request):
+            requested = None
+            mode = _requested_by_headers(request)
+            if mode is not None:
+                requested = (mode, "header")
+            else:
+                mode = _sampled_mode()
+                if mode is not None:
+                    requested = (mode, "sampled")
+            # No se restablece: las tareas en segundo plano de esta request corren
+            # después de la respuesta en el mismo contexto y heredan el modo
+            _requested_profile.set(requested)
+            return await handler(request)
+
+        return profiling_handler
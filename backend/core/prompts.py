@@ -3,6 +3,10 @@ Prompts para el modelo de lenguaje (LLM).
 Define las instrucciones que se envían a OpenAI para generar historias interactivas.
 """
 
+# Versión de los prompts: se incluye en la clave de la caché de historias,
+# así que debe incrementarse al cambiar el contenido de los prompts
+PROMPT_VERSION = "2"
+
 # Prompt principal que se envía al LLM para generar una historia completa
 STORY_PROMPT = """
                 You are a creative story writer that creates engaging choose-your-own-adventure stories.
@@ -29,6 +33,111 @@ STORY_PROMPT = """
                 Don't add any text outside of the JSON structure.
                 """
 
+# Modo "incremental" (ver core/story_expansion.py): la primera llamada genera solo
+# los primeros niveles; los nodos del último nivel que no son finales quedan sin
+# opciones y se continúan cuando el jugador se acerca
+INCREMENTAL_STORY_PROMPT = """
+                You are a creative story writer that creates engaging choose-your-own-adventure stories.
+                Generate the beginning of a branching story in the JSON format I'll specify.
+                The story will be continued later from the nodes you leave open, so it can grow much deeper.
+
+                The story should have:
+                1. A compelling title
+                2. A starting situation (root node) with 2-3 options
+                3. Exactly {levels} levels (including the root node)
+
+                Story structure requirements:
+                - Each node should have 2-3 options except for ending nodes and nodes in the last level
+                - Nodes in the last level that are not endings must have an empty options list: they will be continued later
+                - Some early paths may already end (winning or losing), but most should stay open
+                - You must adapt all content to the user's login language.
+
+                Output your story in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+# Continuación de un nodo de la frontera; el contexto es el camino desde la raíz
+EXPAND_NODE_PROMPT = """
+                You are a creative story writer continuing an existing choose-your-own-adventure story.
+                You receive the path the player followed so far and the current scene.
+                Continue the story from the current scene in the JSON format I'll specify.
+
+                Requirements:
+                - Use the title of the existing story as "title"
+                - "rootNode" is the current scene: repeat its content and add its options (2-3)
+                - Generate exactly {levels} levels below the current scene
+                - {ending_instruction}
+                - Keep the characters, tone and language of the path so far
+
+                Output the continuation in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+# Instrucciones sobre los finales según lo que le queda a la historia
+EXPAND_CONTINUE_INSTRUCTION = (
+    "Some paths may end (winning or losing); nodes in the last level that are not endings "
+    "must have an empty options list: they will be continued later"
+)
+EXPAND_FINISH_INSTRUCTION = (
+    "This is the end of the story: every node in the last level must be an ending, "
+    "and at least one path must lead to a winning ending"
+)
+
+# Modo "fanout": primero un esquema (título, sinopsis, raíz y opciones de primer
+# nivel con un resumen) y después cada rama en una llamada aparte y en paralelo.
+# El esquema compartido mantiene coherentes a las ramas hermanas
+FANOUT_OUTLINE_PROMPT = """
+                You are a creative story writer that creates engaging choose-your-own-adventure stories.
+                Plan the beginning of a branching story in the JSON format I'll specify.
+                Each first-level option will be written later by another writer who only sees this plan.
+
+                The plan should have:
+                1. A compelling title
+                2. A synopsis with the setting, the main characters and the tone shared by every branch
+                3. A starting situation (root node) with 2-3 options
+                4. For each option, a one or two sentence summary of where it leads
+                5. At least one option that can lead to a winning ending (canWin)
+
+                - You must adapt all content to the user's login language.
+
+                Output your plan in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+# Desarrollo de una rama de primer nivel a partir del esquema
+FANOUT_BRANCH_PROMPT = """
+                You are a creative story writer developing one branch of a choose-your-own-adventure story.
+                You receive the plan of the story and the option the player chose in the starting situation.
+                Write the part of the story that follows that option in the JSON format I'll specify.
+
+                Requirements:
+                - Use the title of the story as "title"
+                - "rootNode" is the scene the chosen option leads to (not the starting situation)
+                - The branch should be {levels} levels deep (including its first scene)
+                - Each node should have 2-3 options except for ending nodes
+                - {ending_instruction}
+                - Stay consistent with the synopsis and don't repeat what the other options lead to
+                - Keep the characters, tone and language of the plan
+
+                Output the branch in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+# Instrucciones sobre los finales de la rama según el esquema
+FANOUT_WINNING_INSTRUCTION = (
+    "Add variety in the path lengths; endings may be winning or losing, "
+    "and at least one path must lead to a winning ending"
+)
+FANOUT_LOSING_INSTRUCTION = "Add variety in the path lengths; every ending in this branch is a losing ending"
+
 # Ejemplo de la estructura JSON esperada (solo para referencia, no se usa directamente)
 # El parser de Pydantic genera las instrucciones de formato automáticamente
 json_structure = """
@@ -0,0 +1,181 @@
+"""
+Caché de respuestas serializadas de historias completas.
+
+Una historia terminada no cambia, así que el JSON de `GET /story/{id}/complete`
+se guarda ya serializado (bytes) junto con un ETag fuerte y sus variantes
+comprimidas y msgpack (core/response_encoding.py), calculadas una sola vez:
+- Nivel en memoria: LRU acotado por bytes totales.
+- Nivel en disco opcional (`STORY_RESPONSE_CACHE_DIR`), compartido entre
+  procesos y que sobrevive a reinicios.
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from core.config import settings  # Configuración de la aplicación
+from core.response_encoding import IDENTITY, VARIANT_KEYS, Variant, make_etag, precompute_variants, variant_etag  # Variantes de cada respuesta
+
+# Cabecera para respuestas que nunca cambian (un año, sin revalidación)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Prefijo de los archivos en disco; cambia cuando cambia el formato de la
+# respuesta (v2: sin session_id) para no servir cuerpos viejos
+DISK_FILE_PREFIX = "story-v2"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes  # JSON sin comprimir
+    etag: str
+    variants: Dict[str, bytes] = field(default_factory=dict)  # Por `Variant.key`, incluida "json"
+
+    @property
+    def size(self) -> int:
+        """Bytes que ocupa en memoria (todas las variantes)."""
+        return sum(len(body) for body in self.variants.values()) or len(self.body)
+
+    def select(self, variant: Variant) -> Tuple[Variant, bytes, str]:
+        """
+        Devuelve la variante pedida o la más cercana que exista (sin comprimir
+        si no llegó al umbral, JSON si msgpack está desactivado), con su ETag.
+        """
+        for candidate in (variant, Variant(variant.media), IDENTITY):
+            body = self.variants.get(candidate.key)
+            if body is not None:
+                return candidate, body, variant_etag(self.etag, candidate)
+        return IDENTITY, self.body, self.etag
+
+
+def build_cached_response(body: bytes, variants: Optional[Dict[str, bytes]] = None) -> CachedResponse:
+    """
+    Entrada de la caché con sus variantes. Si no se reciben (o solo está el
+    JSON, p. ej. un archivo de disco anterior a las variantes) se calculan.
+    """
+    if not variants or len(variants) == 1:
+        variants = precompute_variants(body)
+    return CachedResponse(body=body, etag=make_etag(body), variants={**variants, "json": body})
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evalúa la cabecera If-None-Match (admite listas, '*' y ETags débiles)."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+class StoryResponseCache:
+    """LRU en memoria acotado por bytes, con nivel opcional en disco."""
+
+    def __init__(self, max_bytes: int, disk_dir: str = ""):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        self._size = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, story_id: int, key: str = "json") -> str:
+        # "story-v2-{id}.json" es el JSON; las variantes van en "story-v2-{id}.json.gzip", "story-v2-{id}.msgpack.br"...
+        return os.path.join(self.disk_dir, f"{DISK_FILE_PREFIX}-{story_id}.{key}")
+
+    def _read_disk_variants(self, story_id: int) -> Dict[str, bytes]:
+        """
+        Variantes guardadas en disco por este u otro proceso (las que falten se recalculan).
+        Se abren por nombre: no se lista el directorio, que crece con cada historia.
+        """
+        variants = {}
+        for key in VARIANT_KEYS:
+            try:
+                with open(self._disk_path(story_id, key), "rb") as f:
+                    variants[key] = f.read()
+            except FileNotFoundError:
+                if key == "json":
+                    # Sin el JSON (se escribe último) la historia no está en disco
+                    return {}
+        return variants
+
+    def _write_disk(self, story_id: int, key: str, body: bytes):
+        # Escritura atómica: otros procesos nunca leen un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, self._disk_path(story_id, key))
+
+    def _remember(self, story_id: int, entry: CachedResponse):
+        """Guarda en memoria y desaloja las entradas menos usadas (con el lock tomado)."""
+        if entry.size > self.max_bytes:
+            return
+        previous = self._entries.pop(story_id, None)
+        if previous is not None:
+            self._size -= previous.size
+        self._entries[story_id] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    def get(self, story_id: int) -> Optional[CachedResponse]:
+        """Busca la respuesta en memoria y luego en disco."""
+        with self._lock:
+            entry = self._entries.get(story_id)
+            if entry is not None:
+                self._entries.move_to_end(story_id)
+                return entry
+
+        if not self.disk_dir:
+            return None
+        variants = self._read_disk_variants(story_id)
+        body = variants.get("json")
+        if body is None:
+            return None
+
+        entry = build_cached_response(body, variants)
+        with self._lock:
+            self._remember(story_id, entry)
+        return entry
+
+    def put(self, story_id: int, body: bytes) -> CachedResponse:
+        """
+        Guarda la respuesta serializada de una historia terminada y sus variantes.
+        La compresión se paga aquí una vez (normalmente al terminar el job), no en cada request.
+        """
+        entry = build_cached_response(body)
+        with self._lock:
+            self._remember(story_id, entry)
+
+        if self.disk_dir:
+            # El JSON va último: un lector que lo encuentra ya tiene las variantes
+            for key, variant_body in entry.variants.items():
+                if key != "json":
+                    self._write_disk(story_id, key, variant_body)
+            self._write_disk(story_id, "json", body)
+        return entry
+
+    def invalidate(self, story_id: int):
+        """Elimina la respuesta de ambos niveles (p. ej. si la historia se borra o se modifica)."""
+        with self._lock:
+            entry = self._entries.pop(story_id, None)
+            if entry is not None:
+                self._size -= entry.size
+        if self.disk_dir:
+            # El JSON primero (VARIANT_KEYS empieza por él): sin él las variantes que queden no se sirven
+            for key in VARIANT_KEYS:
+                try:
+                    os.remove(self._disk_path(story_id, key))
+                except FileNotFoundError:
+                    pass
+
+
+# Instancia global del proceso
+story_response_cache = StoryResponseCache(
+    max_bytes=settings.STORY_RESPONSE_CACHE_MAX_BYTES,
+    disk_dir=settings.STORY_RESPONSE_CACHE_DIR
+)
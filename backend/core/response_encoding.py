@@ -0,0 +1,238 @@
+"""
+Negociación de contenido de las respuestas de historias y jobs.
+
+Cada respuesta se sirve en la representación que pide el cliente:
+- Formato (`Accept`): JSON o msgpack (`application/msgpack` o
+  `application/x-msgpack`; requiere RESPONSE_MSGPACK_ENABLED y `msgpack`).
+- Compresión (`Accept-Encoding`): brotli (requiere `brotli`) o gzip, solo si
+  el cuerpo tiene al menos RESPONSE_COMPRESSION_MIN_BYTES.
+
+Cada combinación es una representación distinta, con su propio ETag, y las
+respuestas llevan `Vary: Accept, Accept-Encoding` para que los proxies no
+mezclen variantes. El JSON sale de Pydantic (`model_dump_json`, en Rust) o de
+orjson para los dicts; msgpack se construye a partir de ese JSON.
+
+Las historias terminadas no pagan la compresión por request: sus variantes se
+calculan una vez al guardarlas en la caché de respuestas (core/response_cache.py),
+con el nivel de compresión máximo.
+"""
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request, Response  # Petición entrante y respuesta cruda
+from pydantic import BaseModel  # Esquemas de respuesta
+
+from core.config import settings  # Umbral y niveles de compresión
+
+try:
+    import orjson
+except ImportError:  # orjson viene con fastapi[all]
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Opcional: sin msgpack se responde siempre JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli se usa gzip
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+VARY = "Accept, Accept-Encoding"
+
+# Las variantes precalculadas se comprimen una sola vez: vale la pena el nivel máximo
+PRECOMPUTED_GZIP_LEVEL = 9
+PRECOMPUTED_BROTLI_QUALITY = 11
+
+
+@dataclass(frozen=True)
+class Variant:
+    """Una representación de la respuesta: formato ("json" o "msgpack") y compresión."""
+    media: str = "json"
+    encoding: str = "identity"
+
+    @property
+    def key(self) -> str:
+        """Nombre de la variante, p. ej. "json" o "msgpack.br"."""
+        return self.media if self.encoding == "identity" else f"{self.media}.{self.encoding}"
+
+    @property
+    def media_type(self) -> str:
+        return MSGPACK_MEDIA_TYPE if self.media == "msgpack" else JSON_MEDIA_TYPE
+
+
+IDENTITY = Variant()
+
+# Todas las variantes que puede guardar algún proceso (con o sin msgpack y brotli), el JSON primero
+VARIANT_KEYS = tuple(
+    Variant(media, encoding).key for media in ("json", "msgpack") for encoding in ("identity", "br", "gzip")
+)
+
+
+def msgpack_enabled() -> bool:
+    return settings.RESPONSE_MSGPACK_ENABLED and msgpack is not None
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Compresiones que este proceso puede producir, de la preferida a la menos preferida."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _quality_values(header: Optional[str]) -> Dict[str, float]:
+    """Convierte una cabecera Accept o Accept-Encoding en {valor: q}."""
+    values = {}
+    for part in (header or "").split(","):
+        value, _, params = part.strip().partition(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        values[value] = quality
+    return values
+
+
+def negotiate(accept: Optional[str], accept_encoding: Optional[str]) -> Variant:
+    """
+    Elige la variante a partir de las cabeceras de la petición.
+
+    msgpack solo se usa si el cliente lo pide explícitamente y no prefiere JSON;
+    entre compresiones con el mismo q gana brotli.
+    """
+    media = "json"
+    if msgpack_enabled():
+        types = _quality_values(accept)
+        msgpack_quality = max(types.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+        if msgpack_quality > 0 and msgpack_quality >= types.get(JSON_MEDIA_TYPE, 0.0):
+            media = "msgpack"
+
+    codings = _quality_values(accept_encoding)
+    wildcard = codings.get("*", 0.0)
+    encoding, best = "identity", 0.0
+    for candidate in available_encodings():
+        quality = codings.get(candidate, wildcard)
+        if quality > best:
+            encoding, best = candidate, quality
+    return Variant(media, encoding)
+
+
+def request_variant(request: Request) -> Variant:
+    """Variante que pide la petición."""
+    return negotiate(request.headers.get("accept"), request.headers.get("accept-encoding"))
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Serializa a JSON un esquema Pydantic (en Rust) o datos simples (con orjson si está)."""
+    if isinstance(payload, BaseModel):
+        return payload.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_to_msgpack(body: bytes) -> bytes:
+    """Convierte un cuerpo JSON en msgpack."""
+    data = orjson.loads(body) if orjson is not None else json.loads(body)
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def compress(body: bytes, encoding: str, precomputed: bool = False) -> bytes:
+    """Comprime con gzip o brotli (con el nivel máximo si la variante se precalcula)."""
+    if encoding == "gzip":
+        # mtime=0: la misma entrada da los mismos bytes (y el mismo ETag) en cada proceso
+        level = PRECOMPUTED_GZIP_LEVEL if precomputed else settings.RESPONSE_GZIP_LEVEL
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == "br":
+        quality = PRECOMPUTED_BROTLI_QUALITY if precomputed else settings.RESPONSE_BROTLI_QUALITY
+        return brotli.compress(body, quality=quality)
+    raise ValueError(f"Compresión desconocida: {encoding}")
+
+
+def encode_variant(json_body: bytes, variant: Variant, precomputed: bool = False) -> Tuple[Variant, bytes]:
+    """
+    Construye una variante a partir del JSON.
+
+    Returns:
+        La variante efectiva (sin compresión si el cuerpo no llega al umbral) y sus bytes.
+    """
+    body = json_body
+    if variant.media == "msgpack":
+        body = json_to_msgpack(json_body)
+    if variant.encoding == "identity" or len(body) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+        return Variant(variant.media), body
+    return variant, compress(body, variant.encoding, precomputed)
+
+
+def precompute_variants(json_body: bytes) -> Dict[str, bytes]:
+    """
+    Todas las variantes que este proceso puede servir, por `Variant.key`.
+    Las compresiones que no llegan al umbral no se guardan.
+    """
+    variants = {"json": json_body}
+    if msgpack_enabled():
+        variants["msgpack"] = json_to_msgpack(json_body)
+    for media, body in list(variants.items()):
+        if len(body) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            continue
+        for encoding in available_encodings():
+            variants[Variant(media, encoding).key] = compress(body, encoding, precomputed=True)
+    return variants
+
+
+def make_etag(body: bytes) -> str:
+    """ETag fuerte derivado del contenido."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def variant_etag(etag: str, variant: Variant) -> str:
+    """ETag de una variante: el del JSON sin comprimir con el nombre de la variante."""
+    if variant == IDENTITY:
+        return etag
+    return f'{etag[:-1]}-{variant.key}"'
+
+
+def variant_headers(variant: Variant, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Cabeceras de una respuesta en la variante indicada (más las recibidas)."""
+    result = {"Vary": VARY, **(headers or {})}
+    if variant.encoding != "identity":
+        result["Content-Encoding"] = variant.encoding
+    return result
+
+
+def encoded_response(
+    request: Request,
+    payload: Any,
+    headers: Optional[Dict[str, str]] = None,
+    status_code: int = 200,
+    etag: bool = False
+) -> Response:
+    """
+    Respuesta en la variante que pide el cliente, codificada en el momento.
+
+    Args:
+        request: Petición (cabeceras Accept y Accept-Encoding).
+        payload: Esquema Pydantic, datos simples o un cuerpo JSON ya serializado (bytes).
+        headers: Cabeceras adicionales.
+        status_code: Código de la respuesta.
+        etag: Si se agrega el ETag de la variante.
+    """
+    json_body = payload if isinstance(payload, bytes) else dumps_json(payload)
+    variant, body = encode_variant(json_body, request_variant(request))
+    headers = variant_headers(variant, headers)
+    if etag:
+        headers["ETag"] = variant_etag(make_etag(json_body), variant)
+    return Response(content=body, status_code=status_code, media_type=variant.media_type, headers=headers)
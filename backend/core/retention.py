@@ -0,0 +1,259 @@
+"""
+Retención de `story_jobs` y limpieza de historias huérfanas.
+
+`story_jobs` crece una fila por cada petición de historia, y las generaciones
+que fallan a mitad (streaming, caídas del proceso) pueden dejar `stories` y
+`story_nodes` a medio guardar. Una pasada de retención:
+
+1. Borra los jobs vencidos según su estado (JOB_RETENTION_*_DAYS), por lotes
+   de RETENTION_BATCH_SIZE filas en transacciones cortas. Antes de borrarlos
+   los copia al archivo frío si RETENTION_ARCHIVE es "table" (tabla
+   `story_jobs_archive`) o "ndjson" (una línea JSON por job en
+   RETENTION_ARCHIVE_PATH; el archivo se escribe antes del commit, así que una
+   caída puede repetir líneas pero nunca perderlas).
+2. Borra las historias huérfanas: sin ningún job completado o en curso que las
+   use, más viejas que STORY_ORPHAN_GRACE_HOURS y que además estén incompletas,
+   sin raíz o referenciadas solo por jobs con error. Las historias completas
+   cuyo job ya expiró se conservan; las del stock (`pool_key`) nunca se tocan.
+
+Cada lote vuelve a comprobar las condiciones en el DELETE, así que una fila
+que cambió de estado entre la selección y el borrado no se pierde.
+
+Uso (desde el directorio backend):
+    python -m scripts.retention [--dry-run]
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, delete, exists, func, insert, or_, select  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.config import settings  # Configuración de la aplicación
+from core.metrics import registry  # Métricas del proceso
+from core.response_cache import story_response_cache  # Respuestas serializadas a invalidar
+from core.story_cache import story_cache  # Historias reutilizables por tema
+from models.job import StoryJob, StoryJobArchive  # Modelos ORM de trabajos
+from models.story import Story, StoryNode  # Modelos ORM de historias
+
+logger = logging.getLogger(__name__)
+
+# Estados de un job que todavía no terminó
+STUCK_STATUSES = ("pending", "procesando", "parcial")
+
+# Un job en cualquiera de estos estados mantiene viva su historia
+STORY_KEEPING_STATUSES = ("completado",) + STUCK_STATUSES
+
+ROWS_RECLAIMED = registry.counter(
+    "retention_rows_deleted_total", "Filas borradas por la retención", ("table",)
+)
+JOBS_ARCHIVED = registry.counter(
+    "retention_jobs_archived_total", "Jobs copiados al archivo frío", ("archive",)
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def job_ttls() -> Dict[str, int]:
+    """Días de retención por estado según la configuración (0 = sin límite)."""
+    ttls = {
+        "completado": settings.JOB_RETENTION_COMPLETED_DAYS,
+        "error": settings.JOB_RETENTION_ERROR_DAYS,
+    }
+    for status in STUCK_STATUSES:
+        ttls[status] = settings.JOB_RETENTION_STUCK_DAYS
+    return {status: days for status, days in ttls.items() if days > 0}
+
+
+def _expired_jobs_condition(status: str, cutoff: datetime):
+    # created_at <= completed_at, así que el filtro por created_at es correcto y
+    # permite usar el índice (status, created_at); el coalesce afina el resultado
+    return and_(
+        StoryJob.status == status,
+        StoryJob.created_at < cutoff,
+        func.coalesce(StoryJob.completed_at, StoryJob.created_at) < cutoff,
+    )
+
+
+def _archive_record(job: StoryJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "job_id": job.job_id,
+        "session_id": job.session_id,
+        "theme": job.theme,
+        "language": job.language,
+        "status": job.status,
+        "story_id": job.story_id,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "completed_at": job.completed_at,
+    }
+
+
+def _append_ndjson(path: str, records: List[Dict[str, Any]]):
+    """Agrega los jobs al archivo NDJSON y lo sincroniza a disco antes de borrarlos."""
+    archived_at = _utcnow().isoformat()
+    with open(path, "a", encoding="utf-8") as archive:
+        for record in records:
+            line = {**record, "archived_at": archived_at}
+            archive.write(json.dumps(line, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        archive.flush()
+        os.fsync(archive.fileno())
+
+
+def purge_expired_jobs(db: Session, status: str, days: int, archive: str, batch_size: int, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Borra (y archiva) por lotes los jobs de un estado con más de `days` días.
+
+    Args:
+        db: Sesión de base de datos (se hace commit después de cada lote).
+        status: Estado de los jobs a purgar.
+        days: Antigüedad mínima en días.
+        archive: "none", "table" o "ndjson".
+        batch_size: Filas por lote.
+        dry_run: Solo cuenta las filas que se borrarían.
+
+    Returns:
+        Dict con jobs borrados y archivados.
+    """
+    condition = _expired_jobs_condition(status, _utcnow() - timedelta(days=days))
+    if dry_run:
+        count = db.scalar(select(func.count()).select_from(StoryJob).where(condition))
+        return {"deleted": count, "archived": count if archive != "none" else 0}
+
+    totals = {"deleted": 0, "archived": 0}
+    while True:
+        jobs = db.scalars(select(StoryJob).where(condition).order_by(StoryJob.id).limit(batch_size)).all()
+        if not jobs:
+            return totals
+
+        ids = [job.id for job in jobs]
+        records = [_archive_record(job) for job in jobs]
+        if archive == "table":
+            db.execute(insert(StoryJobArchive), records)
+        elif archive == "ndjson":
+            _append_ndjson(settings.RETENTION_ARCHIVE_PATH, records)
+        deleted = db.execute(
+            delete(StoryJob).where(StoryJob.id.in_(ids), condition).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+
+        totals["deleted"] += deleted
+        ROWS_RECLAIMED.inc(deleted, table="story_jobs")
+        if archive != "none":
+            totals["archived"] += len(records)
+            JOBS_ARCHIVED.inc(len(records), archive=archive)
+        if len(jobs) < batch_size:
+            return totals
+
+
+def _orphan_story_condition(cutoff: datetime):
+    keeping_job = exists().where(StoryJob.story_id == Story.id, StoryJob.status.in_(STORY_KEEPING_STATUSES))
+    failed_job = exists().where(StoryJob.story_id == Story.id, StoryJob.status == "error")
+    has_root = exists().where(StoryNode.story_id == Story.id, StoryNode.is_root)
+    return and_(
+        Story.pool_key.is_(None),
+        Story.created_at < cutoff,
+        ~keeping_job,
+        or_(
+            Story.is_complete.is_(False),
+            failed_job,
+            and_(Story.tree_blob.is_(None), ~has_root),
+        ),
+    )
+
+
+def purge_orphan_stories(db: Session, grace_hours: int, batch_size: int, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Borra por lotes las historias huérfanas y sus nodos.
+
+    Recorre las historias por ID (clave primaria) para que cada lote sea una
+    consulta por rango en vez de volver a evaluar la tabla completa.
+
+    Returns:
+        Dict con historias y nodos borrados.
+    """
+    condition = _orphan_story_condition(_utcnow() - timedelta(hours=grace_hours))
+    if dry_run:
+        story_ids = select(Story.id).where(condition)
+        return {
+            "stories": db.scalar(select(func.count()).select_from(story_ids.subquery())),
+            "story_nodes": db.scalar(
+                select(func.count()).select_from(StoryNode).where(StoryNode.story_id.in_(story_ids))
+            ),
+        }
+
+    totals = {"stories": 0, "story_nodes": 0}
+    last_id = 0
+    while True:
+        ids = db.scalars(
+            select(Story.id).where(Story.id > last_id, condition).order_by(Story.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return totals
+        last_id = ids[-1]
+
+        # Se vuelve a comprobar la condición por si alguna historia se completó o se asignó
+        ids = db.scalars(select(Story.id).where(Story.id.in_(ids), condition).with_for_update()).all()
+        nodes = db.execute(delete(StoryNode).where(StoryNode.story_id.in_(ids))).rowcount
+        stories = db.execute(delete(Story).where(Story.id.in_(ids))).rowcount
+        db.commit()
+
+        for story_id in ids:
+            story_response_cache.invalidate(story_id)
+            story_cache.discard_story(story_id)
+        totals["stories"] += stories
+        totals["story_nodes"] += nodes
+        ROWS_RECLAIMED.inc(stories, table="stories")
+        ROWS_RECLAIMED.inc(nodes, table="story_nodes")
+
+
+def run_retention(
+    db: Session,
+    archive: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    Ejecuta una pasada completa: jobs vencidos por estado y luego historias huérfanas
+    (los jobs con error recién borrados dejan de proteger sus historias).
+
+    Args:
+        db: Sesión de base de datos.
+        archive: Destino del archivo frío (por defecto RETENTION_ARCHIVE).
+        batch_size: Filas por lote (por defecto RETENTION_BATCH_SIZE).
+        dry_run: Solo cuenta lo que se borraría.
+
+    Returns:
+        Informe con las filas recuperadas por tabla y estado.
+    """
+    archive = archive or settings.RETENTION_ARCHIVE
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    if archive not in ("none", "table", "ndjson"):
+        raise ValueError(f"RETENTION_ARCHIVE desconocido: '{archive}'")
+
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"dry_run": dry_run, "archive": archive, "jobs": {}, "jobs_archived": 0}
+    for status, days in job_ttls().items():
+        result = purge_expired_jobs(db, status, days, archive, batch_size, dry_run)
+        report["jobs"][status] = result["deleted"]
+        report["jobs_archived"] += result["archived"]
+
+    report.update(purge_orphan_stories(db, settings.STORY_ORPHAN_GRACE_HOURS, batch_size, dry_run))
+    report["rows_reclaimed"] = sum(report["jobs"].values()) + report["stories"] + report["story_nodes"]
+    report["seconds"] = round(time.perf_counter() - started, 3)
+
+    logger.info(
+        "Retención%s: %d jobs %s, %d historias y %d nodos (%d filas) en %.2fs",
+        " (simulada)" if dry_run else "",
+        sum(report["jobs"].values()), report["jobs"], report["stories"], report["story_nodes"],
+        report["rows_reclaimed"], report["seconds"]
+    )
+    return report
@@ -0,0 +1,171 @@
+"""
+Análisis del grafo de una historia recién generada.
+
+Un solo recorrido desde la raíz calcula:
+- los nodos alcanzables (y los que no se alcanzan desde la raíz);
+- la profundidad máxima (la raíz es 0, como `story_nodes.depth`);
+- los finales ganadores y perdedores alcanzables;
+- el factor de ramificación (opciones por nodo alcanzable que no es final);
+- las opciones colgantes (sin `node_id` o con un `node_id` que no existe);
+- los nodos de la frontera que el modo "incremental" todavía no expandió.
+
+El resultado se guarda en columnas indexadas de `stories` (ver
+models/story.py), así que filtrar u ordenar historias por estos datos no
+necesita leer sus nodos. Las historias anteriores a la migración 0005 tienen
+las columnas en null hasta que `scripts/analyze_stories.py` las completa.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Mapping, Optional
+
+from sqlalchemy import select  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.story_blob import StoryBlob  # Historias guardadas como blob
+from models.story import Story, StoryNode  # Modelos ORM
+from schemas.story import StoryStatsSchema  # Estadísticas en las respuestas
+
+# Columnas de `stories` que guardan el análisis (mismos nombres que StoryStats)
+STATS_COLUMNS = (
+    "node_count", "unreachable_nodes", "max_depth", "winning_endings", "losing_endings",
+    "branching_factor", "dangling_options", "has_winning_path", "expandable_nodes"
+)
+
+
+@dataclass
+class StoryStats:
+    """Resultado del análisis de una historia."""
+    node_count: int
+    unreachable_nodes: int
+    max_depth: int
+    winning_endings: int
+    losing_endings: int
+    branching_factor: float
+    dangling_options: int
+    has_winning_path: bool
+    expandable_nodes: int
+
+
+def analyze_story_graph(nodes: Mapping[int, Mapping[str, Any]], root_id: Optional[int]) -> StoryStats:
+    """
+    Analiza el grafo de una historia en un solo recorrido desde la raíz.
+
+    Args:
+        nodes: Nodos por ID, con `is_ending`, `is_winning_ending` y `options`
+            ([{text, node_id}]), como las filas de `story_nodes` o los nodos del blob;
+            `is_expandable` es opcional.
+        root_id: ID del nodo raíz (None si la historia no tiene raíz).
+
+    Returns:
+        StoryStats: Estadísticas de la historia.
+    """
+    winning = losing = dangling = expandable = max_depth = 0
+    choices = choice_nodes = 0
+
+    seen = set()
+    stack = [(root_id, 0)] if root_id in nodes else []
+    while stack:
+        node_id, depth = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        node = nodes[node_id]
+        max_depth = max(max_depth, depth)
+
+        # Los finales no tienen opciones aunque se hayan guardado
+        if node["is_ending"]:
+            if node["is_winning_ending"]:
+                winning += 1
+            else:
+                losing += 1
+            continue
+
+        # Un nodo de la frontera no tiene opciones todavía: no cuenta para la ramificación
+        if node.get("is_expandable"):
+            expandable += 1
+            continue
+
+        choice_nodes += 1
+        for option in node["options"] or []:
+            child_id = option.get("node_id")
+            if child_id not in nodes:
+                dangling += 1
+                continue
+            choices += 1
+            if child_id not in seen:
+                stack.append((child_id, depth + 1))
+
+    return StoryStats(
+        node_count=len(nodes),
+        unreachable_nodes=len(nodes) - len(seen),
+        max_depth=max_depth,
+        winning_endings=winning,
+        losing_endings=losing,
+        branching_factor=round(choices / choice_nodes, 3) if choice_nodes else 0.0,
+        dangling_options=dangling,
+        has_winning_path=winning > 0,
+        expandable_nodes=expandable
+    )
+
+
+def analyze_node_rows(rows, root_id: Optional[int]) -> StoryStats:
+    """Analiza filas de `story_nodes` (dicts de `build_node_rows` u objetos con los mismos atributos)."""
+    nodes = {}
+    for row in rows:
+        if isinstance(row, Mapping):
+            nodes[row["id"]] = row
+        else:
+            nodes[row.id] = {
+                "is_ending": row.is_ending,
+                "is_winning_ending": row.is_winning_ending,
+                "is_expandable": getattr(row, "is_expandable", False),
+                "options": row.options
+            }
+    return analyze_story_graph(nodes, root_id)
+
+
+def analyze_blob_nodes(blob_nodes) -> StoryStats:
+    """Analiza los nodos de un blob (en preorden: el ID local es la posición + 1 y la raíz es 1)."""
+    return analyze_story_graph({index + 1: node for index, node in enumerate(blob_nodes)}, 1 if blob_nodes else None)
+
+
+def apply_story_stats(story: Story, stats: StoryStats):
+    """Copia el análisis a las columnas de la historia (sin commit)."""
+    for column, value in asdict(stats).items():
+        setattr(story, column, value)
+
+
+def analyze_stored_story(db: Session, story: Story) -> StoryStats:
+    """
+    Analiza una historia ya guardada (filas o blob) y actualiza sus columnas.
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+    """
+    if story.tree_blob is not None:
+        stats = analyze_blob_nodes(StoryBlob(story.tree_blob).nodes())
+    else:
+        rows = db.execute(
+            select(
+                StoryNode.id, StoryNode.is_root, StoryNode.is_ending, StoryNode.is_winning_ending,
+                StoryNode.is_expandable, StoryNode.options
+            )
+            .where(StoryNode.story_id == story.id)
+        ).all()
+        root_id = story.root_node_id
+        if root_id is None:
+            root_id = next((row.id for row in rows if row.is_root), None)
+        stats = analyze_node_rows(rows, root_id)
+    apply_story_stats(story, stats)
+    return stats
+
+
+def stats_response(source: Any) -> Optional[StoryStatsSchema]:
+    """
+    Estadísticas para las respuestas de la API, leídas de una Story o de una
+    fila con las columnas de STATS_COLUMNS. None si todavía no se analizó.
+    """
+    if getattr(source, "node_count", None) is None:
+        return None
+    values = {column: getattr(source, column) for column in STATS_COLUMNS}
+    # Historias analizadas antes de existir la columna
+    values["expandable_nodes"] = values["expandable_nodes"] or 0
+    return StoryStatsSchema(**values)
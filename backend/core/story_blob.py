@@ -0,0 +1,235 @@
+"""
+Formato compacto de una historia completa en una sola columna (`stories.tree_blob`).
+
+Alternativa a una fila de `story_nodes` por nodo: el árbol entero se guarda en
+un blob versionado y comprimido, con una tabla de offsets para acceder a un
+nodo (o a un subárbol) sin decodificar los demás.
+
+Estructura (little-endian):
+
+    cabecera     "STB1" | versión u8 | códec u8 | serialización u8 | relleno u8
+                 | cantidad de nodos u32 | tamaño del cuerpo sin comprimir u32
+    tabla        por nodo: offset u32 | longitud u32 | profundidad u16 | tamaño del subárbol u32
+    cuerpo       nodos serializados uno tras otro (comprimido con el códec)
+
+Los nodos están en preorden y su ID local es su posición + 1 (la raíz es 1),
+así que el subárbol de un nodo es el rango contiguo [id, id + tamaño del
+subárbol). La tabla no se comprime: con el códec "none" el acceso a un nodo es
+un simple slice; con compresión se descomprime el cuerpo una vez, pero solo se
+decodifican los nodos pedidos.
+
+Códecs: "none", "zlib" (biblioteca estándar) y "zstd" (requiere `zstandard`).
+Serializaciones: "json" (biblioteca estándar) y "msgpack" (requiere `msgpack`).
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Sequence, Tuple
+
+MAGIC = b"STB1"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sBBBxII")
+_TABLE_ENTRY = struct.Struct("<IIHI")
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+SERIALIZATIONS = {"json": 0, "msgpack": 1}
+
+_CODEC_NAMES = {value: name for name, value in CODECS.items()}
+_SERIALIZATION_NAMES = {value: name for name, value in SERIALIZATIONS.items()}
+
+# Nodo listo para el blob: content, is_ending, is_winning_ending, options [{text, node_id}] y depth
+BlobNode = Dict[str, Any]
+
+
+def format_name(codec: str, serialization: str) -> str:
+    """Descripción del formato guardada en `stories.tree_format`. Ejemplo: "stb1+zstd+msgpack"."""
+    return f"stb{FORMAT_VERSION}+{codec}+{serialization}"
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Códec desconocido: '{codec}'")
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Códec desconocido: '{codec}'")
+
+
+def _dumps(serialization: str, value: Dict[str, Any]) -> bytes:
+    if serialization == "json":
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if serialization == "msgpack":
+        import msgpack
+
+        return msgpack.packb(value, use_bin_type=True)
+    raise ValueError(f"Serialización desconocida: '{serialization}'")
+
+
+def _loads(serialization: str, data: bytes) -> Dict[str, Any]:
+    if serialization == "json":
+        return json.loads(data)
+    if serialization == "msgpack":
+        import msgpack
+
+        return msgpack.unpackb(data, raw=False)
+    raise ValueError(f"Serialización desconocida: '{serialization}'")
+
+
+def blob_nodes_from_flat(flat_nodes: Sequence[Tuple[Any, List[Tuple[str, int]]]]) -> List[BlobNode]:
+    """
+    Convierte el árbol aplanado por `flatten_story_tree` (preorden) en nodos del blob.
+    """
+    depths = [0] * len(flat_nodes)
+    nodes = []
+    for index, (node, options) in enumerate(flat_nodes):
+        for _, child_index in options:
+            depths[child_index] = depths[index] + 1
+        nodes.append({
+            "content": node.content,
+            "is_ending": node.isEnding,
+            "is_winning_ending": node.isWinningEnding,
+            "options": [{"text": text, "node_id": child_index + 1} for text, child_index in options],
+            "depth": depths[index],
+        })
+    return nodes
+
+
+def blob_nodes_from_rows(rows: Sequence[Any]) -> List[BlobNode]:
+    """
+    Convierte las filas de `story_nodes` de una historia en nodos del blob,
+    recorriendo las opciones desde la raíz en preorden y renumerando los IDs.
+
+    Raises:
+        ValueError: Si la historia no tiene nodo raíz.
+    """
+    by_id = {row.id: row for row in rows}
+    root = next((row for row in rows if row.is_root), None)
+    if root is None:
+        raise ValueError("La historia no tiene nodo raíz")
+
+    order: List[Tuple[Any, int]] = []
+    local_ids: Dict[int, int] = {}
+    stack = [(root, 0)]
+    while stack:
+        row, depth = stack.pop()
+        if row.id in local_ids:
+            continue
+        local_ids[row.id] = len(order) + 1
+        order.append((row, depth))
+        for option in reversed(row.options or []):
+            child = by_id.get(option.get("node_id"))
+            if child is not None:
+                stack.append((child, depth + 1))
+
+    return [
+        {
+            "content": row.content,
+            "is_ending": row.is_ending,
+            "is_winning_ending": row.is_winning_ending,
+            "options": [
+                {"text": option.get("text", ""), "node_id": local_ids[option["node_id"]]}
+                for option in row.options or []
+                if option.get("node_id") in local_ids
+            ],
+            "depth": depth,
+        }
+        for row, depth in order
+    ]
+
+
+def encode_story_blob(nodes: Sequence[BlobNode], codec: str = "zlib", serialization: str = "json") -> bytes:
+    """
+    Serializa los nodos (en preorden, con su profundidad) en un blob.
+
+    Args:
+        nodes: Nodos construidos con `blob_nodes_from_flat` o `blob_nodes_from_rows`.
+        codec: "none", "zlib" o "zstd".
+        serialization: "json" o "msgpack".
+
+    Returns:
+        bytes: El blob listo para `stories.tree_blob`.
+    """
+    depths = [node["depth"] for node in nodes]
+    # Tamaño del subárbol: nodos siguientes en preorden con mayor profundidad
+    subtree_sizes = [1] * len(nodes)
+    open_nodes: List[int] = []
+    for index, depth in enumerate(depths):
+        while open_nodes and depths[open_nodes[-1]] >= depth:
+            closed = open_nodes.pop()
+            subtree_sizes[closed] = index - closed
+        open_nodes.append(index)
+    for index in open_nodes:
+        subtree_sizes[index] = len(nodes) - index
+
+    body = bytearray()
+    table = bytearray()
+    for index, node in enumerate(nodes):
+        payload = _dumps(serialization, {key: value for key, value in node.items() if key != "depth"})
+        table += _TABLE_ENTRY.pack(len(body), len(payload), depths[index], subtree_sizes[index])
+        body += payload
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, CODECS[codec], SERIALIZATIONS[serialization], len(nodes), len(body)
+    )
+    return header + bytes(table) + _compress(codec, bytes(body))
+
+
+class StoryBlob:
+    """Lector de un blob de historia con acceso aleatorio por ID local de nodo."""
+
+    def __init__(self, data: bytes):
+        magic, version, codec, serialization, count, body_size = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Formato de blob de historia no soportado")
+        self.codec = _CODEC_NAMES[codec]
+        self.serialization = _SERIALIZATION_NAMES[serialization]
+        self.node_count = count
+
+        table_start = _HEADER.size
+        body_start = table_start + count * _TABLE_ENTRY.size
+        self._table = [
+            _TABLE_ENTRY.unpack_from(data, table_start + index * _TABLE_ENTRY.size)
+            for index in range(count)
+        ]
+        self._body = _decompress(self.codec, bytes(data[body_start:]))
+        if len(self._body) != body_size:
+            raise ValueError("El blob de la historia está truncado")
+
+    def node(self, node_id: int) -> Dict[str, Any]:
+        """Decodifica un nodo por su ID local (la raíz es 1)."""
+        if not 1 <= node_id <= self.node_count:
+            raise KeyError(node_id)
+        offset, length, _, _ = self._table[node_id - 1]
+        return {"id": node_id, **_loads(self.serialization, self._body[offset:offset + length])}
+
+    def subtree(self, node_id: int, prefetch: int) -> List[Dict[str, Any]]:
+        """Nodo y sus descendientes hasta `prefetch` niveles, en preorden."""
+        if not 1 <= node_id <= self.node_count:
+            raise KeyError(node_id)
+        _, _, depth, size = self._table[node_id - 1]
+        return [
+            self.node(index + 1)
+            for index in range(node_id - 1, node_id - 1 + size)
+            if self._table[index][2] <= depth + prefetch
+        ]
+
+    def nodes(self) -> List[Dict[str, Any]]:
+        """Todos los nodos de la historia, en preorden."""
+        return [self.node(node_id) for node_id in range(1, self.node_count + 1)]
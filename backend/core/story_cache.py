@@ -0,0 +1,223 @@
+"""
+Caché de historias por tema con agrupación de peticiones en curso.
+
+Muchos jugadores piden los mismos temas ("fantasy", "sci-fi", "terror"). La
+clave combina el tema normalizado, el idioma y la versión del prompt:
+- Política "reutilizar hasta K" (desactivada por defecto): las primeras K
+  peticiones de una clave generan historias distintas; a partir de ahí se
+  reparten esas K historias en rotación, salteando las que la sesión ya recibió.
+- Las peticiones idénticas concurrentes esperan a la misma generación en curso
+  en lugar de lanzar otra llamada al LLM, salvo las de la misma sesión (cada
+  una de sus peticiones recibe una historia distinta).
+- Desalojo LRU (máximo de claves) y TTL por clave.
+"""
+
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import AbstractSet, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings  # Configuración de la aplicación
+from core.prompts import PROMPT_VERSION  # Versión del prompt (cambia la clave al modificarlo)
+
+CacheKey = Tuple[str, str, str]
+
+
+def normalize_theme(theme: str) -> str:
+    """
+    Normaliza un tema para usarlo como clave.
+    Ejemplo: "  Fantasía  Épica! " -> "fantasia epica"
+    """
+    text = unicodedata.normalize("NFKD", theme or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"[^\w\s-]", " ", text)
+    return " ".join(text.split())
+
+
+def normalize_language(language: Optional[str]) -> str:
+    """
+    Reduce un idioma o una cabecera Accept-Language a su subetiqueta principal.
+    Ejemplo: "es-ES,es;q=0.9,en;q=0.8" -> "es"
+    """
+    if not language:
+        return ""
+    first = language.split(",")[0].split(";")[0].strip()
+    return first.split("-")[0].lower()
+
+
+def cache_key(theme: str, language: Optional[str]) -> CacheKey:
+    """Clave de caché: (tema normalizado, idioma, versión del prompt)."""
+    return normalize_theme(theme), normalize_language(language), PROMPT_VERSION
+
+
+@dataclass
+class _Entry:
+    story_ids: List[int] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+    next_index: int = 0  # Próxima historia a entregar en la rotación
+
+
+class StoryCache:
+    """Caché LRU/TTL de IDs de historias por clave, segura entre threads."""
+
+    def __init__(self, max_keys: int, ttl_seconds: float, reuse_k: int):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.reuse_k = reuse_k
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Tuple[Future, Optional[str]]] = {}  # Generación en curso y su sesión
+
+    def _reusable_story(self, key: CacheKey, exclude: AbstractSet[int]) -> Optional[int]:
+        """
+        Devuelve una historia para reutilizar si la clave ya tiene K historias y
+        alguna no está en `exclude` (con el lock tomado).
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        if self.reuse_k <= 0 or len(entry.story_ids) < self.reuse_k:
+            return None
+        for _ in range(len(entry.story_ids)):
+            story_id = entry.story_ids[entry.next_index % len(entry.story_ids)]
+            entry.next_index += 1
+            if story_id not in exclude:
+                return story_id
+        return None
+
+    def add(self, key: CacheKey, story_id: int):
+        """Registra una historia recién generada para la clave."""
+        if self.reuse_k <= 0:
+            return
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+            if story_id not in entry.story_ids and len(entry.story_ids) < self.reuse_k:
+                entry.story_ids.append(story_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def discard_story(self, story_id: int):
+        """Quita una historia de todas las claves (p. ej. si se borró)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if story_id in entry.story_ids:
+                    entry.story_ids.remove(story_id)
+                    if not entry.story_ids:
+                        del self._entries[key]
+
+    def _lookup(
+        self, key: CacheKey, session_id: Optional[str], exclude: AbstractSet[int]
+    ) -> Tuple[Optional[int], Optional[Future], bool]:
+        """
+        Busca una historia reutilizable o la generación en curso.
+
+        Returns:
+            (story_id, future, es_líder). Sin historia ni future, la petición
+            genera la suya sin compartirla (la generación en curso es de su sesión).
+        """
+        with self._lock:
+            story_id = self._reusable_story(key, exclude)
+            if story_id is not None:
+                return story_id, None, False
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                future, owner = inflight
+                if session_id is not None and owner == session_id:
+                    return None, None, False
+                return None, future, False
+            future = Future()
+            self._inflight[key] = (future, session_id)
+            return None, future, True
+
+    def _finish(self, key: CacheKey, future: Future, story_id: Optional[int], error: Optional[BaseException]):
+        with self._lock:
+            if self._inflight.get(key, (None,))[0] is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            self.add(key, story_id)
+            future.set_result(story_id)
+
+    def get_or_generate(
+        self,
+        key: CacheKey,
+        generate: Callable[[], int],
+        session_id: Optional[str] = None,
+        exclude: AbstractSet[int] = frozenset()
+    ) -> Tuple[int, bool]:
+        """
+        Obtiene una historia para la clave, generándola si hace falta.
+
+        Args:
+            key: Clave construida con `cache_key`.
+            generate: Función que genera la historia y devuelve su ID.
+            session_id: Sesión que la pide (no comparte generaciones con otra petición suya).
+            exclude: Historias que la sesión ya recibió (nunca se le entregan otra vez).
+
+        Returns:
+            (story_id, generada): `generada` es False si se reutilizó o se
+            esperó la generación de otra petición.
+        """
+        story_id, future, leader = self._lookup(key, session_id, exclude)
+        if story_id is not None:
+            return story_id, False
+        if future is None:
+            story_id = generate()
+            self.add(key, story_id)
+            return story_id, True
+        if not leader:
+            return future.result(), False
+
+        try:
+            story_id = generate()
+        except BaseException as e:
+            self._finish(key, future, None, e)
+            raise
+        self._finish(key, future, story_id, None)
+        return story_id, True
+
+    async def get_or_generate_async(
+        self,
+        key: CacheKey,
+        generate: Callable[[], Awaitable[int]],
+        session_id: Optional[str] = None,
+        exclude: AbstractSet[int] = frozenset()
+    ) -> Tuple[int, bool]:
+        """Variante asíncrona de `get_or_generate` (comparte las generaciones en curso)."""
+        story_id, future, leader = self._lookup(key, session_id, exclude)
+        if story_id is not None:
+            return story_id, False
+        if future is None:
+            story_id = await generate()
+            self.add(key, story_id)
+            return story_id, True
+        if not leader:
+            return await asyncio.wrap_future(future), False
+
+        try:
+            story_id = await generate()
+        except BaseException as e:
+            self._finish(key, future, None, e)
+            raise
+        self._finish(key, future, story_id, None)
+        return story_id, True
+
+
+# Instancia global del proceso
+story_cache = StoryCache(
+    max_keys=settings.STORY_CACHE_MAX_KEYS,
+    ttl_seconds=settings.STORY_CACHE_TTL_SECONDS,
+    reuse_k=settings.STORY_CACHE_REUSE_K
+)
@@ -0,0 +1,245 @@
+"""
+Persistencia del modo de generación "incremental".
+
+La generación inicial guarda solo los primeros INCREMENTAL_INITIAL_LEVELS
+niveles. Los nodos del último nivel que no son finales quedan sin opciones y
+con `is_expandable`: son la frontera. Cuando el jugador se acerca, el frontend
+llama a `POST /story/{id}/node/{node_id}/expand` y se genera el subárbol de
+ese nodo (INCREMENTAL_EXPAND_LEVELS niveles más) con el camino recorrido como
+contexto. Al llegar a INCREMENTAL_MAX_LEVELS la frontera se cierra con finales.
+
+Cada expansión se reclama con un UPDATE condicional que registra un lease
+(`expansion_started_at`): entre procesos solo uno llama al LLM por nodo, y si
+ese proceso se cae el nodo se puede volver a expandir al vencer el lease.
+La escritura del subárbol (y la liberación tras un fallo) vuelve a exigir ese
+mismo lease: si venció y otro proceso lo reclamó, el primero no escribe.
+Dentro de un proceso, las peticiones concurrentes del mismo nodo esperan a la
+expansión en curso en lugar de recibir un conflicto.
+
+La generación con el LLM vive en `StoryGenerator` (core/story_generator.py);
+este módulo solo lee y escribe la base de datos.
+"""
+
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, or_, select, update  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.config import settings  # Niveles y lease de la expansión
+from core.models import StoryLLMResponse, StoryNodeLLM  # Esquemas Pydantic de la respuesta del LLM
+from core.story_analysis import analyze_node_rows, analyze_stored_story, apply_story_stats  # Estadísticas del árbol
+from core.story_persistence import build_node_rows, flatten_story_tree, node_path, path_depth, reserve_node_ids  # Escritura masiva de filas
+from models.story import Story, StoryNode  # Modelos ORM
+
+
+@dataclass
+class ExpansionContext:
+    """Lo que necesita el LLM para continuar un nodo de la frontera."""
+    title: str
+    theme: str
+    language: Optional[str]
+    path: List[Tuple[str, str]]  # (contenido, opción elegida) desde la raíz hasta el padre del nodo
+    content: str  # Contenido del nodo a expandir
+    levels: int  # Niveles a generar debajo del nodo
+    finish: bool  # True si el último nivel generado debe ser solo de finales
+
+
+class ExpansionLeaseLost(Exception):
+    """El lease de la expansión venció y el nodo ya lo reclamó (o lo expandió) otro proceso."""
+
+
+def _mark_frontier(rows: List[Dict[str, Any]]):
+    """
+    Marca como expandibles los nodos sin opciones que no son finales. Los del
+    último nivel permitido se convierten en finales (perdedores).
+    """
+    last_depth = settings.INCREMENTAL_MAX_LEVELS - 1
+    for row in rows:
+        if row["is_ending"] or row["options"]:
+            row["is_expandable"] = False
+        elif row["depth"] >= last_depth:
+            row["is_ending"] = True
+            row["is_expandable"] = False
+        else:
+            row["is_expandable"] = True
+
+
+def persist_incremental_story(db: Session, session_id: str, theme: str, language: Optional[str], story_structure: StoryLLMResponse) -> Story:
+    """
+    Guarda los primeros niveles de una historia incremental (siempre en filas:
+    el árbol sigue creciendo después de guardarse).
+
+    Los niveles de más que devuelva el LLM se descartan y su nivel pasa a ser la frontera.
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+    """
+    story_db = Story(title=story_structure.title, session_id=session_id, theme=theme, language=language)
+    db.add(story_db)
+    db.flush()
+
+    flat_nodes = flatten_story_tree(story_structure.rootNode, max_levels=settings.INCREMENTAL_INITIAL_LEVELS)
+    node_ids = reserve_node_ids(db, len(flat_nodes))
+    rows = build_node_rows(story_db.id, flat_nodes, node_ids)
+    _mark_frontier(rows)
+    db.execute(insert(StoryNode), rows)
+    story_db.root_node_id = node_ids[0]
+    apply_story_stats(story_db, analyze_node_rows(rows, node_ids[0]))
+    return story_db
+
+
+def claim_expansion(db: Session, story_id: int, node_id: int) -> Optional[datetime]:
+    """
+    Reclama la expansión de un nodo (UPDATE condicional con lease) y hace commit.
+
+    Returns:
+        El instante del reclamo (identifica el lease) si este llamador debe
+        generar el subárbol, o None si otro lo tiene.
+    """
+    now = datetime.now(timezone.utc)
+    expired = now - timedelta(seconds=settings.INCREMENTAL_EXPANSION_LEASE_SECONDS)
+    result = db.execute(
+        update(StoryNode)
+        .where(
+            StoryNode.id == node_id,
+            StoryNode.story_id == story_id,
+            StoryNode.is_expandable.is_(True),
+            or_(StoryNode.expansion_started_at.is_(None), StoryNode.expansion_started_at < expired)
+        )
+        .values(expansion_started_at=now)
+    )
+    db.commit()
+    return now if result.rowcount == 1 else None
+
+
+def release_expansion(db: Session, node_id: int, claimed_at: datetime):
+    """
+    Libera el lease tras una expansión fallida para que se pueda reintentar
+    enseguida, salvo que ya sea de otro proceso.
+    """
+    db.rollback()
+    db.execute(
+        update(StoryNode)
+        .where(StoryNode.id == node_id, StoryNode.expansion_started_at == claimed_at)
+        .values(expansion_started_at=None)
+    )
+    db.commit()
+
+
+def expansion_context(db: Session, story: Story, node: StoryNode) -> ExpansionContext:
+    """
+    Construye el contexto de la expansión: los ancestros del nodo se leen con
+    una sola consulta por sus rutas (prefijos de la ruta del nodo).
+    """
+    positions = [int(part) for part in node.path.strip("/").split("/") if part]
+    prefixes = [node_path(positions[:length]) for length in range(len(positions))]
+    ancestors = {
+        row.path: row
+        for row in db.execute(
+            select(StoryNode.path, StoryNode.content, StoryNode.options)
+            .where(StoryNode.story_id == story.id, StoryNode.path.in_(prefixes))
+        ).all()
+    }
+
+    path = []
+    for prefix, position in zip(prefixes, positions):
+        ancestor = ancestors.get(prefix)
+        if ancestor is None:
+            continue
+        options = ancestor.options or []
+        chosen = options[position]["text"] if position < len(options) else ""
+        path.append((ancestor.content, chosen))
+
+    remaining = settings.INCREMENTAL_MAX_LEVELS - 1 - path_depth(node.path)
+    levels = max(1, min(settings.INCREMENTAL_EXPAND_LEVELS, remaining))
+    return ExpansionContext(
+        title=story.title,
+        theme=story.theme or "",
+        language=story.language,
+        path=path,
+        content=node.content,
+        levels=levels,
+        finish=levels >= remaining
+    )
+
+
+def persist_expansion(
+    db: Session, story: Story, node: StoryNode, expansion: StoryNodeLLM, levels: int, claimed_at: datetime
+) -> int:
+    """
+    Agrega el subárbol generado debajo de un nodo de la frontera.
+
+    Las filas nuevas se escriben con un único INSERT masivo y sus rutas cuelgan
+    de la del nodo, así que `/node/{id}?prefetch=k` las lee igual que al resto.
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Args:
+        claimed_at: Instante devuelto por `claim_expansion` (el lease de esta expansión).
+
+    Returns:
+        int: Cantidad de nodos agregados.
+
+    Raises:
+        ExpansionLeaseLost: Si el lease venció y el nodo ya es de otro proceso.
+    """
+    # La raíz del subárbol es el nodo existente: se conserva su contenido y solo se le agregan opciones
+    subtree = StoryNodeLLM(content=node.content, isEnding=False, isWinningEnding=False, options=expansion.options)
+    flat_nodes = flatten_story_tree(subtree, max_levels=levels + 1)
+    if len(flat_nodes) == 1:
+        # El nodo sigue en la frontera y se puede volver a pedir
+        raise ValueError("La expansión del nodo no generó opciones")
+
+    # Primero se escribe el nodo, solo si el lease sigue siendo nuestro: en SQLite
+    # además toma el lock de escritura antes de reservar IDs con MAX(id)
+    claimed = db.execute(
+        update(StoryNode)
+        .where(
+            StoryNode.id == node.id,
+            StoryNode.is_expandable.is_(True),
+            StoryNode.expansion_started_at == claimed_at
+        )
+        .values(is_expandable=False, expansion_started_at=None)
+    )
+    if claimed.rowcount == 0:
+        raise ExpansionLeaseLost(node.id)
+
+    node_ids = [node.id] + reserve_node_ids(db, len(flat_nodes) - 1)
+    rows = build_node_rows(story.id, flat_nodes, node_ids, base_path=node.path)
+    _mark_frontier(rows)
+    db.execute(insert(StoryNode), rows[1:])
+    node.options = rows[0]["options"]
+    db.flush()
+    analyze_stored_story(db, story)
+    return len(rows) - 1
+
+
+class _ExpansionFlights:
+    """Agrupa las expansiones concurrentes del mismo nodo dentro del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[int, threading.Event] = {}
+
+    @contextmanager
+    def lead(self, node_id: int) -> Iterator[Optional[threading.Event]]:
+        """
+        Devuelve None si este llamador lidera la expansión (y la cierra al
+        salir), o el evento de la expansión en curso para esperarla.
+        """
+        with self._lock:
+            event = self._events.get(node_id)
+            if event is None:
+                self._events[node_id] = threading.Event()
+        if event is not None:
+            yield event
+            return
+        try:
+            yield None
+        finally:
+            with self._lock:
+                self._events.pop(node_id).set()
+
+
+expansion_flights = _ExpansionFlights()
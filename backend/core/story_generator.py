@@ -1,13 +1,80 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 from sqlalchemy.orm import Session  # Importa Session para manejar la conexión y transacciones con la base de datos
-from core.config import settings  # Importa la configuración de la aplicación
+from db.database import get_async_sessionmaker  # Fábrica de sesiones asíncronas (AsyncSession)
 
-from langchain_google_genai import ChatGoogleGenerativeAI  # Importa la clase para interactuar con modelos de chat de Google
-from langchain_core.prompts import PromptTemplate, ChatPromptTemplate  # Importa utilidades para crear plantillas de prompts
+from core.llm_providers import llm_registry  # Registro de clientes de LLM reutilizables
+from core.generation_metrics import FANOUT_BRANCH_RETRIES, NODES_PER_STORY, PARSE_FAILURES, STAGE_SECONDS, count_story_nodes  # Métricas por etapa
+from langchain_core.prompts import ChatPromptTemplate  # Importa utilidades para crear plantillas de prompts
 from langchain_core.output_parsers import PydanticOutputParser  # Importa el parser para convertir la salida del LLM a objetos Pydantic
 
+from core.config import settings  # Niveles del modo incremental
 from core.prompts import STORY_PROMPT  # Importa el prompt base para la generación de historias
+from core.prompts import INCREMENTAL_STORY_PROMPT, EXPAND_NODE_PROMPT, EXPAND_CONTINUE_INSTRUCTION, EXPAND_FINISH_INSTRUCTION  # Prompts del modo incremental
+from core.prompts import FANOUT_OUTLINE_PROMPT, FANOUT_BRANCH_PROMPT, FANOUT_WINNING_INSTRUCTION, FANOUT_LOSING_INSTRUCTION  # Prompts del modo fanout
+from core.models import StoryLLMResponse  # Importa el esquema Pydantic para la estructura de respuesta del LLM
+from core.models import StoryNodeLLM, StoryOptionLLM, StoryOutlineLLM  # Esquema y ramas del modo fanout
+from core.story_analysis import analyze_stored_story  # Estadísticas del árbol al terminar
+from core.story_expansion import (  # Persistencia del modo incremental
+    ExpansionContext, ExpansionLeaseLost, claim_expansion, expansion_context, expansion_flights, persist_expansion,
+    persist_incremental_story, release_expansion
+)
+from core.story_parser import StoryParseError, parse_json_model, parse_story  # Parseo y validación del árbol en una sola pasada
+from core.story_persistence import node_path, persist_streamed_branch  # Rutas y escritura de cada rama del streaming
+from core.story_store import save_story_tree, save_story_tree_async  # Guarda la historia en el formato configurado
+from core.stream_parser import StoryStreamParser, TitleEvent, NodeHeaderEvent, NodeClosedEvent  # Parser JSON incremental
 from models.story import Story, StoryNode  # Importa los modelos de base de datos para Historia y Nodo de Historia
-from core.models import StoryLLMResponse, StoryNodeLLM  # Importa los esquemas Pydantic para la estructura de respuesta del LLM
+
+
+# El parser y la plantilla del prompt se construyen una sola vez al importar el módulo.
+# STORY_PARSER solo aporta las instrucciones de formato; el parseo lo hace core/story_parser.py
+STORY_PARSER = PydanticOutputParser(pydantic_object=StoryLLMResponse)
+
+STORY_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        STORY_PROMPT
+    ),
+    (
+        "human",
+        "Creando la historia con el tema: {theme}{language_instruction}"
+    )
+]).partial(format_instructions=STORY_PARSER.get_format_instructions())
+
+INCREMENTAL_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", INCREMENTAL_STORY_PROMPT),
+    ("human", "Creando la historia con el tema: {theme}{language_instruction}")
+]).partial(format_instructions=STORY_PARSER.get_format_instructions())
+
+EXPAND_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", EXPAND_NODE_PROMPT),
+    (
+        "human",
+        "Historia: {title}\nTema: {theme}{language_instruction}\n\n"
+        "Camino recorrido:\n{path}\n\nEscena actual:\n{content}"
+    )
+]).partial(format_instructions=STORY_PARSER.get_format_instructions())
+
+# Modo "fanout": el esquema usa su propio parser; las ramas, el de la historia completa
+FANOUT_OUTLINE_PARSER = PydanticOutputParser(pydantic_object=StoryOutlineLLM)
+
+FANOUT_OUTLINE_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", FANOUT_OUTLINE_PROMPT),
+    ("human", "Creando la historia con el tema: {theme}{language_instruction}")
+]).partial(format_instructions=FANOUT_OUTLINE_PARSER.get_format_instructions())
+
+FANOUT_BRANCH_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", FANOUT_BRANCH_PROMPT),
+    (
+        "human",
+        "Historia: {title}\nTema: {theme}{language_instruction}\nSinopsis: {synopsis}\n\n"
+        "Situación inicial:\n{content}\n\nOpciones de la situación inicial:\n{options}\n\n"
+        "Opción elegida: {choice}"
+    )
+]).partial(format_instructions=STORY_PARSER.get_format_instructions())
 
 
 class StoryGenerator:
@@ -18,17 +85,56 @@ class StoryGenerator:
     @classmethod
     def _get_llm(cls):
         """
-        Configura y devuelve una instancia del modelo de lenguaje (LLM).
-        Usa 'gemini-2.0-flash' para la generación (rápido y económico).
+        Devuelve el cliente del modelo de lenguaje (LLM) configurado.
+        El cliente se reutiliza entre historias y respeta el presupuesto
+        compartido de requests/tokens por minuto (ver core/llm_providers.py).
         """
-        return ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash", 
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=0.7
-        )
-    
+        return llm_registry.get()
+
+    @classmethod
+    def _build_prompt(cls, theme: str, language: Optional[str] = None):
+        """
+        Completa la plantilla del prompt (construida una sola vez) con el tema.
+
+        Args:
+            theme (str): Tema de la historia.
+            language (str): Idioma de la historia (opcional, ej: "es").
+
+        Returns:
+            El prompt listo para enviarse al LLM.
+        """
+        return STORY_PROMPT_TEMPLATE.invoke({
+            "theme": theme,
+            "language_instruction": f"\nIdioma de la historia: {language}" if language else ""
+        })
+
+    @classmethod
+    def _parse_response(cls, raw_response, mode: str = "single", observe_size: bool = True, max_depth: Optional[int] = None) -> StoryLLMResponse:
+        """
+        Extrae el texto de la respuesta del LLM y lo valida contra StoryLLMResponse
+        (con los límites de profundidad y de nodos). Registra la duración del parseo, los fallos y el tamaño de la historia
+        (salvo con `observe_size=False`, p. ej. en las expansiones, que no son historias completas).
+        `max_depth` reemplaza a STORY_MAX_DEPTH (las ramas del modo "fanout" cuelgan de la raíz).
+        """
+        response_text = raw_response
+        if hasattr(raw_response, "content"):
+            response_text = raw_response.content
+        with STAGE_SECONDS.time(mode=mode, stage="parse"):
+            try:
+                # Decodifica y valida el árbol completo de una vez (ver core/story_parser.py)
+                story_structure = parse_story(response_text, max_depth=max_depth)
+            except Exception:
+                PARSE_FAILURES.inc(mode=mode)
+                raise
+        if observe_size:
+            NODES_PER_STORY.observe(count_story_nodes(story_structure.rootNode))
+        return story_structure
+
     @classmethod
-    def generate_story(cls, db: Session, session_id: str, theme: str = "fantasy") -> Story:
+    def generate_story(
+        cls, db: Session, session_id: str, theme: str = "fantasy", language: Optional[str] = None,
+        pool_key: Optional[str] = None
+    ) -> Story:
         """
         Genera una nueva historia basada en un tema dado.
         
@@ -36,99 +142,528 @@ class StoryGenerator:
             db (Session): Sesión de base de datos.
             session_id (str): Identificador de la sesión del usuario.
             theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
+            pool_key (str): Clave del stock si la historia es pregenerada (opcional).
             
         Returns:
             Story: El objeto de historia creado y guardado en la base de datos.
         """
-        llm = cls._get_llm()
-        # Configura el parser para validar que la salida del LLM cumpla con el esquema StoryLLMResponse
-        story_parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
-
-        # Crea el template del prompt combinando el prompt del sistema y la entrada del usuario
-        prompt = ChatPromptTemplate.from_messages([
-
-            (
-                "system",
-                STORY_PROMPT
-            ),
-            (
-                "human",
-                f"Creando la historia con el tema: {theme}"        
-            )
-        ]).partial(format_instructions=story_parser.get_format_instructions())
+        with STAGE_SECONDS.time(mode="single", stage="total"):
+            llm = cls._get_llm()
+            with STAGE_SECONDS.time(mode="single", stage="prompt"):
+                prompt = cls._build_prompt(theme, language)
 
-        # Invoca al LLM con el prompt generado
-        raw_response = llm.invoke(prompt.invoke({}))
+            # Invoca al LLM con el prompt generado
+            with STAGE_SECONDS.time(mode="single", stage="llm"):
+                raw_response = llm.invoke(prompt)
 
+            # Parsea la respuesta de texto a una estructura de objetos Python (Pydantic)
+            story_structure = cls._parse_response(raw_response, mode="single")
+
+            # Guarda la historia en el formato configurado (filas con un único INSERT masivo o un blob)
+            with STAGE_SECONDS.time(mode="single", stage="persist"):
+                story_db = save_story_tree(db, session_id, story_structure, theme, language, pool_key)
+                db.commit()  # Confirma todos los cambios en la base de datos
+        return story_db
+
+    @classmethod
+    def generate_story_incremental(cls, db: Session, session_id: str, theme: str = "fantasy", language: Optional[str] = None) -> Story:
+        """
+        Genera solo los primeros INCREMENTAL_INITIAL_LEVELS niveles de la historia.
+        Los nodos abiertos del último nivel quedan como frontera y se generan con
+        `expand_node` cuando el jugador se acerca (ver core/story_expansion.py).
+
+        Args:
+            db (Session): Sesión de base de datos.
+            session_id (str): Identificador de la sesión del usuario.
+            theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
 
+        Returns:
+            Story: El objeto de historia creado y guardado en la base de datos.
+        """
+        with STAGE_SECONDS.time(mode="incremental", stage="total"):
+            llm = cls._get_llm()
+            with STAGE_SECONDS.time(mode="incremental", stage="prompt"):
+                prompt = INCREMENTAL_PROMPT_TEMPLATE.invoke({
+                    "theme": theme,
+                    "language_instruction": f"\nIdioma de la historia: {language}" if language else "",
+                    "levels": settings.INCREMENTAL_INITIAL_LEVELS
+                })
+
+            with STAGE_SECONDS.time(mode="incremental", stage="llm"):
+                raw_response = llm.invoke(prompt)
+            story_structure = cls._parse_response(raw_response, mode="incremental")
+
+            with STAGE_SECONDS.time(mode="incremental", stage="persist"):
+                story_db = persist_incremental_story(db, session_id, theme, language, story_structure)
+                db.commit()
+        return story_db
+
+    @classmethod
+    def _build_expansion_prompt(cls, context: ExpansionContext):
+        """Completa el prompt de expansión con el camino recorrido y la escena actual."""
+        path = "\n".join(
+            f"{step}. {content}\n   -> {choice}" for step, (content, choice) in enumerate(context.path, start=1)
+        )
+        return EXPAND_PROMPT_TEMPLATE.invoke({
+            "title": context.title,
+            "theme": context.theme,
+            "language_instruction": f"\nIdioma de la historia: {context.language}" if context.language else "",
+            "path": path or "(la escena actual es el comienzo)",
+            "content": context.content,
+            "levels": context.levels,
+            "ending_instruction": EXPAND_FINISH_INSTRUCTION if context.finish else EXPAND_CONTINUE_INSTRUCTION
+        })
+
+    @classmethod
+    def expand_node(cls, db: Session, story_id: int, node_id: int) -> str:
+        """
+        Genera el subárbol de un nodo de la frontera (modo "incremental").
+
+        La conexión a la base de datos no se retiene durante la llamada al LLM:
+        el reclamo y el contexto se confirman antes y la escritura se hace después.
+
+        Args:
+            db (Session): Sesión de base de datos (primaria).
+            story_id (int): ID de la historia.
+            node_id (int): ID del nodo a expandir.
+
+        Returns:
+            str: "expanded" si se generó el subárbol, "ready" si el nodo ya tenía
+            opciones (o otra petición del proceso acaba de generarlas), "busy" si
+            otro proceso lo está expandiendo y "not_found" si el nodo no existe.
+
+        Raises:
+            Exception: Si falla el LLM o su respuesta no es válida (el nodo queda expandible).
+        """
+        node = db.get(StoryNode, node_id)
+        if node is None or node.story_id != story_id:
+            return "not_found"
+        if not node.is_expandable:
+            return "ready"
+
+        with expansion_flights.lead(node_id) as running:
+            if running is not None:
+                # Otra petición de este proceso ya está expandiendo el nodo
+                running.wait(timeout=settings.INCREMENTAL_EXPANSION_LEASE_SECONDS)
+                db.refresh(node)
+                return "busy" if node.is_expandable else "ready"
+
+            claimed_at = claim_expansion(db, story_id, node_id)
+            if claimed_at is None:
+                db.refresh(node)
+                return "busy" if node.is_expandable else "ready"
+
+            try:
+                with STAGE_SECONDS.time(mode="expand", stage="total"):
+                    llm = cls._get_llm()
+                    with STAGE_SECONDS.time(mode="expand", stage="prompt"):
+                        story = db.get(Story, story_id)
+                        context = expansion_context(db, story, node)
+                        prompt = cls._build_expansion_prompt(context)
+                        db.commit()  # Devuelve la conexión al pool mientras se espera al LLM
+
+                    with STAGE_SECONDS.time(mode="expand", stage="llm"):
+                        raw_response = llm.invoke(prompt)
+                    expansion = cls._parse_response(raw_response, mode="expand", observe_size=False)
+
+                    with STAGE_SECONDS.time(mode="expand", stage="persist"):
+                        persist_expansion(db, story, node, expansion.rootNode, context.levels, claimed_at)
+                        db.commit()
+            except ExpansionLeaseLost:
+                # El lease venció mientras se esperaba al LLM y el nodo ya es de otro proceso
+                db.rollback()
+                db.refresh(node)
+                return "busy" if node.is_expandable else "ready"
+            except Exception:
+                release_expansion(db, node_id, claimed_at)
+                raise
+        return "expanded"
+
+    @classmethod
+    def _build_fanout_outline_prompt(cls, theme: str, language: Optional[str] = None):
+        """Completa el prompt del esquema del modo "fanout" con el tema."""
+        return FANOUT_OUTLINE_TEMPLATE.invoke({
+            "theme": theme,
+            "language_instruction": f"\nIdioma de la historia: {language}" if language else ""
+        })
+
+    @classmethod
+    def _build_fanout_branch_prompts(cls, outline: StoryOutlineLLM, theme: str, language: Optional[str] = None) -> list:
+        """
+        Un prompt por opción de primer nivel. Todos comparten el esquema (sinopsis,
+        situación inicial y resumen de cada opción) para que las ramas hermanas
+        sean coherentes sin verse entre sí.
+        """
+        options = outline.rootNode.options
+        listed = "\n".join(
+            f"{index}. {option.text}" + (f": {option.summary}" if option.summary else "")
+            for index, option in enumerate(options, start=1)
+        )
+        return [
+            FANOUT_BRANCH_TEMPLATE.invoke({
+                "title": outline.title,
+                "theme": theme,
+                "language_instruction": f"\nIdioma de la historia: {language}" if language else "",
+                "synopsis": outline.synopsis or "(sin sinopsis)",
+                "content": outline.rootNode.content,
+                "options": listed,
+                "choice": f"{index}. {option.text}",
+                "levels": settings.FANOUT_BRANCH_LEVELS,
+                "ending_instruction": FANOUT_WINNING_INSTRUCTION if option.canWin else FANOUT_LOSING_INSTRUCTION
+            })
+            for index, option in enumerate(options, start=1)
+        ]
+
+    @classmethod
+    def _parse_outline(cls, raw_response) -> StoryOutlineLLM:
+        """Valida el esquema del modo "fanout" (cuenta como una etapa "parse" más)."""
         response_text = raw_response
         if hasattr(raw_response, "content"):
             response_text = raw_response.content
+        with STAGE_SECONDS.time(mode="fanout", stage="parse"):
+            try:
+                outline = parse_json_model(response_text, StoryOutlineLLM)
+                if not outline.rootNode.options:
+                    raise StoryParseError("El esquema de la historia no tiene opciones")
+            except Exception:
+                PARSE_FAILURES.inc(mode="fanout")
+                raise
+        return outline
 
-        # Parsea la respuesta de texto a una estructura de objetos Python (Pydantic)
-        story_structure = story_parser.parse(response_text)
+    @classmethod
+    def _parse_fanout_branch(cls, raw_response) -> StoryNodeLLM:
+        """Valida una rama: su raíz queda un nivel por debajo de la de la historia."""
+        return cls._parse_response(
+            raw_response, mode="fanout", observe_size=False, max_depth=settings.STORY_MAX_DEPTH - 1
+        ).rootNode
 
-        # Crea el registro de la historia en la base de datos
-        story_db = Story(title=story_structure.title, session_id=session_id)
-        db.add(story_db)
-        db.flush()  # Obtiene el ID de la historia sin confirmar la transacción aún
-        
-        root_node_data = story_structure.rootNode
-        if isinstance(root_node_data, dict):
-            root_node_data = StoryNodeLLM.model_validate(root_node_data)
+    @classmethod
+    def _generate_fanout_branch(cls, llm, prompt) -> StoryNodeLLM:
+        """Genera una rama y la reintenta hasta FANOUT_BRANCH_RETRIES veces si falla."""
+        for attempt in range(settings.FANOUT_BRANCH_RETRIES + 1):
+            try:
+                return cls._parse_fanout_branch(llm.invoke(prompt, shape="branch"))
+            except Exception:
+                if attempt >= settings.FANOUT_BRANCH_RETRIES:
+                    raise
+                FANOUT_BRANCH_RETRIES.inc()
+
+    @classmethod
+    def _merge_fanout(cls, outline: StoryOutlineLLM, branches: List[StoryNodeLLM]) -> StoryLLMResponse:
+        """
+        Une el esquema y las ramas en un único StoryLLMResponse (el mismo que
+        devuelve el modo "single") y aplica el límite de nodos a la historia entera.
+
+        Raises:
+            StoryParseError: Si la historia unida supera STORY_MAX_NODES.
+        """
+        story_structure = StoryLLMResponse(
+            title=outline.title,
+            rootNode=StoryNodeLLM(
+                content=outline.rootNode.content,
+                isEnding=False,
+                isWinningEnding=False,
+                options=[
+                    StoryOptionLLM(text=option.text, next_node=branch)
+                    for option, branch in zip(outline.rootNode.options, branches)
+                ]
+            )
+        )
+        node_count = count_story_nodes(story_structure.rootNode)
+        if node_count > settings.STORY_MAX_NODES:
+            PARSE_FAILURES.inc(mode="fanout")
+            raise StoryParseError(f"La historia supera el máximo de {settings.STORY_MAX_NODES} nodos")
+        NODES_PER_STORY.observe(node_count)
+        return story_structure
 
-        # Procesa y guarda recursivamente los nodos de la historia comenzando por la raíz
-        cls._process_story_node(db, story_db.id, root_node_data, is_root=True)
+    @classmethod
+    def generate_story_fanout(cls, db: Session, session_id: str, theme: str = "fantasy", language: Optional[str] = None) -> Story:
+        """
+        Genera una historia en dos fases: primero un esquema (título, sinopsis,
+        raíz y opciones de primer nivel) y luego cada rama de primer nivel en una
+        llamada al LLM aparte, hasta FANOUT_CONCURRENCY en paralelo. La latencia
+        pasa a ser la del esquema más la de la rama más lenta en lugar de la del
+        árbol entero.
 
-        db.commit()  # Confirma todos los cambios en la base de datos
-        return story_db    
-            
+        Si una rama falla se reintenta solo esa rama; si agota los reintentos falla
+        la historia. Las ramas se unen en un StoryLLMResponse y se guardan igual
+        que en el modo "single".
+
+        Args:
+            db (Session): Sesión de base de datos.
+            session_id (str): Identificador de la sesión del usuario.
+            theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
+
+        Returns:
+            Story: El objeto de historia creado y guardado en la base de datos.
+        """
+        with STAGE_SECONDS.time(mode="fanout", stage="total"):
+            llm = cls._get_llm()
+            with STAGE_SECONDS.time(mode="fanout", stage="prompt"):
+                prompt = cls._build_fanout_outline_prompt(theme, language)
+
+            # "llm" cubre el esquema y las ramas (con sus parseos)
+            llm_started = time.perf_counter()
+            with STAGE_SECONDS.time(mode="fanout", stage="outline"):
+                outline = cls._parse_outline(llm.invoke(prompt, shape="outline"))
 
+            with STAGE_SECONDS.time(mode="fanout", stage="branches"):
+                branch_prompts = cls._build_fanout_branch_prompts(outline, theme, language)
+                pool = ThreadPoolExecutor(max_workers=max(1, min(settings.FANOUT_CONCURRENCY, len(branch_prompts))))
+                try:
+                    branches = list(pool.map(lambda branch_prompt: cls._generate_fanout_branch(llm, branch_prompt), branch_prompts))
+                finally:
+                    # Si una rama falla, las que aún no empezaron no llegan a llamar al LLM
+                    pool.shutdown(wait=False, cancel_futures=True)
+            STAGE_SECONDS.observe(time.perf_counter() - llm_started, mode="fanout", stage="llm")
+
+            story_structure = cls._merge_fanout(outline, branches)
+            with STAGE_SECONDS.time(mode="fanout", stage="persist"):
+                story_db = save_story_tree(db, session_id, story_structure, theme, language)
+                db.commit()
+        return story_db
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Extrae el texto de un fragmento del stream (str, AIMessageChunk o lista de partes)."""
+        content = chunk.content if hasattr(chunk, "content") else chunk
+        if isinstance(content, list):
+            return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+        return content
 
     @classmethod
-    def _process_story_node(cls, db: Session, story_id: int, node_data: StoryNodeLLM, is_root: bool = False) -> StoryNode:
+    def generate_story_streaming(cls, db: Session, session_id: str, theme: str = "fantasy", language: Optional[str] = None, on_root_ready=None) -> Story:
         """
-        Procesa un nodo de historia y sus opciones recursivamente.
-        
+        Genera una historia consumiendo el stream de tokens del LLM.
+
+        La raíz se guarda apenas se conocen sus campos. Los nodos de cada rama de
+        primer nivel se acumulan en memoria a medida que se cierran y, cuando la
+        rama termina, se escriben con un INSERT masivo y se agregan a las opciones
+        de la raíz en una transacción corta: ninguna transacción (ni el lock de
+        escritura de SQLite) queda abierta mientras llegan tokens. Desde la
+        primera rama la historia ya es jugable y se llama a `on_root_ready(story)`.
+
         Args:
             db (Session): Sesión de base de datos.
-            story_id (int): ID de la historia a la que pertenece el nodo.
-            node_data (StoryNodeLLM): Datos del nodo provenientes del LLM.
-            is_root (bool): Indica si es el nodo raíz de la historia.
-            
+            session_id (str): Identificador de la sesión del usuario.
+            theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
+            on_root_ready: Callback opcional que recibe la Story cuando la raíz es jugable.
+
         Returns:
-            StoryNode: El objeto de nodo creado.
-        """
-        node = StoryNode(
-            story_id=story_id,
-            content=node_data.content if hasattr(node_data, "content") else node_data["content"],
-            is_root=is_root,
-            is_ending=node_data.isEnding if hasattr(node_data, "isEnding") else node_data["isEnding"],
-            is_winning_ending=node_data.isWinningEnding if hasattr(node_data, "isWinningEnding") else node_data["isWinningEnding"],
-            options=[]
-        )
+            Story: El objeto de historia creado y guardado en la base de datos.
+        """
+        started = time.perf_counter()
+        llm = cls._get_llm()
+        with STAGE_SECONDS.time(mode="streaming", stage="prompt"):
+            prompt = cls._build_prompt(theme, language)
+        parser = StoryStreamParser()
 
-        db.add(node)
-        db.flush()
+        title = ""
+        story_db = None
+        story_id = None  # Se guarda aparte: leer story_db.id tras un commit lo recargaría con un SELECT
+        root_node = None
+        node_ids = {}  # Ruta de las ramas de primer nivel guardadas -> ID en la base de datos
+        branch = []  # Nodos cerrados de la rama en curso: (ruta, datos)
 
-        # Si no es un final y tiene opciones, procesa las opciones recursivamente
-        if not node.is_ending and (hasattr(node_data, "options") and node_data.options):
-            options_list = []
-            for option_data in node_data.options:
-                next_node = option_data.next_node
+        def ensure_root(fields):
+            nonlocal story_db, story_id, root_node
+            # Incompleta hasta validar el árbol: no debe cachearse su respuesta
+            story_db = Story(title=title, session_id=session_id, theme=theme, language=language, is_complete=False)
+            db.add(story_db)
+            db.flush()
+            story_id = story_db.id
+            root_node = StoryNode(
+                story_id=story_id,
+                content=fields.get("content", ""),
+                path=node_path(()),
+                depth=0,
+                is_root=True,
+                is_ending=bool(fields.get("isEnding", False)),
+                is_winning_ending=bool(fields.get("isWinningEnding", False)),
+                options=[]
+            )
+            db.add(root_node)
+            db.flush()
+            story_db.root_node_id = root_node.id
+            db.commit()
 
-                if isinstance(next_node, dict):
-                    next_node = StoryNodeLLM.model_validate(next_node)
+        # "llm" incluye las escrituras de cada rama a medida que terminan
+        stream_started = first_chunk_at = time.perf_counter()
+        for chunk in llm.stream(prompt):
+            if first_chunk_at == stream_started:
+                first_chunk_at = time.perf_counter()
+                STAGE_SECONDS.observe(first_chunk_at - stream_started, mode="streaming", stage="first_chunk")
+            for event in parser.feed(cls._chunk_text(chunk)):
+                if isinstance(event, TitleEvent):
+                    title = event.title
+                    if story_db is not None:
+                        story_db.title = title
 
-                # Llamada recursiva para crear el nodo hijo
-                child_node = cls._process_story_node(db, story_id, next_node, False)
+                elif isinstance(event, NodeHeaderEvent) and event.path == ():
+                    ensure_root(event.fields)
 
-                options_list.append({
-                    "text": option_data.text,
-                    "node_id": child_node.id
-                })
+                elif isinstance(event, NodeClosedEvent) and event.path != ():
+                    # Nodo intermedio u hoja: se guarda en memoria hasta que cierre su rama
+                    branch.append((event.path, event.data))
+
+                    # Al cerrarse una rama de primer nivel se escribe entera y la raíz gana una opción jugable
+                    if len(event.path) == 1:
+                        branch_ids = persist_streamed_branch(db, story_id, branch)
+                        branch = []
+                        node_ids[event.path] = branch_ids[event.path]
+                        first_branch = not root_node.options
+                        root_node.options = root_node.options + [
+                            {"text": event.option_text or "", "node_id": node_ids[event.path]}
+                        ]
+                        db.commit()
+                        # Después del commit no se leen atributos (recargarlos tomaría una conexión hasta la próxima rama)
+                        if on_root_ready is not None and first_branch:
+                            on_root_ready(story_db)
+
+        STAGE_SECONDS.observe(time.perf_counter() - stream_started, mode="streaming", stage="llm")
+
+        # Valida el árbol completo; si el stream no permitió guardarlo por partes, se guarda entero
+        story_structure = cls._parse_response(parser.text, mode="streaming")
+        persist_started = time.perf_counter()
+        if story_db is None:
+            story_db = save_story_tree(db, session_id, story_structure, theme, language)
+        else:
+            story_db.title = story_structure.title
+            story_db.is_complete = True
+            root_node.content = story_structure.rootNode.content
+            if not root_node.is_ending:
+                root_node.options = [
+                    {"text": option.text, "node_id": node_ids[(i,)]}
+                    for i, option in enumerate(story_structure.rootNode.options or [])
+                    if (i,) in node_ids
+                ]
+            # Los nodos se guardaron por partes: se analiza lo que quedó en la base de datos
+            db.flush()
+            analyze_stored_story(db, story_db)
+
+        db.commit()
+        finished = time.perf_counter()
+        STAGE_SECONDS.observe(finished - persist_started, mode="streaming", stage="persist")
+        STAGE_SECONDS.observe(finished - started, mode="streaming", stage="total")
+        return story_db
+
+
+class AsyncStoryGenerator(StoryGenerator):
+    """
+    Variante asíncrona de StoryGenerator.
+
+    Usa `ainvoke` de LangChain y una `AsyncSession` de SQLAlchemy. La conexión a la
+    base de datos solo se abre para la fase corta de escritura, no durante la
+    llamada al LLM, por lo que muchas generaciones concurrentes cuestan corrutinas
+    en lugar de threads y conexiones del pool.
+    """
+
+    @classmethod
+    async def generate_story(cls, session_id: str, theme: str = "fantasy", language: Optional[str] = None, on_saved=None) -> Story:
+        """
+        Genera una nueva historia de forma asíncrona.
+
+        Args:
+            session_id (str): Identificador de la sesión del usuario.
+            theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
+            on_saved: Callback opcional `on_saved(db, story)` que se ejecuta tras el
+                commit con la sesión síncrona de la misma AsyncSession (ver `_save_story`).
+
+        Returns:
+            Story: El objeto de historia creado y guardado en la base de datos.
+        """
+        with STAGE_SECONDS.time(mode="async", stage="total"):
+            llm = cls._get_llm()
+            with STAGE_SECONDS.time(mode="async", stage="prompt"):
+                prompt = cls._build_prompt(theme, language)
+
+            # La espera del LLM no bloquea ningún thread ni conexión de la base de datos
+            with STAGE_SECONDS.time(mode="async", stage="llm"):
+                raw_response = await llm.ainvoke(prompt)
+            story_structure = cls._parse_response(raw_response, mode="async")
+
+            # Fase de escritura: una sesión corta solo para guardar el árbol
+            with STAGE_SECONDS.time(mode="async", stage="persist"):
+                story_db = await cls._save_story(session_id, story_structure, theme, language, on_saved)
+        return story_db
+
+    @staticmethod
+    async def _save_story(
+        session_id: str, story_structure: StoryLLMResponse, theme: str, language: Optional[str], on_saved=None
+    ) -> Story:
+        """
+        Guarda el árbol con una AsyncSession corta. `on_saved(db, story)` corre
+        después del commit en la misma sesión (con `run_sync`), por ejemplo para
+        serializar la respuesta de la historia sin abrir otra conexión del pool.
+        """
+        async with get_async_sessionmaker()() as db:
+            story_db = await save_story_tree_async(db, session_id, story_structure, theme, language)
+            await db.commit()
+            if on_saved is not None:
+                await db.run_sync(on_saved, story_db)
+        return story_db
+
+    @classmethod
+    async def _agenerate_fanout_branch(cls, llm, prompt) -> StoryNodeLLM:
+        """Variante asíncrona de `_generate_fanout_branch`."""
+        for attempt in range(settings.FANOUT_BRANCH_RETRIES + 1):
+            try:
+                return cls._parse_fanout_branch(await llm.ainvoke(prompt, shape="branch"))
+            except Exception:
+                if attempt >= settings.FANOUT_BRANCH_RETRIES:
+                    raise
+                FANOUT_BRANCH_RETRIES.inc()
+
+    @classmethod
+    async def generate_story_fanout(cls, session_id: str, theme: str = "fantasy", language: Optional[str] = None, on_saved=None) -> Story:
+        """
+        Variante asíncrona de `StoryGenerator.generate_story_fanout`: las ramas
+        son corrutinas limitadas por un semáforo de FANOUT_CONCURRENCY.
+
+        Args:
+            session_id (str): Identificador de la sesión del usuario.
+            theme (str): Tema de la historia (por defecto 'fantasy').
+            language (str): Idioma de la historia (opcional).
+            on_saved: Callback opcional tras el commit (como en `generate_story`).
+
+        Returns:
+            Story: El objeto de historia creado y guardado en la base de datos.
+        """
+        with STAGE_SECONDS.time(mode="fanout", stage="total"):
+            llm = cls._get_llm()
+            with STAGE_SECONDS.time(mode="fanout", stage="prompt"):
+                prompt = cls._build_fanout_outline_prompt(theme, language)
+
+            llm_started = time.perf_counter()
+            with STAGE_SECONDS.time(mode="fanout", stage="outline"):
+                outline = cls._parse_outline(await llm.ainvoke(prompt, shape="outline"))
+
+            with STAGE_SECONDS.time(mode="fanout", stage="branches"):
+                semaphore = asyncio.Semaphore(max(1, settings.FANOUT_CONCURRENCY))
+
+                async def generate_branch(branch_prompt) -> StoryNodeLLM:
+                    async with semaphore:
+                        return await cls._agenerate_fanout_branch(llm, branch_prompt)
 
-            node.options = options_list
+                tasks = [
+                    asyncio.ensure_future(generate_branch(branch_prompt))
+                    for branch_prompt in cls._build_fanout_branch_prompts(outline, theme, language)
+                ]
+                try:
+                    branches = await asyncio.gather(*tasks)
+                except Exception:
+                    # Si una rama falla, las demás se cancelan
+                    for task in tasks:
+                        task.cancel()
+                    raise
+            STAGE_SECONDS.observe(time.perf_counter() - llm_started, mode="fanout", stage="llm")
 
-        db.flush()
-        return node
\ No newline at end of file
+            story_structure = cls._merge_fanout(outline, branches)
+            with STAGE_SECONDS.time(mode="fanout", stage="persist"):
+                story_db = await cls._save_story(session_id, story_structure, theme, language, on_saved)
+        return story_db
@@ -0,0 +1,141 @@
+"""
+Biblioteca de historias de una sesión (`GET /story`).
+
+Lista las historias que recibió la cookie `session_id`, de la más reciente a
+la más antigua. La pertenencia se lee de `story_jobs.session_id` (el job que
+entregó la historia) y no de `stories.session_id`: una historia del stock o
+reutilizada por la caché por tema (core/story_cache.py) se entrega a sesiones
+que no la generaron. Las historias aparecen mientras exista su job (ver
+JOB_RETENTION_COMPLETED_DAYS).
+
+La paginación es keyset: cada página pide los jobs cuyo `(created_at, id)` es
+menor que el del último entregado. Con el índice
+`ix_story_jobs_session_created_id` (session_id, created_at, id) cada página
+recorre solo sus filas, sin el OFFSET que crece con la profundidad.
+
+El cursor es opaco para el cliente: base64url del JSON `[created_at, id]` del
+job de la última historia de la página.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import String, literal, select, tuple_  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from models.job import StoryJob  # Jobs: qué sesión recibió cada historia
+from models.story import Story  # Modelo ORM
+from schemas.story import StoryLibraryResponse, StorySummaryResponse  # Schemas de respuesta
+
+# Columnas del resumen: nunca se leen los nodos ni el blob
+SUMMARY_COLUMNS = (
+    Story.id, Story.title, Story.created_at, Story.theme, Story.language, Story.is_complete,
+    Story.node_count, Story.winning_endings, Story.losing_endings, Story.has_winning_path, Story.expandable_nodes
+)
+
+
+class InvalidCursor(ValueError):
+    """El cursor no es uno devuelto por `GET /story`."""
+
+
+def encode_cursor(created_at: datetime, job_id: int) -> str:
+    """Cursor del job de la historia que cierra una página."""
+    raw = json.dumps([created_at.isoformat(), job_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        InvalidCursor: Si el cursor está mal formado.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor("Cursor inválido") from e
+
+
+def _created_at_bound(db: Session, created_at: datetime):
+    """
+    Valor de `created_at` para comparar con la columna.
+
+    SQLite guarda el `CURRENT_TIMESTAMP` del server_default como texto sin
+    microsegundos ("2025-01-01 10:00:00"), pero un datetime se enlaza con
+    microsegundos (".000000") y la comparación de textos deja de ser exacta
+    en los empates. Se compara con el mismo formato con que se guardó.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return created_at
+    value = created_at.strftime("%Y-%m-%d %H:%M:%S")
+    if created_at.microsecond:
+        value += f".{created_at.microsecond:06d}"
+    return literal(value, String)
+
+
+def _summary(row) -> StorySummaryResponse:
+    return StorySummaryResponse(
+        id=row.id,
+        title=row.title,
+        created_at=row.created_at,
+        theme=row.theme,
+        language=row.language,
+        is_complete=row.is_complete,
+        node_count=row.node_count,
+        winning_endings=row.winning_endings,
+        losing_endings=row.losing_endings,
+        has_winning_path=row.has_winning_path,
+        expandable_nodes=row.expandable_nodes or 0
+    )
+
+
+def received_stories_query(session_id: str):
+    """IDs de las historias que ya recibió la sesión (para no repetírselas)."""
+    return select(StoryJob.story_id).where(StoryJob.session_id == session_id, StoryJob.story_id.isnot(None))
+
+
+def received_story_ids(db: Session, session_id: str) -> Set[int]:
+    """Ejecuta `received_stories_query` con una sesión síncrona."""
+    return set(db.scalars(received_stories_query(session_id)))
+
+
+def list_session_stories(db: Session, session_id: str, cursor: Optional[str], limit: int) -> StoryLibraryResponse:
+    """
+    Una página de historias de la sesión, de la más reciente a la más antigua.
+
+    Args:
+        db: Sesión de base de datos.
+        session_id: Sesión del jugador.
+        cursor: `next_cursor` de la página anterior (None para la primera).
+        limit: Historias por página.
+
+    Returns:
+        StoryLibraryResponse con las historias y el cursor de la página siguiente
+        (None si no hay más).
+
+    Raises:
+        InvalidCursor: Si el cursor está mal formado.
+    """
+    query = (
+        select(*SUMMARY_COLUMNS, StoryJob.created_at.label("received_at"), StoryJob.id.label("job_row_id"))
+        .select_from(StoryJob)
+        .join(Story, Story.id == StoryJob.story_id)
+        .where(StoryJob.session_id == session_id)
+        .order_by(StoryJob.created_at.desc(), StoryJob.id.desc())
+        .limit(limit + 1)  # Una de más para saber si hay otra página
+    )
+    if cursor:
+        created_at, job_id = decode_cursor(cursor)
+        query = query.where(tuple_(StoryJob.created_at, StoryJob.id) < tuple_(_created_at_bound(db, created_at), job_id))
+
+    rows = db.execute(query).all()
+    page: List = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last.received_at, last.job_row_id)
+    return StoryLibraryResponse(stories=[_summary(row) for row in page], next_cursor=next_cursor)
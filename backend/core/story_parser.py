@@ -0,0 +1,169 @@
+"""
+Parseo y validación de la respuesta del LLM en una sola pasada.
+
+Reemplaza a `PydanticOutputParser.parse` en la generación:
+1. Extrae el JSON aunque venga dentro de un bloque ```json``` o rodeado de texto.
+2. Lo decodifica con orjson (viene con fastapi[all]; si falta se usa json).
+3. Recorre el árbol sin validar para comprobar los límites de profundidad y de
+   nodos (STORY_MAX_DEPTH, STORY_MAX_NODES): una respuesta desmesurada falla
+   antes de construir ningún modelo.
+4. Valida el árbol completo con una sola llamada a `model_validate` sobre el
+   esquema recursivo de core/models.py.
+"""
+
+from typing import Any, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from core.config import settings  # Límites configurables
+from core.models import StoryLLMResponse  # Esquema recursivo de la historia
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+except ImportError:  # orjson viene con fastapi[all]
+    import json
+
+    _loads = json.loads
+    _DecodeError = json.JSONDecodeError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Delimitador de los bloques de código Markdown (```json ... ``` o ``` ... ```)
+_FENCE = "```"
+
+# Claves que apuntan al siguiente nodo (ver StoryOptionLLM.next_node)
+_NEXT_NODE_KEYS = ("next_node", "nextNode")
+
+
+class StoryParseError(ValueError):
+    """La respuesta del LLM no es una historia válida o supera los límites."""
+
+
+def extract_json_text(text: str) -> str:
+    """
+    Devuelve el fragmento JSON de la respuesta del LLM.
+
+    Acepta el JSON solo, dentro de un bloque de código o rodeado de texto
+    (se toma desde la primera "{" hasta la última "}").
+
+    Raises:
+        StoryParseError: Si no hay ningún objeto JSON.
+    """
+    stripped = text.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        return stripped
+
+    # Bloques de código: con str.find en lugar de una regex no codiciosa, que
+    # avanza carácter a carácter sobre respuestas de decenas de KB
+    start = text.find(_FENCE)
+    while start != -1:
+        end = text.find(_FENCE, start + len(_FENCE))
+        if end == -1:
+            break
+        block = text[start + len(_FENCE):end]
+        if block[:4].lower() == "json":
+            block = block[4:]
+        block = block.strip()
+        if block.startswith("{"):
+            return block
+        start = text.find(_FENCE, end + len(_FENCE))
+
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise StoryParseError("La respuesta del LLM no contiene un objeto JSON")
+    return text[start:end + 1]
+
+
+def check_tree_limits(data: Any, max_depth: int, max_nodes: int) -> int:
+    """
+    Recorre el árbol sin validar y comprueba los límites.
+
+    Args:
+        data: JSON decodificado de la respuesta completa.
+        max_depth: Niveles máximos (la raíz es el nivel 1).
+        max_nodes: Nodos máximos.
+
+    Returns:
+        int: Cantidad de nodos.
+
+    Raises:
+        StoryParseError: Si supera algún límite.
+    """
+    root = data.get("rootNode") if isinstance(data, dict) else None
+    if not isinstance(root, dict):
+        raise StoryParseError("La respuesta del LLM no tiene rootNode")
+
+    count = 0
+    stack = [(root, 1)]
+    while stack:
+        node, depth = stack.pop()
+        count += 1
+        if count > max_nodes:
+            raise StoryParseError(f"La historia supera el máximo de {max_nodes} nodos")
+        if depth > max_depth:
+            raise StoryParseError(f"La historia supera la profundidad máxima de {max_depth} niveles")
+        options = node.get("options")
+        if not isinstance(options, list):
+            continue
+        for option in options:
+            if not isinstance(option, dict):
+                continue
+            child = next((option[key] for key in _NEXT_NODE_KEYS if key in option), None)
+            if isinstance(child, dict):
+                stack.append((child, depth + 1))
+    return count
+
+
+def _decode(text: str) -> Any:
+    """Extrae y decodifica el JSON de la respuesta del LLM."""
+    try:
+        return _loads(extract_json_text(text))
+    except _DecodeError as e:
+        raise StoryParseError(f"La respuesta del LLM no es JSON válido: {e}") from e
+
+
+def parse_json_model(text: str, model: Type[ModelT]) -> ModelT:
+    """
+    Convierte el texto del LLM en cualquier modelo Pydantic (p. ej. el esquema
+    del modo "fanout"), con la misma extracción y decodificación que `parse_story`
+    pero sin límites de árbol.
+
+    Raises:
+        StoryParseError: Si no es JSON o no cumple el esquema.
+    """
+    data = _decode(text)
+    try:
+        return model.model_validate(data)
+    except ValidationError as e:
+        raise StoryParseError(f"La respuesta del LLM no cumple el esquema: {e}") from e
+
+
+def parse_story(text: str, max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> StoryLLMResponse:
+    """
+    Convierte el texto del LLM en una historia validada.
+
+    Args:
+        text: Respuesta completa del LLM.
+        max_depth: Profundidad máxima (por defecto STORY_MAX_DEPTH).
+        max_nodes: Nodos máximos (por defecto STORY_MAX_NODES).
+
+    Returns:
+        StoryLLMResponse: El árbol completo validado.
+
+    Raises:
+        StoryParseError: Si no es JSON, supera los límites o no cumple el esquema.
+    """
+    data = _decode(text)
+
+    check_tree_limits(
+        data,
+        settings.STORY_MAX_DEPTH if max_depth is None else max_depth,
+        settings.STORY_MAX_NODES if max_nodes is None else max_nodes
+    )
+    try:
+        return StoryLLMResponse.model_validate(data)
+    except ValidationError as e:
+        raise StoryParseError(f"La respuesta del LLM no cumple el esquema: {e}") from e
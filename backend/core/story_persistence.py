@@ -0,0 +1,313 @@
+"""
+Persistencia de los árboles de historias generados por el LLM.
+
+En lugar de insertar nodo por nodo (un flush por nodo y otro para actualizar
+sus opciones), el árbol validado se recorre una sola vez, se reservan los IDs
+de todos los nodos por adelantado y se escriben todas las filas de
+`story_nodes` (con sus opciones ya resueltas) en un único INSERT masivo.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import func, insert, select, text, update  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.models import StoryLLMResponse, StoryNodeLLM  # Esquemas Pydantic de la respuesta del LLM
+from core.story_analysis import analyze_node_rows, apply_story_stats  # Estadísticas del árbol
+from models.story import Story, StoryNode  # Modelos ORM
+
+if TYPE_CHECKING:
+    # Solo para anotaciones: el pipeline síncrono no necesita greenlet
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _as_node(node_data: Union[StoryNodeLLM, Dict[str, Any]]) -> StoryNodeLLM:
+    """
+    Convierte un nodo en dict en un StoryNodeLLM validado. Los árboles que
+    salen de `parse_story` ya están validados enteros y se usan tal cual.
+    """
+    if isinstance(node_data, dict):
+        return StoryNodeLLM.model_validate(node_data)
+    return node_data
+
+
+def flatten_story_tree(root_node: Union[StoryNodeLLM, Dict[str, Any]], max_levels: Optional[int] = None) -> List[Tuple[StoryNodeLLM, List[Tuple[str, int]]]]:
+    """
+    Recorre el árbol en preorden y lo aplana en una lista.
+
+    Args:
+        root_node: Nodo raíz de la historia.
+        max_levels: Niveles a conservar (la raíz es el nivel 1); los nodos del
+            último nivel quedan sin opciones. None conserva el árbol entero.
+
+    Returns:
+        Lista de tuplas (nodo, opciones), donde cada opción es (texto, índice
+        del nodo hijo dentro de la misma lista). El índice 0 es la raíz.
+    """
+    flat: List[Tuple[StoryNodeLLM, List[Tuple[str, int]]]] = []
+    stack = [(_as_node(root_node), None, None, 1)]  # (nodo, índice del padre, texto de la opción, nivel)
+
+    while stack:
+        node, parent_index, option_text, level = stack.pop()
+        index = len(flat)
+        flat.append((node, []))
+        if parent_index is not None:
+            flat[parent_index][1].append((option_text, index))
+
+        # Los finales no tienen opciones aunque el LLM las incluya
+        if not node.isEnding and node.options and level != max_levels:
+            # Se apilan en orden inverso para conservar el orden original de las opciones
+            for option in reversed(node.options):
+                stack.append((_as_node(option.next_node), index, option.text, level + 1))
+
+    return flat
+
+
+def node_path(option_indices: Sequence[int]) -> str:
+    """
+    Ruta materializada de un nodo a partir de los índices de opción desde la raíz.
+    Ejemplo: () -> "/", (0, 2) -> "/0/2/" (tercera opción de la primera opción).
+
+    Todos los descendientes de un nodo comparten su ruta como prefijo, lo que
+    permite leer un subárbol con una sola consulta por rango sobre el índice
+    (story_id, path).
+    """
+    return "/" + "".join(f"{index}/" for index in option_indices)
+
+
+def path_depth(path: str) -> int:
+    """Profundidad de un nodo según su ruta (la raíz tiene profundidad 0)."""
+    return path.count("/") - 1
+
+
+def _node_id_reservation_query(dialect_name: str, count: int):
+    """
+    Devuelve la consulta que reserva `count` IDs para nuevas filas de `story_nodes`.
+
+    - PostgreSQL: toma un bloque de la secuencia de la columna `id`.
+    - SQLite (y otros): usa MAX(id) + 1. Es seguro porque la transacción ya
+      tiene el lock de escritura tras insertar la historia.
+    """
+    if dialect_name == "postgresql":
+        return text(
+            "SELECT nextval(pg_get_serial_sequence('story_nodes', 'id')) FROM generate_series(1, :count)"
+        ).bindparams(count=count)
+    return select(func.coalesce(func.max(StoryNode.id), 0))
+
+
+def _node_ids_from_rows(dialect_name: str, rows: List[Any], count: int) -> List[int]:
+    """Convierte el resultado de `_node_id_reservation_query` en la lista de IDs."""
+    if dialect_name == "postgresql":
+        return [row[0] for row in rows]
+    max_id = rows[0][0]
+    return list(range(max_id + 1, max_id + 1 + count))
+
+
+def reserve_node_ids(db: Session, count: int) -> List[int]:
+    """
+    Reserva `count` IDs consecutivos para nuevas filas de `story_nodes`.
+
+    Args:
+        db: Sesión de base de datos (con una transacción de escritura abierta).
+        count: Cantidad de IDs a reservar.
+
+    Returns:
+        Lista de IDs reservados.
+    """
+    if count <= 0:
+        return []
+
+    dialect_name = db.get_bind().dialect.name
+    rows = db.execute(_node_id_reservation_query(dialect_name, count)).all()
+    return _node_ids_from_rows(dialect_name, rows, count)
+
+
+async def reserve_node_ids_async(db: "AsyncSession", count: int) -> List[int]:
+    """Versión asíncrona de `reserve_node_ids`."""
+    if count <= 0:
+        return []
+
+    dialect_name = db.get_bind().dialect.name
+    rows = (await db.execute(_node_id_reservation_query(dialect_name, count))).all()
+    return _node_ids_from_rows(dialect_name, rows, count)
+
+
+def build_node_rows(story_id: int, flat_nodes: List[Tuple[StoryNodeLLM, List[Tuple[str, int]]]], node_ids: List[int], base_path: str = "/") -> List[Dict[str, Any]]:
+    """
+    Construye las filas de `story_nodes` listas para un INSERT masivo.
+
+    Args:
+        story_id: ID de la historia a la que pertenecen los nodos.
+        flat_nodes: Árbol aplanado por `flatten_story_tree`.
+        node_ids: IDs reservados, uno por nodo y en el mismo orden.
+        base_path: Ruta del primer nodo ("/" para la raíz de la historia, o la
+            de un nodo existente al agregarle un subárbol).
+
+    Returns:
+        Lista de diccionarios con los valores de cada fila.
+    """
+    # En preorden cada padre aparece antes que sus hijos
+    paths = [base_path] + [""] * (len(flat_nodes) - 1)
+    rows = []
+    for index, (node, options) in enumerate(flat_nodes):
+        for position, (_, child_index) in enumerate(options):
+            paths[child_index] = f"{paths[index]}{position}/"
+        rows.append({
+            "id": node_ids[index],
+            "story_id": story_id,
+            "content": node.content,
+            "path": paths[index],
+            "depth": path_depth(paths[index]),
+            "is_root": index == 0 and base_path == "/",
+            "is_ending": node.isEnding,
+            "is_winning_ending": node.isWinningEnding,
+            "options": [
+                {"text": option_text, "node_id": node_ids[child_index]}
+                for option_text, child_index in options
+            ]
+        })
+    return rows
+
+
+def persist_story_tree(
+    db: Session,
+    session_id: str,
+    story_structure: StoryLLMResponse,
+    theme: Optional[str] = None,
+    language: Optional[str] = None,
+    pool_key: Optional[str] = None
+) -> Story:
+    """
+    Guarda una historia completa usando un único INSERT masivo para sus nodos.
+
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Args:
+        db: Sesión de base de datos.
+        session_id: Identificador de la sesión del usuario.
+        story_structure: Respuesta del LLM ya validada.
+        theme: Tema con el que se generó (se muestra en la biblioteca).
+        language: Idioma pedido (opcional).
+        pool_key: Clave del stock de historias pregeneradas (opcional).
+
+    Returns:
+        Story: El objeto de historia creado.
+    """
+    story_db = Story(
+        title=story_structure.title, session_id=session_id, theme=theme, language=language, pool_key=pool_key
+    )
+    db.add(story_db)
+    db.flush()  # Obtiene el ID de la historia (y el lock de escritura en SQLite)
+
+    flat_nodes = flatten_story_tree(story_structure.rootNode)
+    node_ids = reserve_node_ids(db, len(flat_nodes))
+    rows = build_node_rows(story_db.id, flat_nodes, node_ids)
+    db.execute(insert(StoryNode), rows)
+    story_db.root_node_id = node_ids[0]  # La raíz es el primer nodo en preorden
+    apply_story_stats(story_db, analyze_node_rows(rows, node_ids[0]))
+
+    return story_db
+
+
+async def persist_story_tree_async(
+    db: "AsyncSession",
+    session_id: str,
+    story_structure: StoryLLMResponse,
+    theme: Optional[str] = None,
+    language: Optional[str] = None
+) -> Story:
+    """
+    Versión asíncrona de `persist_story_tree` para una `AsyncSession`.
+
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+    """
+    story_db = Story(title=story_structure.title, session_id=session_id, theme=theme, language=language)
+    db.add(story_db)
+    await db.flush()
+
+    flat_nodes = flatten_story_tree(story_structure.rootNode)
+    node_ids = await reserve_node_ids_async(db, len(flat_nodes))
+    rows = build_node_rows(story_db.id, flat_nodes, node_ids)
+    await db.execute(insert(StoryNode), rows)
+    story_db.root_node_id = node_ids[0]  # La raíz es el primer nodo en preorden
+    apply_story_stats(story_db, analyze_node_rows(rows, node_ids[0]))
+
+    return story_db
+
+
+def persist_streamed_branch(db: Session, story_id: int, branch: List[Tuple[Tuple[int, ...], Dict[str, Any]]]) -> Dict[Tuple[int, ...], int]:
+    """
+    Guarda de una vez una rama de primer nivel recibida en streaming.
+
+    La generación en streaming acumula en memoria los nodos de la rama a medida
+    que se cierran y los escribe aquí cuando la rama termina: la transacción
+    dura lo que un INSERT masivo y no los segundos de tokens del LLM.
+
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Args:
+        db: Sesión de base de datos.
+        story_id: ID de la historia.
+        branch: (ruta de índices de opción, datos del nodo) en el orden en que se
+            cerraron (cada nodo después de sus hijos).
+
+    Returns:
+        Dict ruta -> ID asignado a cada nodo de la rama.
+    """
+    # Primero se escribe la historia: en SQLite toma el lock de escritura antes de reservar IDs con MAX(id)
+    db.execute(update(Story).where(Story.id == story_id).values(is_complete=False))
+    node_ids = dict(zip((path for path, _ in branch), reserve_node_ids(db, len(branch))))
+
+    rows = []
+    for path, data in branch:
+        is_ending = bool(data.get("isEnding", False))
+        rows.append({
+            "id": node_ids[path],
+            "story_id": story_id,
+            "content": data.get("content", ""),
+            "path": node_path(path),
+            "depth": len(path),
+            "is_root": False,
+            "is_ending": is_ending,
+            "is_winning_ending": bool(data.get("isWinningEnding", False)),
+            "options": [] if is_ending else [
+                {"text": option.get("text", ""), "node_id": node_ids[path + (i,)]}
+                for i, option in enumerate(data.get("options") or [])
+                if path + (i,) in node_ids
+            ]
+        })
+    db.execute(insert(StoryNode), rows)
+    return node_ids
+
+
+def backfill_node_paths(db: Session, story_id: int) -> int:
+    """
+    Calcula `path` y `depth` de los nodos de una historia guardada antes de
+    que existieran esas columnas, siguiendo las opciones desde la raíz.
+
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Returns:
+        int: Cantidad de nodos actualizados.
+    """
+    nodes = db.execute(
+        select(StoryNode.id, StoryNode.is_root, StoryNode.options).where(StoryNode.story_id == story_id)
+    ).all()
+    options_by_id = {node_id: options or [] for node_id, _, options in nodes}
+    stack = [(node_id, node_path(())) for node_id, is_root, _ in nodes if is_root]
+
+    rows = []
+    seen = set()
+    while stack:
+        node_id, path = stack.pop()
+        if node_id in seen or node_id not in options_by_id:
+            continue
+        seen.add(node_id)
+        rows.append({"id": node_id, "path": path, "depth": path_depth(path)})
+        for position, option in enumerate(options_by_id[node_id]):
+            if option.get("node_id") is not None:
+                stack.append((option["node_id"], f"{path}{position}/"))
+
+    if rows:
+        db.execute(update(StoryNode), rows)
+    return len(rows)
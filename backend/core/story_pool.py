@@ -0,0 +1,241 @@
+"""
+Inventario de historias pregeneradas para los temas más populares.
+
+Un replenisher en segundo plano mantiene, para los N temas más pedidos en
+`story_jobs`, un stock de historias completas sin asignar (`stories.pool_key`
+no nulo). Cuando llega un job con uno de esos temas se completa al instante
+reclamando una historia del stock y asignándole el `session_id` del jugador.
+
+Cada proceso de la API (o cada worker) arranca su replenisher; en PostgreSQL un
+advisory lock hace que solo uno de ellos ejecute cada pasada.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, update  # Construcción de consultas SQL
+from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+
+from core.config import settings  # Configuración de la aplicación
+from core.story_cache import normalize_language, normalize_theme  # Normalización compartida con la caché
+from db.database import SessionLocal, engine  # Sesiones y motor para el thread del replenisher
+from models.job import StoryJob  # Modelo ORM del trabajo
+from models.story import Story  # Modelo ORM de la historia
+
+logger = logging.getLogger(__name__)
+
+
+def pool_key(theme: str, language: Optional[str]) -> str:
+    """Clave del stock: tema normalizado + idioma. Ejemplo: "fantasy|es"."""
+    return f"{normalize_theme(theme)}|{normalize_language(language)}"
+
+
+class PoolMetrics:
+    """Contadores de aciertos/fallos del stock (seguros entre threads)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.generation_errors = 0
+
+    def record(self, **increments: int):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "generated": self.generated,
+                "generation_errors": self.generation_errors,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def claim_pooled_story(db: Session, theme: str, language: Optional[str], session_id: str) -> Optional[int]:
+    """
+    Reclama atómicamente una historia del stock y la asigna a la sesión.
+    No hace commit: el llamador confirma junto con la actualización del job.
+
+    Returns:
+        El ID de la historia reclamada o None si no hay stock para el tema.
+    """
+    key = pool_key(theme, language)
+    candidate = select(Story.id).where(Story.pool_key == key).order_by(Story.id).limit(1)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Dos peticiones concurrentes nunca reclaman la misma fila
+        story_id = db.execute(candidate.with_for_update(skip_locked=True)).scalar_one_or_none()
+        if story_id is not None:
+            db.execute(
+                update(Story)
+                .where(Story.id == story_id)
+                .values(pool_key=None, session_id=session_id)
+                .execution_options(synchronize_session=False)
+            )
+    else:
+        story_id = db.execute(
+            update(Story)
+            .where(Story.id == candidate.scalar_subquery(), Story.pool_key == key)
+            .values(pool_key=None, session_id=session_id)
+            .returning(Story.id)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+
+    if story_id is not None:
+        pool_metrics.record(hits=1)
+    else:
+        pool_metrics.record(misses=1)
+    return story_id
+
+
+def top_theme_keys(db: Session, limit: int, window_days: int) -> List[Tuple[str, str, str]]:
+    """
+    Temas más pedidos en la ventana indicada, agrupados por clave normalizada.
+
+    Returns:
+        Lista de (clave, tema, idioma) ordenada por frecuencia.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=window_days)
+    rows = db.execute(
+        select(StoryJob.theme, StoryJob.language, func.count().label("total"))
+        .where(StoryJob.created_at >= since)
+        .group_by(StoryJob.theme, StoryJob.language)
+        .order_by(func.count().desc())
+        .limit(limit * 20)  # Variantes del mismo tema ("Fantasy", "fantasy ") se suman abajo
+    ).all()
+
+    counts: Counter = Counter()
+    samples: Dict[str, Tuple[str, str]] = {}
+    for theme, language, total in rows:
+        key = pool_key(theme, language)
+        counts[key] += total
+        samples.setdefault(key, (theme, language))
+    return [(key, *samples[key]) for key, _ in counts.most_common(limit)]
+
+
+@contextmanager
+def replenisher_lock():
+    """
+    Lock entre procesos para una pasada de reposición: produce True si este
+    proceso la ejecuta.
+
+    En PostgreSQL es un advisory lock de sesión sobre una conexión propia, fuera
+    de toda transacción; los demás procesos no esperan, saltean la pasada. Como
+    en las migraciones, en otros motores (SQLite, un único host) no se bloquea.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as connection:
+        acquired = connection.execute(text("SELECT pg_try_advisory_lock(hashtext('story_pool_replenisher'))")).scalar()
+        connection.commit()  # El lock es de sesión: la conexión no queda "idle in transaction"
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(hashtext('story_pool_replenisher'))"))
+                connection.commit()
+
+
+def pool_levels(db: Session) -> Dict[str, int]:
+    """Cantidad de historias disponibles en el stock por clave."""
+    rows = db.execute(
+        select(Story.pool_key, func.count()).where(Story.pool_key.isnot(None)).group_by(Story.pool_key)
+    ).all()
+    return {key: total for key, total in rows}
+
+
+class StoryPoolReplenisher:
+    """
+    Thread que rellena el stock periódicamente sin superar el presupuesto
+    de generaciones por hora (`STORY_POOL_MAX_GENERATIONS_PER_HOUR`).
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._recent_generations: deque = deque()  # Timestamps de la última hora
+
+    def _budget_available(self) -> bool:
+        now = time.monotonic()
+        while self._recent_generations and now - self._recent_generations[0] > 3600:
+            self._recent_generations.popleft()
+        return len(self._recent_generations) < settings.STORY_POOL_MAX_GENERATIONS_PER_HOUR
+
+    def run_once(self) -> int:
+        """
+        Ejecuta una pasada de reposición, salvo que otro proceso ya la esté ejecutando.
+
+        Returns:
+            int: Historias generadas en esta pasada.
+        """
+        with replenisher_lock() as acquired:
+            if not acquired:
+                return 0
+            return self._replenish()
+
+    def _replenish(self) -> int:
+        # Import diferido: core.story_generator importa los clientes de LLM
+        from core.story_generator import StoryGenerator
+
+        db = SessionLocal()
+        generated = 0
+        try:
+            targets = top_theme_keys(db, settings.STORY_POOL_TOP_THEMES, settings.STORY_POOL_THEME_WINDOW_DAYS)
+            levels = pool_levels(db)
+
+            for key, theme, language in targets:
+                while levels.get(key, 0) < settings.STORY_POOL_SIZE_PER_THEME:
+                    if self._stop.is_set() or not self._budget_available():
+                        return generated
+                    self._recent_generations.append(time.monotonic())
+                    try:
+                        # La historia entra al stock en la misma transacción que la guarda
+                        StoryGenerator.generate_story(db, None, theme, language, pool_key=key)
+                    except Exception:
+                        db.rollback()
+                        pool_metrics.record(generation_errors=1)
+                        logger.exception("Error generando una historia para el stock de '%s'", key)
+                        break
+                    levels[key] = levels.get(key, 0) + 1
+                    generated += 1
+                    pool_metrics.record(generated=1)
+            return generated
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Error reponiendo el stock de historias")
+            self._stop.wait(settings.STORY_POOL_REFILL_INTERVAL_SECONDS)
+
+    def start(self):
+        """Arranca el thread del replenisher (idempotente)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="story-pool-replenisher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Pide al replenisher que se detenga tras la generación en curso."""
+        self._stop.set()
+
+
+story_pool_replenisher = StoryPoolReplenisher()
@@ -0,0 +1,268 @@
+"""
+Acceso a los árboles de historias independiente de cómo estén guardados.
+
+Hay dos formatos de almacenamiento (`STORY_STORAGE_BACKEND`):
+- "rows": una fila de `story_nodes` por nodo (formato original).
+- "blob": el árbol completo en `stories.tree_blob` (ver core/story_blob.py).
+
+Las lecturas aceptan ambos formatos a la vez: las historias existentes siguen
+siendo legibles después de cambiar el formato por defecto o durante una
+migración con `scripts/migrate_story_storage.py`. La generación en streaming
+siempre escribe filas, porque el jugador recorre la historia mientras se guarda.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from sqlalchemy import delete, insert, literal, select  # Construcción de consultas SQL
+from sqlalchemy.orm import Session, aliased  # Tipo para la sesión de base de datos
+
+from core.config import settings  # Configuración de la aplicación
+from core.models import StoryLLMResponse  # Esquema Pydantic de la respuesta del LLM
+from core.story_analysis import STATS_COLUMNS, analyze_blob_nodes, apply_story_stats, stats_response  # Estadísticas del árbol
+from core.story_blob import (  # Formato compacto de una sola columna
+    StoryBlob, blob_nodes_from_flat, blob_nodes_from_rows, encode_story_blob, format_name
+)
+from core.story_persistence import (  # Escritura masiva de filas
+    build_node_rows, flatten_story_tree, persist_story_tree, persist_story_tree_async, reserve_node_ids
+)
+from models.story import Story, StoryNode  # Modelos ORM
+from schemas.story import CompleteStoryNodeResponse, CompleteStoryResponse, StoryNodeTreeResponse  # Schemas de respuesta
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# Columnas de estadísticas que se leen junto con los nodos
+STATS_SELECT = [getattr(Story, column) for column in STATS_COLUMNS]
+
+
+def _node_response(node: Any) -> CompleteStoryNodeResponse:
+    """Convierte un nodo (fila de `story_nodes` o dict del blob) a su schema de respuesta."""
+    if isinstance(node, dict):
+        return CompleteStoryNodeResponse.model_validate(node)
+    return CompleteStoryNodeResponse(
+        id=node.id,
+        content=node.content,
+        is_ending=node.is_ending,
+        is_winning_ending=node.is_winning_ending,
+        options=node.options,  # Las opciones ya están en formato JSON
+        is_expandable=node.is_expandable
+    )
+
+
+def _new_blob_story(
+    session_id: Optional[str],
+    story_structure: StoryLLMResponse,
+    theme: Optional[str],
+    language: Optional[str],
+    pool_key: Optional[str] = None
+) -> Story:
+    codec = settings.STORY_BLOB_CODEC
+    serialization = settings.STORY_BLOB_SERIALIZATION
+    nodes = blob_nodes_from_flat(flatten_story_tree(story_structure.rootNode))
+    story = Story(
+        title=story_structure.title,
+        session_id=session_id,
+        theme=theme,
+        language=language,
+        pool_key=pool_key,
+        tree_blob=encode_story_blob(nodes, codec, serialization),
+        tree_format=format_name(codec, serialization)
+    )
+    apply_story_stats(story, analyze_blob_nodes(nodes))
+    return story
+
+
+def save_story_tree(
+    db: Session,
+    session_id: Optional[str],
+    story_structure: StoryLLMResponse,
+    theme: Optional[str] = None,
+    language: Optional[str] = None,
+    pool_key: Optional[str] = None
+) -> Story:
+    """
+    Guarda una historia completa en el formato configurado, con el tema y
+    el idioma con los que se generó. Con `pool_key` la historia entra al stock
+    en el mismo INSERT (ver core/story_pool.py).
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+    """
+    if settings.STORY_STORAGE_BACKEND == "blob":
+        story_db = _new_blob_story(session_id, story_structure, theme, language, pool_key)
+        db.add(story_db)
+        db.flush()
+        return story_db
+    return persist_story_tree(db, session_id, story_structure, theme, language, pool_key)
+
+
+async def save_story_tree_async(
+    db: "AsyncSession",
+    session_id: Optional[str],
+    story_structure: StoryLLMResponse,
+    theme: Optional[str] = None,
+    language: Optional[str] = None
+) -> Story:
+    """Versión asíncrona de `save_story_tree` para una `AsyncSession`."""
+    if settings.STORY_STORAGE_BACKEND == "blob":
+        story_db = _new_blob_story(session_id, story_structure, theme, language)
+        db.add(story_db)
+        await db.flush()
+        return story_db
+    return await persist_story_tree_async(db, session_id, story_structure, theme, language)
+
+
+def load_complete_story(db: Session, story: Story) -> Optional[CompleteStoryResponse]:
+    """
+    Construye la historia completa con todos sus nodos.
+
+    Returns:
+        CompleteStoryResponse o None si la historia no tiene nodo raíz.
+    """
+    if story.tree_blob is not None:
+        nodes = [_node_response(node) for node in StoryBlob(story.tree_blob).nodes()]
+        root_node = nodes[0] if nodes else None  # El blob está en preorden
+    else:
+        rows = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
+        nodes = [_node_response(row) for row in rows]
+        # Encontrar el nodo raíz (el punto de inicio de la historia); las
+        # historias anteriores a la migración 0003 pueden no tener root_node_id
+        if story.root_node_id is not None:
+            root_node = next((node for node in nodes if node.id == story.root_node_id), None)
+        else:
+            root_node = next((node for node, row in zip(nodes, rows) if row.is_root), None)
+
+    if root_node is None:
+        return None
+
+    node_dict = {node.id: node for node in nodes}
+    return CompleteStoryResponse(
+        id=story.id,
+        title=story.title,
+        created_at=story.created_at,
+        root_node=root_node,  # Nodo de inicio
+        all_nodes=node_dict,  # Diccionario con todos los nodos por ID
+        stats=stats_response(story)  # Análisis guardado al generarla
+    )
+
+
+def load_node_subtree(db: Session, story_id: int, node_id: Optional[int], prefetch: int) -> Optional[StoryNodeTreeResponse]:
+    """
+    Lee un nodo y sus descendientes hasta `prefetch` niveles.
+
+    Con filas es una sola consulta: los descendientes de un nodo son las filas
+    de la misma historia cuya ruta empieza por la del nodo. La condición de
+    prefijo se expresa como rango (path >= ruta y path < ruta + ":") para que
+    use el índice (story_id, path): las rutas solo contienen dígitos y "/", y
+    ":" es el carácter siguiente al "9". Si la historia está guardada como
+    blob se lee la fila de la historia y se recorre su tabla de offsets.
+
+    Args:
+        db: Sesión de base de datos
+        story_id: ID de la historia
+        node_id: ID del nodo (None para la raíz)
+        prefetch: Niveles de hijos a incluir
+
+    Returns:
+        StoryNodeTreeResponse o None si el nodo no pertenece a la historia
+    """
+    target = aliased(StoryNode)
+    query = (
+        select(StoryNode, Story.title, Story.is_complete, *STATS_SELECT)
+        .join(target, target.story_id == StoryNode.story_id)
+        .join(Story, Story.id == target.story_id)
+        .where(
+            target.story_id == story_id,
+            StoryNode.path >= target.path,
+            StoryNode.path < target.path + literal(":"),
+            StoryNode.depth <= target.depth + prefetch
+        )
+        .order_by(StoryNode.path)
+    )
+    if node_id is None:
+        query = query.where(target.is_root)
+    else:
+        query = query.where(target.id == node_id)
+
+    rows = db.execute(query).all()
+    if rows:
+        # El primero en orden de ruta es el nodo pedido
+        return StoryNodeTreeResponse(
+            story_id=story_id,
+            title=rows[0].title,
+            node_id=rows[0].StoryNode.id,
+            nodes={row.StoryNode.id: _node_response(row.StoryNode) for row in rows},
+            stats=stats_response(rows[0]),
+            is_complete=rows[0].is_complete
+        )
+
+    story = db.execute(
+        select(Story.title, Story.tree_blob, Story.is_complete, *STATS_SELECT).where(Story.id == story_id, Story.tree_blob.isnot(None))
+    ).first()
+    if story is None:
+        return None
+    node_id = 1 if node_id is None else node_id
+    try:
+        nodes = StoryBlob(story.tree_blob).subtree(node_id, prefetch)
+    except KeyError:
+        return None
+    return StoryNodeTreeResponse(
+        story_id=story_id,
+        title=story.title,
+        node_id=node_id,
+        nodes={node["id"]: _node_response(node) for node in nodes},
+        stats=stats_response(story),
+        is_complete=story.is_complete
+    )
+
+
+def convert_story_to_blob(db: Session, story: Story, codec: str, serialization: str) -> Dict[str, int]:
+    """
+    Pasa una historia guardada en filas al formato blob y borra sus filas.
+    Los IDs de nodo pasan a ser los IDs locales del blob: solo se usa con la API
+    detenida (ver scripts/migrate_story_storage.py).
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Returns:
+        Dict con la cantidad de nodos y el tamaño del blob en bytes.
+    """
+    rows = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
+    blob = encode_story_blob(blob_nodes_from_rows(rows), codec, serialization)
+    story.tree_blob = blob
+    story.tree_format = format_name(codec, serialization)
+    db.execute(delete(StoryNode).where(StoryNode.story_id == story.id))
+    story.root_node_id = None
+    return {"nodes": len(rows), "bytes": len(blob)}
+
+
+def convert_story_to_rows(db: Session, story: Story) -> Dict[str, int]:
+    """
+    Pasa una historia guardada como blob a filas de `story_nodes`, con IDs de
+    nodo nuevos: como `convert_story_to_blob`, solo con la API detenida.
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+
+    Returns:
+        Dict con la cantidad de nodos y el tamaño del blob que se liberó.
+    """
+    blob_nodes = StoryBlob(story.tree_blob).nodes()
+    node_ids = reserve_node_ids(db, len(blob_nodes))
+    flat_nodes = [
+        (
+            _BlobNodeView(node),
+            [(option["text"], option["node_id"] - 1) for option in node["options"]]
+        )
+        for node in blob_nodes
+    ]
+    db.execute(insert(StoryNode), build_node_rows(story.id, flat_nodes, node_ids))
+    story.root_node_id = node_ids[0]
+    released = len(story.tree_blob)
+    story.tree_blob = None
+    story.tree_format = None
+    return {"nodes": len(blob_nodes), "bytes": released}
+
+
+class _BlobNodeView:
+    """Adapta un nodo del blob a los atributos que espera `build_node_rows`."""
+
+    def __init__(self, node: Dict[str, Any]):
+        self.content = node["content"]
+        self.isEnding = node["is_ending"]
+        self.isWinningEnding = node["is_winning_ending"]
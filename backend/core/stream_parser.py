@@ -0,0 +1,196 @@
+"""
+Parser JSON incremental para la respuesta en streaming del LLM.
+
+Recibe el texto por fragmentos (tokens) y emite eventos en cuanto puede:
+- TitleEvent: el título de la historia ya está completo.
+- NodeHeaderEvent: un nodo tiene sus campos escalares (contenido, finales) y
+  empieza su lista de opciones.
+- NodeClosedEvent: el objeto de un nodo se cerró, con todo su subárbol.
+
+Los nodos se identifican por su ruta: la raíz es `()` y el hijo de la opción
+`i` de un nodo con ruta `p` es `p + (i,)`.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Claves del JSON que apuntan al siguiente nodo (el esquema usa next_node; el ejemplo del prompt, nextNode)
+NEXT_NODE_KEYS = ("next_node", "nextNode")
+
+# Caracteres que terminan un valor literal (número, true, false, null)
+_SCALAR_END = set(",}] \t\r\n")
+
+
+@dataclass
+class TitleEvent:
+    title: str
+
+
+@dataclass
+class NodeHeaderEvent:
+    path: Tuple[int, ...]
+    fields: Dict[str, Any]
+
+
+@dataclass
+class NodeClosedEvent:
+    path: Tuple[int, ...]
+    data: Dict[str, Any]
+    option_text: Optional[str] = None  # Texto de la opción que lleva a este nodo (si ya llegó)
+
+
+@dataclass
+class _Frame:
+    """Contenedor JSON abierto (objeto o arreglo) y su papel dentro de la historia."""
+    kind: str  # "object" o "array"
+    start: int  # Posición de la llave/corchete de apertura en el texto
+    role: str  # "top", "node", "options", "option" u "other"
+    path: Tuple[int, ...] = ()
+    key: Optional[str] = None  # Última clave leída (solo objetos)
+    expecting: str = "key"  # "key", "value" o "after_value"
+    count: int = 0  # Elementos iniciados (solo arreglos)
+    index: int = 0  # Posición dentro del arreglo de opciones (solo "option")
+    fields: Dict[str, Any] = field(default_factory=dict)  # Valores escalares ya completos
+
+
+class StoryStreamParser:
+    """
+    Parser incremental de la estructura StoryLLMResponse.
+
+    Uso:
+        parser = StoryStreamParser()
+        for chunk in llm.stream(prompt):
+            for event in parser.feed(chunk.content):
+                ...
+    """
+
+    def __init__(self):
+        self.text = ""  # Texto completo recibido hasta ahora
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+        self._events: List[Any] = []
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Agrega un fragmento de texto y devuelve los eventos que produjo."""
+        self.text += chunk
+        self._events = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            if self._done:
+                break
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string_end(i)
+                continue
+
+            if self._scalar_start is not None and ch in _SCALAR_END:
+                self._on_value(json.loads(text[self._scalar_start:i]))
+                self._scalar_start = None
+
+            if not self._stack:
+                # Ignora el texto antes del JSON (por ejemplo un bloque ```json)
+                if ch == "{":
+                    self._open("object", i)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._open("object" if ch == "{" else "array", i)
+            elif ch in "}]":
+                self._close(i)
+            elif ch == ":":
+                self._stack[-1].expecting = "value"
+            elif ch == ",":
+                if self._stack[-1].kind == "object":
+                    self._stack[-1].expecting = "key"
+            elif not ch.isspace() and self._scalar_start is None:
+                self._begin_value()
+                self._scalar_start = i
+
+        self._pos = len(text)
+        return self._events
+
+    def _begin_value(self):
+        """Registra que empieza un valor dentro del contenedor actual."""
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.kind == "array":
+            frame.count += 1
+
+    def _open(self, kind: str, start: int):
+        """Abre un objeto o arreglo y deduce su papel a partir del contenedor padre."""
+        parent = self._stack[-1] if self._stack else None
+        self._begin_value()
+        frame = _Frame(kind=kind, start=start, role="other")
+
+        if parent is None:
+            frame.role = "top"
+        elif parent.role == "top" and parent.key == "rootNode" and kind == "object":
+            frame.role = "node"
+        elif parent.role == "node" and parent.key == "options" and kind == "array":
+            frame.role, frame.path = "options", parent.path
+        elif parent.role == "options" and kind == "object":
+            frame.role, frame.path, frame.index = "option", parent.path, parent.count - 1
+        elif parent.role == "option" and parent.key in NEXT_NODE_KEYS and kind == "object":
+            frame.role, frame.path = "node", parent.path + (parent.index,)
+
+        self._stack.append(frame)
+
+    def _close(self, end: int):
+        """Cierra el contenedor actual y emite el evento del nodo si corresponde."""
+        frame = self._stack.pop()
+        if frame.role == "node":
+            parent = self._stack[-1] if self._stack else None
+            option_text = parent.fields.get("text") if parent is not None and parent.role == "option" else None
+            self._events.append(NodeClosedEvent(
+                path=frame.path,
+                data=json.loads(self.text[frame.start:end + 1]),
+                option_text=option_text
+            ))
+
+        if self._stack:
+            self._stack[-1].expecting = "after_value"
+        else:
+            self._done = True
+
+    def _on_string_end(self, end: int):
+        """Procesa un string completo: puede ser una clave o un valor."""
+        frame = self._stack[-1]
+        value = json.loads(self.text[self._string_start:end + 1])
+
+        if frame.kind == "object" and frame.expecting == "key":
+            frame.key = value
+            frame.expecting = "colon"
+            if frame.role == "node" and value == "options":
+                # Los campos escalares del nodo preceden a sus opciones
+                self._events.append(NodeHeaderEvent(path=frame.path, fields=dict(frame.fields)))
+            return
+
+        self._begin_value()
+        self._on_value(value)
+
+    def _on_value(self, value: Any):
+        """Guarda un valor escalar completo en el objeto actual."""
+        frame = self._stack[-1]
+        if frame.kind != "object":
+            return
+        if frame.role in ("top", "node", "option"):
+            frame.fields[frame.key] = value
+            if frame.role == "top" and frame.key == "title":
+                self._events.append(TitleEvent(title=value))
+        frame.expecting = "after_value"
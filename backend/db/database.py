@@ -3,16 +3,114 @@ Configuración de la base de datos usando SQLAlchemy.
 Define el motor de conexión, la sesión y funciones auxiliares para gestionar la DB.
 """
 
+import time
+from typing import Any, Dict
+
 # Imports de SQLAlchemy para manejar la base de datos
-from sqlalchemy import create_engine  # Crea la conexión con la base de datos
+from sqlalchemy import create_engine, event  # Crea la conexión con la base de datos y escucha sus eventos
 from sqlalchemy.orm import sessionmaker  # Fábrica para crear sesiones de DB
 from sqlalchemy.ext.declarative import declarative_base  # Base para los modelos ORM
+from sqlalchemy.engine import URL, make_url  # Para derivar la URL del driver asíncrono
+from sqlalchemy.pool import QueuePool  # Pool de conexiones por defecto
 
 from core.config import settings  # Configuración que contiene la URL de la DB
+from core.metrics import registry  # Métricas expuestas en /metrics
+
+POOL_CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Tiempo esperando una conexión libre del pool",
+    labelnames=("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+POOL_CONNECTIONS = registry.gauge(
+    "db_pool_connections",
+    "Conexiones del pool por estado",
+    labelnames=("pool", "state")
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que registra cuánto espera cada checkout por una conexión libre."""
+
+    metrics_label = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start, pool=self.metrics_label)
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(database_url: str, is_async: bool = False) -> Dict[str, Any]:
+    """
+    Opciones de `create_engine` según el motor (perfiles de conexión):
+    - Pool: tamaño, desborde, timeout, reciclado y pre-ping (DB_POOL_*).
+    - PostgreSQL: `statement_timeout` por conexión (POSTGRES_STATEMENT_TIMEOUT_MS).
+    - SQLite en memoria: se deja el pool por defecto (una conexión compartida).
+    Los PRAGMA de SQLite se aplican al conectar (`_apply_sqlite_pragmas`).
+    """
+    url = make_url(database_url)
+    if _is_memory_sqlite(url):
+        return {}
+
+    options: Dict[str, Any] = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if not is_async:
+        options["poolclass"] = TimedQueuePool
+
+    if url.get_backend_name() == "postgresql" and settings.POSTGRES_STATEMENT_TIMEOUT_MS:
+        timeout = str(settings.POSTGRES_STATEMENT_TIMEOUT_MS)
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL permite lecturas concurrentes con una escritura en curso, y `busy_timeout`
+    hace que un escritor espere el lock en lugar de fallar con "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.close()
 
 
-# Motor de base de datos: establece la conexión física con SQLite
-engine = create_engine(
+def build_engine(database_url: str, metrics_label: str = "primary"):
+    """Crea un motor síncrono con el perfil de `engine_options` y sus métricas de pool."""
+    options = engine_options(database_url)
+    if "poolclass" in options:
+        # Subclase por motor para etiquetar las métricas de cada pool por separado
+        options["poolclass"] = type(f"TimedQueuePool_{metrics_label}", (TimedQueuePool,), {"metrics_label": metrics_label})
+    new_engine = create_engine(database_url, **options)
+
+    if new_engine.dialect.name == "sqlite" and not _is_memory_sqlite(new_engine.url):
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    if isinstance(new_engine.pool, QueuePool):
+        pool = new_engine.pool
+        POOL_CONNECTIONS.set_function(pool.checkedout, pool=metrics_label, state="checked_out")
+        POOL_CONNECTIONS.set_function(pool.checkedin, pool=metrics_label, state="idle")
+        # `overflow()` empieza en -pool_size: solo cuentan las conexiones extra abiertas
+        POOL_CONNECTIONS.set_function(lambda: max(0, pool.overflow()), pool=metrics_label, state="overflow")
+    return new_engine
+
+
+# Motor de base de datos: establece la conexión física con la DB
+engine = build_engine(
     settings.DATABASE_URL  # URL leída desde .env (ej: sqlite:///./database.db)
 )
 
@@ -27,6 +125,10 @@ SessionLocal = sessionmaker(
 # Todos los modelos (Story, StoryNode, etc.) heredan de esta clase
 Base = declarative_base()
 
+# Réplica de solo lectura opcional: los GET de historias y jobs leen de aquí
+replica_engine = build_engine(settings.DATABASE_REPLICA_URL, "replica") if settings.DATABASE_REPLICA_URL else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else SessionLocal
+
 def get_db():
     """
     Generador que proporciona una sesión de base de datos.
@@ -39,9 +141,65 @@ def get_db():
     finally:
         db.close()  # Cierra la sesión al terminar (incluso si hay error)
 
+def get_read_db():
+    """
+    Como `get_db`, pero con una sesión de la réplica de lectura si está
+    configurada (DATABASE_REPLICA_URL). Solo para endpoints que no escriben.
+    La réplica puede ir unos instantes atrasada: si no encuentra algo recién
+    creado, el endpoint debe volver a buscarlo en la primaria.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Mapeo de drivers síncronos a sus equivalentes asíncronos
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+_async_sessionmaker = None
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Convierte la URL síncrona de la base de datos en su variante asíncrona.
+    Ejemplo: "postgresql://user@host/db" -> "postgresql+asyncpg://user@host/db"
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay driver asíncrono configurado para '{backend}'")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker():
+    """
+    Devuelve la fábrica de sesiones asíncronas (AsyncSession).
+    Se crea de forma perezosa para que los drivers asíncronos (aiosqlite/asyncpg)
+    solo sean necesarios cuando se usa el pipeline asíncrono.
+    """
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        async_url = get_async_database_url(settings.DATABASE_URL)
+        async_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+        if async_engine.dialect.name == "sqlite" and not _is_memory_sqlite(async_engine.url):
+            event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        _async_sessionmaker = async_sessionmaker(
+            async_engine,
+            autoflush=False,
+            expire_on_commit=False  # Los objetos siguen usables tras cerrar la sesión
+        )
+    return _async_sessionmaker
+
 def create_tables():
     """
     Crea todas las tablas definidas en los modelos si no existen.
-    Se ejecuta al iniciar la aplicación (llamado desde main.py).
+    Ya no se usa al arrancar (el esquema lo gestionan las migraciones de
+    migrations/); queda para scripts y bases de datos desechables.
     """
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
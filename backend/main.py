@@ -3,17 +3,51 @@ Archivo principal de la aplicación FastAPI.
 Configura el servidor, middlewares, y registra los routers de la API.
 """
 
+from contextlib import asynccontextmanager
+
 # Imports de FastAPI para crear la aplicación y manejar CORS
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Configuración de la aplicación y routers
 from core.config import settings  # Configuración centralizada desde variables de entorno
-from routers import story, job  # Routers que manejan los endpoints de historias y trabajos
-from db.database import create_tables  # Función para crear las tablas en la base de datos
+from routers import story, job, metrics, admin  # Routers de historias, trabajos, métricas y administración
+from db.database import engine  # Motor de la base de datos
+from migrations import upgrade  # Migraciones versionadas del esquema
+from core.story_pool import story_pool_replenisher  # Reposición del stock de historias pregeneradas
+from core.admission import generation_queue  # Cola de generaciones del proceso
+from core.job_queue import api_lease_renewer  # Leases de los jobs que genera este proceso
+from core.http_metrics import HTTPMetricsMiddleware  # Latencia HTTP por ruta para /metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Tareas de arranque y apagado de la aplicación.
+    Con AUTO_MIGRATE se aplican las migraciones pendientes al arrancar (en
+    producción build.sh ya las aplicó y esto no hace nada).
+    Con la cola durable el stock lo repone worker.py, no cada proceso de la API.
+    Sin ella, el proceso renueva los leases de los jobs que genera: si muere,
+    un worker los recupera.
+    Al apagar se espera a las generaciones encoladas en `generation_queue`.
+    """
+    if settings.AUTO_MIGRATE:
+        upgrade(engine)
 
-# Crear las tablas en la base de datos al iniciar la aplicación
-create_tables()
+    generates_jobs = settings.JOB_QUEUE_BACKEND != "sql"
+    if generates_jobs:
+        api_lease_renewer.start(settings.JOB_LEASE_SECONDS)
+
+    run_replenisher = settings.STORY_POOL_ENABLED and settings.JOB_QUEUE_BACKEND != "sql"
+    if run_replenisher:
+        story_pool_replenisher.start()
+    yield
+    if run_replenisher:
+        story_pool_replenisher.stop()
+    # Las generaciones encoladas terminan antes de apagar el proceso
+    await generation_queue.drain()
+    if generates_jobs:
+        api_lease_renewer.stop()
 
 
 # Configuración de la aplicación FastAPI
@@ -23,6 +57,7 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",   # URL donde estará la documentación interactiva (Swagger UI)
     redoc_url="/redoc", # URL para la documentación alternativa (ReDoc)
+    lifespan=lifespan,  # Arranque/apagado de tareas en segundo plano
 )
 
 
@@ -36,9 +71,14 @@ app.add_middleware(
     allow_headers=["*"],      # Permite todos los headers
 )
 
+# Latencia de cada request por ruta (se agrega último para medir también los demás middlewares)
+app.add_middleware(HTTPMetricsMiddleware)
+
 # Registro de routers con el prefijo /api
 app.include_router(story.router, prefix=settings.API_PREFIX)  # Endpoints de historias
 app.include_router(job.router, prefix=settings.API_PREFIX)    # Endpoints de trabajos
+app.include_router(admin.router, prefix=settings.API_PREFIX)  # Perfiles (requiere ADMIN_TOKEN)
+app.include_router(metrics.router)  # /metrics para Prometheus (sin prefijo)
 
 # Punto de entrada cuando se ejecuta directamente con Python
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+Reemplaza a `create_tables()` al importar `main.py`: cada cambio de esquema es
+un módulo en `migrations/versions/` (v0001_..., v0002_..., en orden) con una
+función `upgrade(op)`. Las versiones aplicadas se registran en la tabla
+`schema_migrations`.
+
+- En línea (`upgrade`): cada operación comprueba el esquema antes de ejecutarse,
+  así que también sirve para bases creadas antes con `create_all`.
+- Fuera de línea (`sql`): genera el script SQL para un dialecto sin conectarse,
+  para revisarlo o aplicarlo a mano (asume que la base está en la versión indicada).
+
+Uso (desde el directorio backend):
+    python -m migrations upgrade
+    python -m migrations status
+    python -m migrations sql --dialect postgresql [--from-version 0002]
+    python -m migrations check-plans
+    python -m migrations check-schema
+"""
+
+from migrations.runner import (  # API pública del subsistema
+    Operations, applied_versions, load_migrations, offline_sql, upgrade
+)
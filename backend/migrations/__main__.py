@@ -0,0 +1,83 @@
+"""
+CLI de migraciones (ver migrations/__init__.py).
+"""
+
+import argparse
+import logging
+import sys
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from migrations.runner import applied_versions, load_migrations, offline_sql, upgrade
+
+DIALECTS = {"postgresql": postgresql.dialect, "sqlite": sqlite.dialect}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Migraciones del esquema")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upgrade_parser = commands.add_parser("upgrade", help="Aplica las migraciones pendientes")
+    upgrade_parser.add_argument("--target", help="Última versión a aplicar (por defecto todas)")
+
+    commands.add_parser("status", help="Muestra las versiones aplicadas y pendientes")
+
+    sql_parser = commands.add_parser("sql", help="Genera el script SQL sin conectarse (fuera de línea)")
+    sql_parser.add_argument("--dialect", choices=sorted(DIALECTS), default="postgresql")
+    sql_parser.add_argument("--from-version", help="Versión en la que está la base (se generan las siguientes)")
+
+    plans_parser = commands.add_parser("check-plans", help="Verifica que las consultas frecuentes usen índices")
+    plans_parser.add_argument("--verbose", action="store_true", help="Muestra el plan completo de cada consulta")
+
+    commands.add_parser("check-schema", help="Verifica que las migraciones creen todas las columnas e índices de los modelos")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "sql":
+        sys.stdout.write(offline_sql(DIALECTS[args.dialect](), args.from_version))
+        return 0
+
+    # Import diferido: `sql` no necesita conexión ni driver
+    from db.database import engine
+
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.target)
+        print(f"Migraciones aplicadas: {', '.join(applied) if applied else 'ninguna (al día)'}")
+        return 0
+
+    if args.command == "status":
+        with engine.begin() as connection:
+            applied = applied_versions(connection)
+        for migration in load_migrations():
+            mark = "x" if migration.version in applied else " "
+            print(f"[{mark}] {migration.version} {migration.description}")
+        return 0
+
+    if args.command == "check-schema":
+        from migrations.schema import schema_differences
+
+        upgrade(engine)
+        differences = schema_differences(engine)
+        for difference in differences:
+            print(f"FALLA {difference}")
+        print(f"{len(differences)} diferencias con los modelos" if differences else "El esquema migrado cubre los modelos")
+        return 1 if differences else 0
+
+    from migrations.plans import check_query_plans
+
+    upgrade(engine)
+    failures = 0
+    for name, result in check_query_plans(engine).items():
+        ok = not result["problems"]
+        failures += not ok
+        print(f"{'OK   ' if ok else 'FALLA'} {name}")
+        if args.verbose or not ok:
+            for line in result["plan"]:
+                print(f"        {line}")
+    print(f"{failures} consultas sin el índice esperado" if failures else "Todas las consultas usan índices")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Verificación de planes de consulta (EXPLAIN) de las consultas más frecuentes.
+
+Falla si alguna deja de usar un índice, por ejemplo porque una migración
+borró o cambió un índice, o porque una consulta cambió de forma. Está pensado
+para correr en CI contra una base migrada: `python -m migrations check-plans`.
+
+- SQLite: EXPLAIN QUERY PLAN, y un "SCAN <tabla>" sin índice es un fallo.
+- PostgreSQL: EXPLAIN con `enable_seqscan = off`, y un "Seq Scan" es un fallo.
+  Con tablas pequeñas el planificador prefiere recorrerlas enteras; desactivar
+  el seq scan comprueba que exista un índice utilizable.
+
+Las consultas de EXPECTED_INDEXES además deben usar ese índice: usar otro
+índice no es un "SCAN", pero puede leer muchas más filas.
+"""
+
+import re
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import aliased
+
+from models.job import StoryJob
+from models.story import Story, StoryNode
+
+
+# Consulta -> índice que su plan debe nombrar
+EXPECTED_INDEXES = {
+    "raíz de una historia": "ux_story_nodes_root",
+    "subárbol por ruta (/node)": "ix_story_nodes_story_id_path",
+    "subárbol desde la raíz (/node sin nodo)": "ux_story_nodes_root",
+    "historias de una sesión (GET /story)": "ix_story_jobs_session_created_id",
+    "página siguiente de una sesión (cursor)": "ix_story_jobs_session_created_id",
+}
+
+
+def hot_queries() -> Dict[str, object]:
+    """Consultas de los endpoints y de la cola que deben usar índices."""
+    target = aliased(StoryNode)
+    return {
+        "job por job_id (GET /job/{id})": select(StoryJob).where(StoryJob.job_id == "job"),
+        "job pending más antiguo (cola durable)": (
+            select(StoryJob.id).where(StoryJob.status == "pending").order_by(StoryJob.created_at).limit(1)
+        ),
+        "jobs con lease vencido": select(StoryJob.id).where(
+            StoryJob.status == "procesando", StoryJob.lease_expires_at < datetime.now(timezone.utc)
+        ),
+        "jobs vencidos de un estado (retención)": (
+            select(StoryJob.id)
+            .where(StoryJob.status == "error", StoryJob.created_at < datetime.now(timezone.utc))
+            .order_by(StoryJob.id)
+            .limit(500)
+        ),
+        "jobs en cola y en proceso (admisión)": (
+            select(StoryJob.status, func.count())
+            .where(
+                StoryJob.status.in_(("pending", "procesando", "parcial")),
+                StoryJob.created_at >= datetime.now(timezone.utc)
+            )
+            .group_by(StoryJob.status)
+        ),
+        "jobs completados recientes (espera estimada)": (
+            select(StoryJob.created_at, StoryJob.completed_at)
+            .where(StoryJob.status == "completado")
+            .order_by(StoryJob.created_at.desc())
+            .limit(50)
+        ),
+        "historias de una sesión (GET /story)": (
+            select(Story.id, Story.title, StoryJob.created_at)
+            .select_from(StoryJob)
+            .join(Story, Story.id == StoryJob.story_id)
+            .where(StoryJob.session_id == "session")
+            .order_by(StoryJob.created_at.desc(), StoryJob.id.desc())
+            .limit(21)
+        ),
+        "página siguiente de una sesión (cursor)": (
+            select(Story.id, Story.title, StoryJob.created_at)
+            .select_from(StoryJob)
+            .join(Story, Story.id == StoryJob.story_id)
+            .where(
+                StoryJob.session_id == "session",
+                tuple_(StoryJob.created_at, StoryJob.id) < tuple_(datetime.now(timezone.utc), 100)
+            )
+            .order_by(StoryJob.created_at.desc(), StoryJob.id.desc())
+            .limit(21)
+        ),
+        "historias que ya recibió una sesión (caché por tema)": (
+            select(StoryJob.story_id).where(StoryJob.session_id == "session", StoryJob.story_id.isnot(None))
+        ),
+        "historias con camino ganador": (
+            select(Story.id).where(Story.has_winning_path.is_(True)).order_by(Story.id).limit(20)
+        ),
+        "historias más largas": select(Story.id).order_by(Story.max_depth.desc()).limit(20),
+        "historia del stock": select(Story.id).where(Story.pool_key == "fantasy|es").order_by(Story.id).limit(1),
+        "nodos de una historia (/complete)": select(StoryNode).where(StoryNode.story_id == 1),
+        "raíz de una historia": select(StoryNode.id).where(StoryNode.story_id == 1, StoryNode.is_root),
+        "subárbol por ruta (/node)": (
+            select(StoryNode.id)
+            .join(target, target.story_id == StoryNode.story_id)
+            .where(
+                target.id == 1,
+                StoryNode.path >= target.path,
+                StoryNode.path < target.path + ":",
+                StoryNode.depth <= target.depth + 2
+            )
+        ),
+        "subárbol desde la raíz (/node sin nodo)": (
+            select(StoryNode.id)
+            .join(target, target.story_id == StoryNode.story_id)
+            .where(
+                target.story_id == 1,
+                target.is_root,
+                StoryNode.path >= target.path,
+                StoryNode.path < target.path + ":",
+                StoryNode.depth <= target.depth + 2
+            )
+        ),
+    }
+
+
+def _sqlite_plan(connection: Connection, statement) -> Tuple[List[str], List[str]]:
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(compiled.params[name] for name in compiled.positiontup)).all()
+    plan = [row[-1] for row in rows]
+    problems = [line for line in plan if re.match(r"SCAN \w+$", line.strip())]
+    return plan, problems
+
+
+def _postgres_plan(connection: Connection, statement) -> Tuple[List[str], List[str]]:
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    with connection.begin_nested():
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params).all()]
+    problems = [line for line in plan if "Seq Scan" in line]
+    return plan, problems
+
+
+def check_query_plans(engine: Engine) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Ejecuta EXPLAIN sobre cada consulta frecuente.
+
+    Returns:
+        Dict nombre -> {"plan": líneas del plan, "problems": líneas sin índice
+        o el índice esperado que el plan no usa}.
+    """
+    explain: Callable = _postgres_plan if engine.dialect.name == "postgresql" else _sqlite_plan
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in hot_queries().items():
+            plan, problems = explain(connection, statement)
+            expected = EXPECTED_INDEXES.get(name)
+            if expected is not None and not any(expected in line for line in plan):
+                problems.append(f"no usa {expected}")
+            results[name] = {"plan": plan, "problems": problems}
+        connection.rollback()
+    return results
@@ -0,0 +1,180 @@
+"""
+Motor de migraciones: descubrimiento de versiones, operaciones idempotentes,
+registro en `schema_migrations` y generación del SQL fuera de línea.
+"""
+
+import importlib
+import logging
+import pkgutil
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Callable, List, Optional, Sequence, Set
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Dialect, Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+from sqlalchemy.sql import func
+from sqlalchemy.types import NullType
+
+import migrations.versions as versions_package
+
+logger = logging.getLogger(__name__)
+
+_tracking_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _tracking_metadata,
+    Column("version", String(32), primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: str
+    description: str
+    upgrade: Callable[["Operations"], None]
+
+
+def load_migrations() -> List[Migration]:
+    """Módulos de `migrations/versions/` ordenados por nombre (v0001_..., v0002_...)."""
+    migrations = []
+    for info in sorted(pkgutil.iter_modules(versions_package.__path__), key=lambda m: m.name):
+        if not info.name.startswith("v"):
+            continue
+        module: ModuleType = importlib.import_module(f"{versions_package.__name__}.{info.name}")
+        migrations.append(Migration(module.VERSION, module.DESCRIPTION, module.upgrade))
+    return migrations
+
+
+class Operations:
+    """
+    Operaciones de esquema que usan las migraciones.
+
+    En línea (`connection`) cada operación revisa el esquema actual y se omite
+    si ya está aplicada. Fuera de línea (`dialect` sin conexión) solo acumula
+    el SQL en `statements`.
+    """
+
+    def __init__(self, connection: Optional[Connection] = None, dialect: Optional[Dialect] = None):
+        self.connection = connection
+        self.dialect = connection.dialect if connection is not None else dialect
+        self.statements: List[str] = []
+
+    @property
+    def online(self) -> bool:
+        return self.connection is not None
+
+    def _run(self, statement: str):
+        if self.online:
+            self.connection.execute(text(statement))
+        else:
+            self.statements.append(statement.strip() + ";")
+
+    def _inspector(self):
+        return inspect(self.connection)
+
+    def has_table(self, table_name: str) -> bool:
+        return self._inspector().has_table(table_name)
+
+    def has_column(self, table_name: str, column_name: str) -> bool:
+        return any(column["name"] == column_name for column in self._inspector().get_columns(table_name))
+
+    def has_index(self, table_name: str, index_name: str) -> bool:
+        return any(index["name"] == index_name for index in self._inspector().get_indexes(table_name))
+
+    def create_table(self, table: Table):
+        """Crea la tabla con sus índices (si no existe)."""
+        if self.online and self.has_table(table.name):
+            return
+        self._run(str(CreateTable(table).compile(dialect=self.dialect)))
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            self._run(str(CreateIndex(index).compile(dialect=self.dialect)))
+
+    def add_column(self, table_name: str, column: Column):
+        """Agrega una columna (si no existe)."""
+        if self.online and self.has_column(table_name, column.name):
+            return
+        # La columna necesita una tabla para compilar sus tipos por dialecto
+        Table(table_name, MetaData(), column)
+        spec = CreateColumn(column).compile(dialect=self.dialect)
+        self._run(f"ALTER TABLE {table_name} ADD COLUMN {spec}")
+
+    def create_index(self, name: str, table_name: str, columns: Sequence[str], unique: bool = False, where: Optional[str] = None):
+        """Crea un índice (si no existe); `where` lo hace parcial (PostgreSQL y SQLite)."""
+        if self.online and self.has_index(table_name, name):
+            return
+        table = Table(table_name, MetaData(), *(Column(column, NullType()) for column in columns))
+        dialect_options = {}
+        if where is not None:
+            dialect_options = {"postgresql_where": text(where), "sqlite_where": text(where)}
+        index = Index(name, *(table.c[column] for column in columns), unique=unique, **dialect_options)
+        self._run(str(CreateIndex(index).compile(dialect=self.dialect)))
+
+    def drop_index(self, name: str, table_name: str):
+        """Elimina un índice (si existe)."""
+        if self.online and not self.has_index(table_name, name):
+            return
+        self._run(f"DROP INDEX IF EXISTS {name}")
+
+    def execute(self, statement: str):
+        """SQL arbitrario (p. ej. para rellenar datos)."""
+        self._run(statement)
+
+
+def applied_versions(connection: Connection) -> Set[str]:
+    """Versiones registradas en `schema_migrations` (crea la tabla si no existe)."""
+    _tracking_metadata.create_all(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine: Engine, target: Optional[str] = None) -> List[str]:
+    """
+    Aplica en orden las migraciones pendientes, cada una en su transacción.
+
+    En PostgreSQL toma un advisory lock para que varios procesos que arrancan
+    a la vez no apliquen la misma migración dos veces.
+
+    Returns:
+        Lista de versiones aplicadas.
+    """
+    applied_now = []
+    for migration in load_migrations():
+        if target is not None and migration.version > target:
+            break
+        with engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            if migration.version in applied_versions(connection):
+                continue
+            logger.info("Aplicando migración %s: %s", migration.version, migration.description)
+            migration.upgrade(Operations(connection=connection))
+            connection.execute(
+                insert(schema_migrations).values(version=migration.version, description=migration.description)
+            )
+            applied_now.append(migration.version)
+    return applied_now
+
+
+def offline_sql(dialect: Dialect, from_version: Optional[str] = None) -> str:
+    """
+    Script SQL de las migraciones posteriores a `from_version` (todas si es None),
+    incluyendo la creación y el registro en `schema_migrations`.
+    """
+    lines = []
+    if from_version is None:
+        lines.append(str(CreateTable(schema_migrations).compile(dialect=dialect)).strip() + ";")
+    for migration in load_migrations():
+        if from_version is not None and migration.version <= from_version:
+            continue
+        op = Operations(dialect=dialect)
+        migration.upgrade(op)
+        lines.append(f"\n-- {migration.version}: {migration.description}")
+        lines.extend(op.statements)
+        description = migration.description.replace("'", "''")
+        lines.append(
+            f"INSERT INTO schema_migrations (version, description) VALUES ('{migration.version}', '{description}');"
+        )
+    return "\n".join(lines) + "\n"
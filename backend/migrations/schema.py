@@ -0,0 +1,45 @@
+"""
+Comprobación de que las migraciones cubren los modelos.
+
+Un cambio de esquema va en el mismo cambio que lo introduce: si un modelo
+agrega una columna o un índice sin su migración, una base creada con
+`upgrade` no lo tiene y el código falla en producción aunque `create_all`
+(scripts) funcione. Está pensado para correr en CI contra una base migrada:
+`python -m migrations check-schema`.
+"""
+
+from typing import List
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from db.database import Base
+import models.job  # noqa: F401  registra story_jobs en Base.metadata
+import models.story  # noqa: F401  registra stories y story_nodes en Base.metadata
+
+
+def schema_differences(engine: Engine) -> List[str]:
+    """
+    Compara el esquema de la base con `Base.metadata`.
+
+    Returns:
+        Tablas, columnas e índices de los modelos que faltan en la base (o cuyo
+        índice no tiene la misma unicidad). Lista vacía si la base está al día.
+    """
+    inspector = inspect(engine)
+    differences = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            differences.append(f"falta la tabla {table.name}")
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                differences.append(f"falta la columna {table.name}.{column.name}")
+        indexes = {index["name"]: bool(index["unique"]) for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in indexes:
+                differences.append(f"falta el índice {index.name} ({table.name})")
+            elif indexes[index.name] != bool(index.unique):
+                differences.append(f"el índice {index.name} ({table.name}) difiere en unicidad")
+    return differences
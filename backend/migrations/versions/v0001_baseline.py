@@ -0,0 +1,57 @@
+"""
+Esquema inicial: stories, story_nodes y story_jobs tal como los creaba
+`create_tables()` antes de existir las migraciones.
+
+Las tablas se definen aquí (y no importando los modelos) para que esta
+versión no cambie cuando los modelos evolucionen.
+"""
+
+from sqlalchemy import JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.sql import func
+
+VERSION = "0001"
+DESCRIPTION = "Esquema inicial"
+
+metadata = MetaData()
+
+stories = Table(
+    "stories",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, index=True),
+    Column("session_id", String, index=True),
+    Column("description", String),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+story_nodes = Table(
+    "story_nodes",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("story_id", Integer, ForeignKey("stories.id"), index=True),
+    Column("content", String),
+    Column("is_root", Boolean),
+    Column("is_ending", Boolean),
+    Column("is_winning_ending", Boolean),
+    Column("options", JSON),
+)
+
+story_jobs = Table(
+    "story_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("job_id", String, index=True, unique=True),
+    Column("session_id", String, index=True),
+    Column("theme", String),
+    Column("status", String),
+    Column("story_id", Integer, nullable=True),
+    Column("error", String, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+)
+
+
+def upgrade(op):
+    op.create_table(stories)
+    op.create_table(story_nodes)
+    op.create_table(story_jobs)
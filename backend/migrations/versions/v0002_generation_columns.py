@@ -0,0 +1,36 @@
+"""
+Columnas agregadas por la cola durable, la caché y el stock de historias,
+la generación en streaming, la carga nodo a nodo y el formato blob.
+
+Antes las agregaba db/schema_upgrades.py al arrancar; en esas bases cada
+operación ya está aplicada y se omite.
+"""
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, LargeBinary, String
+from sqlalchemy.sql import true
+
+VERSION = "0002"
+DESCRIPTION = "Columnas de cola durable, stock, streaming, rutas de nodos y blob"
+
+
+def upgrade(op):
+    # story_jobs: idioma y campos de la cola durable
+    op.add_column("story_jobs", Column("language", String, nullable=True))
+    op.add_column("story_jobs", Column("attempts", Integer, nullable=False, server_default="0"))
+    op.add_column("story_jobs", Column("claimed_by", String, nullable=True))
+    op.add_column("story_jobs", Column("started_at", DateTime(timezone=True), nullable=True))
+    op.add_column("story_jobs", Column("heartbeat_at", DateTime(timezone=True), nullable=True))
+    op.add_column("story_jobs", Column("lease_expires_at", DateTime(timezone=True), nullable=True))
+    op.create_index("ix_story_jobs_lease_expires_at", "story_jobs", ["lease_expires_at"])
+
+    # stories: stock, estado de la generación en streaming y formato blob
+    op.add_column("stories", Column("pool_key", String, nullable=True))
+    op.create_index("ix_stories_pool_key", "stories", ["pool_key"])
+    op.add_column("stories", Column("is_complete", Boolean, nullable=False, server_default=true()))
+    op.add_column("stories", Column("tree_blob", LargeBinary, nullable=True))
+    op.add_column("stories", Column("tree_format", String, nullable=True))
+
+    # story_nodes: ruta materializada y profundidad (las filas existentes se completan al leerlas)
+    op.add_column("story_nodes", Column("path", String().with_variant(String(collation="C"), "postgresql"), nullable=True))
+    op.add_column("story_nodes", Column("depth", Integer, nullable=True))
+    op.create_index("ix_story_nodes_story_id_path", "story_nodes", ["story_id", "path"])
@@ -0,0 +1,28 @@
+"""
+Índices para los patrones de acceso reales y `stories.root_node_id`.
+
+- story_jobs(status, created_at): reclamar el job 'pending' más antiguo.
+- stories(session_id, created_at): historias de una sesión, más recientes primero.
+- story_nodes(story_id) WHERE is_root, único: una sola raíz por historia y
+  búsqueda directa de la raíz sin recorrer los nodos.
+- stories.root_node_id: la raíz sin consultar story_nodes.
+"""
+
+from sqlalchemy import Column, Integer
+
+VERSION = "0003"
+DESCRIPTION = "Índices compuestos, raíz única por historia y stories.root_node_id"
+
+
+def upgrade(op):
+    op.create_index("ix_story_jobs_status_created_at", "story_jobs", ["status", "created_at"])
+    op.create_index("ix_stories_session_id_created_at", "stories", ["session_id", "created_at"])
+    op.create_index("ux_story_nodes_root", "story_nodes", ["story_id"], unique=True, where="is_root")
+
+    op.add_column("stories", Column("root_node_id", Integer, nullable=True))
+    op.execute(
+        "UPDATE stories SET root_node_id = ("
+        "SELECT story_nodes.id FROM story_nodes "
+        "WHERE story_nodes.story_id = stories.id AND story_nodes.is_root"
+        ") WHERE root_node_id IS NULL"
+    )
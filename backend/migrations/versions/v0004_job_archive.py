@@ -0,0 +1,33 @@
+"""
+Tabla `story_jobs_archive`: archivo frío de los trabajos que borra la
+retención (core/retention.py) cuando RETENTION_ARCHIVE="table".
+"""
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy.sql import func
+
+VERSION = "0004"
+DESCRIPTION = "Archivo frío de trabajos vencidos"
+
+metadata = MetaData()
+
+story_jobs_archive = Table(
+    "story_jobs_archive",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("job_id", String, index=True),
+    Column("session_id", String),
+    Column("theme", String),
+    Column("language", String, nullable=True),
+    Column("status", String),
+    Column("story_id", Integer, nullable=True),
+    Column("error", String, nullable=True),
+    Column("attempts", Integer, nullable=True),
+    Column("created_at", DateTime(timezone=True)),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+    Column("archived_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def upgrade(op):
+    op.create_table(story_jobs_archive)
@@ -0,0 +1,28 @@
+"""
+Columnas con el análisis del árbol de cada historia (core/story_analysis.py).
+
+Quedan en null para las historias existentes; `python -m scripts.analyze_stories`
+las completa sin bloquear el despliegue.
+"""
+
+from sqlalchemy import Boolean, Column, Float, Integer
+
+VERSION = "0005"
+DESCRIPTION = "Estadísticas del árbol de cada historia"
+
+
+def upgrade(op):
+    op.add_column("stories", Column("node_count", Integer, nullable=True))
+    op.add_column("stories", Column("unreachable_nodes", Integer, nullable=True))
+    op.add_column("stories", Column("max_depth", Integer, nullable=True))
+    op.add_column("stories", Column("winning_endings", Integer, nullable=True))
+    op.add_column("stories", Column("losing_endings", Integer, nullable=True))
+    op.add_column("stories", Column("branching_factor", Float, nullable=True))
+    op.add_column("stories", Column("dangling_options", Integer, nullable=True))
+    op.add_column("stories", Column("has_winning_path", Boolean, nullable=True))
+
+    # Filtros y ordenamientos de historias sin leer sus nodos
+    op.create_index("ix_stories_node_count", "stories", ["node_count"])
+    op.create_index("ix_stories_max_depth", "stories", ["max_depth"])
+    op.create_index("ix_stories_winning_endings", "stories", ["winning_endings"])
+    op.create_index("ix_stories_has_winning_path", "stories", ["has_winning_path"])
@@ -0,0 +1,20 @@
+"""
+Columnas del modo de generación "incremental" (core/story_expansion.py):
+nodos de la frontera pendientes de expandir, lease de la expansión en curso,
+y tema e idioma de la historia para generar sus continuaciones.
+"""
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy.sql import false
+
+VERSION = "0006"
+DESCRIPTION = "Expansión incremental de nodos"
+
+
+def upgrade(op):
+    op.add_column("story_nodes", Column("is_expandable", Boolean, nullable=False, server_default=false()))
+    op.add_column("story_nodes", Column("expansion_started_at", DateTime(timezone=True), nullable=True))
+
+    op.add_column("stories", Column("expandable_nodes", Integer, nullable=True))
+    op.add_column("stories", Column("theme", String, nullable=True))
+    op.add_column("stories", Column("language", String, nullable=True))
@@ -0,0 +1,16 @@
+"""
+Índice de la biblioteca de historias de una sesión (`GET /story`, ver
+core/story_library.py): stories(session_id, created_at, id).
+
+La paginación keyset ordena por (created_at, id); con el id en el índice
+cada página se lee en orden del índice incluso con historias del mismo
+segundo. Reemplaza a ix_stories_session_id_created_at (0003), que es su prefijo.
+"""
+
+VERSION = "0007"
+DESCRIPTION = "Índice (session_id, created_at, id) para la biblioteca de la sesión"
+
+
+def upgrade(op):
+    op.create_index("ix_stories_session_created_id", "stories", ["session_id", "created_at", "id"])
+    op.drop_index("ix_stories_session_id_created_at", "stories")
@@ -0,0 +1,19 @@
+"""
+Predicado de ux_story_nodes_root que SQLite puede usar.
+
+SQLAlchemy escribe `StoryNode.is_root` como `story_nodes.is_root = 1` en SQLite
+(sin booleano nativo) y SQLite solo usa un índice parcial si el WHERE de la
+consulta contiene el término del índice tal cual: con `WHERE is_root` (0003)
+la búsqueda de la raíz usaba ix_story_nodes_story_id_path. En PostgreSQL la
+consulta queda `WHERE story_nodes.is_root` y el índice de 0003 ya sirve.
+"""
+
+VERSION = "0008"
+DESCRIPTION = "ux_story_nodes_root con WHERE is_root = 1 en SQLite"
+
+
+def upgrade(op):
+    if op.dialect.name != "sqlite":
+        return
+    op.drop_index("ux_story_nodes_root", "story_nodes")
+    op.create_index("ux_story_nodes_root", "story_nodes", ["story_id"], unique=True, where="is_root = 1")
@@ -0,0 +1,14 @@
+"""
+La biblioteca de la sesión (`GET /story`) se lista desde `story_jobs`: el job
+registra qué sesión recibió cada historia, también las del stock y las
+reutilizadas por la caché por tema, cuyo `stories.session_id` es el de quien
+la generó. Reemplaza a ix_stories_session_created_id (0007).
+"""
+
+VERSION = "0009"
+DESCRIPTION = "Índice (session_id, created_at, id) de story_jobs para la biblioteca"
+
+
+def upgrade(op):
+    op.create_index("ix_story_jobs_session_created_id", "story_jobs", ["session_id", "created_at", "id"])
+    op.drop_index("ix_stories_session_created_id", "stories")
@@ -4,7 +4,7 @@ Permite rastrear el estado de las generaciones asíncronas de historias.
 """
 
 # Imports de SQLAlchemy para definir columnas y tipos de datos
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func  # Funciones SQL como now() para timestamps
 
 # Clase base para todos los modelos ORM
@@ -18,8 +18,12 @@ class StoryJob(Base):
     con estado 'pending'. La generación se hace en segundo plano y este registro
     se actualiza con el progreso:
     - 'pending' -> 'procesando' -> 'completado' (o 'error')
+    - En modo streaming: 'procesando' -> 'parcial' (raíz jugable) -> 'completado'
     
     El frontend hace polling a este registro para saber cuándo la historia está lista.
+
+    Con JOB_QUEUE_BACKEND="sql" esta misma tabla funciona como cola durable:
+    los workers reclaman los trabajos 'pending' y mantienen un lease con latidos.
     """
     __tablename__ = "story_jobs"
     
@@ -34,8 +38,11 @@ class StoryJob(Base):
     
     # Tema solicitado para la historia (ej: "fantasy", "sci-fi")
     theme = Column(String)
+
+    # Idioma solicitado para la historia (ej: "es"); null = el que elija el LLM
+    language = Column(String, nullable=True)
     
-    # Estado actual: "pending", "procesando", "completado", "error"
+    # Estado actual: "pending", "procesando", "parcial", "completado", "error"
     status = Column(String)
     
     # ID de la historia generada (null hasta que se complete)
@@ -48,4 +55,54 @@ class StoryJob(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Timestamp de cuándo se completó o falló (null mientras está en proceso)
-    completed_at = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # --- Campos de la cola durable (ver core/job_queue.py) ---
+
+    # Número de veces que un worker tomó este trabajo
+    attempts = Column(Integer, default=0, nullable=False, server_default="0")
+
+    # Identificador del worker que tiene el trabajo reclamado
+    claimed_by = Column(String, nullable=True)
+
+    # Timestamp de cuándo el worker empezó a procesarlo
+    started_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Último latido del worker mientras procesa el trabajo
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Si el lease vence sin latidos, el trabajo se considera abandonado y se recupera
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    __table_args__ = (
+        # reclamar el job 'pending' más antiguo (cola durable) y filtrar por estado
+        Index("ix_story_jobs_status_created_at", "status", "created_at"),
+        # historias que recibió una sesión (GET /story), con el id para la paginación keyset
+        Index("ix_story_jobs_session_created_id", "session_id", "created_at", "id"),
+    )
+
+
+class StoryJobArchive(Base):
+    """
+    Archivo frío de trabajos vencidos (ver core/retention.py con RETENTION_ARCHIVE="table").
+
+    Guarda solo los campos útiles para auditoría y estadísticas; los de la cola
+    durable (worker, latidos, lease) no sirven una vez terminado el trabajo.
+    """
+    __tablename__ = "story_jobs_archive"
+
+    # Mismo ID que tenía en story_jobs (no autoincremental)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    job_id = Column(String, index=True)
+    session_id = Column(String)
+    theme = Column(String)
+    language = Column(String, nullable=True)
+    status = Column(String)
+    story_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Cuándo lo movió la retención
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
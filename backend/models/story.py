@@ -1,7 +1,7 @@
 #creamos las tablas stories y story_nodes
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, JSON, Index, LargeBinary
+from sqlalchemy.sql import false, func, text, true
 from sqlalchemy.orm import relationship
 
 from db.database import Base
@@ -14,9 +14,33 @@ class Story(Base):
     session_id = Column(String, index=True)
     description = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # clave del stock de historias pregeneradas ("tema|idioma"); null = historia asignada
+    pool_key = Column(String, nullable=True, index=True)
+    # false mientras la generación en streaming sigue agregando nodos; solo las completas se cachean
+    is_complete = Column(Boolean, default=True, server_default=true(), nullable=False)
+    # árbol completo en formato compacto (ver core/story_blob.py); null = nodos en story_nodes
+    tree_blob = Column(LargeBinary, nullable=True)
+    tree_format = Column(String, nullable=True)  # ej. "stb1+zstd+msgpack"
+    # nodo raíz (evita buscarlo entre los nodos); null en historias guardadas como blob
+    root_node_id = Column(Integer, nullable=True)
+    # análisis del árbol al terminar la generación (core/story_analysis.py); null = sin analizar
+    node_count = Column(Integer, nullable=True, index=True)
+    unreachable_nodes = Column(Integer, nullable=True)
+    max_depth = Column(Integer, nullable=True, index=True)
+    winning_endings = Column(Integer, nullable=True, index=True)
+    losing_endings = Column(Integer, nullable=True)
+    branching_factor = Column(Float, nullable=True)
+    dangling_options = Column(Integer, nullable=True)
+    has_winning_path = Column(Boolean, nullable=True, index=True)
+    # nodos pendientes de generar en el modo "incremental" (ver core/story_expansion.py); 0 = árbol cerrado
+    expandable_nodes = Column(Integer, nullable=True)
+    # tema e idioma con los que se generó (biblioteca de la sesión); el modo "incremental" los usa al expandir nodos
+    theme = Column(String, nullable=True)
+    language = Column(String, nullable=True)
     
     nodes = relationship("StoryNode", back_populates="story")
 
+
 #esta clase representa la tabla story_nodes en la base de datos  
 class StoryNode(Base):
     __tablename__ = "story_nodes"
@@ -27,5 +51,19 @@ class StoryNode(Base):
     is_ending = Column(Boolean, default=False)
     is_winning_ending = Column(Boolean, default=False)
     options = Column(JSON, default=list)
+    # ruta materializada en el árbol ("/" raíz, "/0/2/" tercera opción de la primera) y su profundidad;
+    # en postgres usa collation "C" para que el rango por prefijo use el índice
+    path = Column(String().with_variant(String(collation="C"), "postgresql"), nullable=True)
+    depth = Column(Integer, nullable=True)
+    # modo "incremental": nodo de la frontera cuyo subárbol se genera cuando el jugador se acerca;
+    # expansion_started_at es el lease de la expansión en curso (ver core/story_expansion.py)
+    is_expandable = Column(Boolean, default=False, server_default=false(), nullable=False)
+    expansion_started_at = Column(DateTime(timezone=True), nullable=True)
 
     story = relationship("Story", back_populates="nodes")
+
+    __table_args__ = (
+        Index("ix_story_nodes_story_id_path", "story_id", "path"),
+        # una sola raíz por historia, y búsqueda directa de la raíz (predicado de SQLite: migración 0008)
+        Index("ux_story_nodes_root", "story_id", unique=True, sqlite_where=text("is_root = 1"), postgresql_where=text("is_root")),
+    )
@@ -0,0 +1,59 @@
+"""
+Router de administración: descarga de los perfiles capturados (ver core/profiling.py).
+
+Todas las rutas exigen la cabecera `X-Admin-Token` igual a ADMIN_TOKEN; sin
+ADMIN_TOKEN configurado responden 404, como si no existieran.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+
+from core.profiling import profile_store, is_admin  # Buffer de perfiles y verificación del token
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependencia que rechaza las requests sin un token de administración válido."""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/profiles")
+def list_profiles():
+    """Perfiles guardados, del más reciente al más viejo."""
+    return [record.summary() for record in profile_store.list()]
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: int):
+    """
+    Descarga un perfil: `.pstats` (modo cprofile) o `.speedscope.json` (modo sampling).
+
+    Raises:
+        HTTPException: 404 si el perfil ya salió del buffer.
+    """
+    record = profile_store.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    if record.format == "pstats":
+        filename, media_type = f"profile-{record.id}.pstats", "application/octet-stream"
+    else:
+        filename, media_type = f"profile-{record.id}.speedscope.json", "application/json"
+    return Response(
+        content=record.data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.delete("/profiles")
+def clear_profiles():
+    """Vacía el buffer de perfiles."""
+    return {"deleted": profile_store.clear()}
@@ -1,34 +1,47 @@
 """
 Router para consultar el estado de trabajos (jobs) de generación de historias.
-Permite al frontend hacer polling para saber cuándo una historia está lista.
+Permite al frontend hacer polling, long-polling o recibir eventos SSE para saber
+cuándo una historia está lista.
 """
 
-# Imports de FastAPI para crear endpoints y manejar dependencias
-from fastapi import APIRouter, Depends, HTTPException, Cookie
-from sqlalchemy.orm import Session  # Tipo para la sesión de base de datos
+import asyncio
+import json
+
+# Imports de FastAPI para crear endpoints
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool  # Para consultar la DB sin bloquear el event loop
+from fastapi.responses import StreamingResponse  # Respuesta para Server-Sent Events
 
 # Imports locales
-from db.database import get_db  # Dependencia que proporciona la sesión de DB
+from core.config import settings  # Configuración de la aplicación
+from core.job_events import TERMINAL_STATUSES, job_notifier, job_payload  # Notificador de cambios de estado
+from core.job_status_cache import job_status_cache  # Estado de los jobs sin consultar la DB
+from core.profiling import ProfiledRoute  # Perfilado bajo demanda
+from core.response_encoding import encoded_response  # JSON/msgpack según Accept
+from db.database import ReadSessionLocal, replica_engine, SessionLocal  # Sesiones de DB (réplica de lectura y primaria)
 from models.job import StoryJob  # Modelo ORM del trabajo
 from schemas.job import StoryJobResponse  # Schema de respuesta
 
 # Configuración del router con prefijo /job
 router = APIRouter(
     prefix="/job",
-    tags=["job"]  # Agrupa estos endpoints en la documentación
+    tags=["job"],  # Agrupa estos endpoints en la documentación
+    route_class=ProfiledRoute  # Perfilado bajo demanda (ver core/profiling.py)
 )
 
 @router.get("/{job_id}", response_model=StoryJobResponse)
-def get_job_status(job_id: str, db: Session = Depends(get_db)):
+def get_job_status(job_id: str, request: Request):
     """
     Consulta el estado de un trabajo de generación de historia.
     
     El frontend llama a este endpoint repetidamente (polling) para saber
-    si la historia ya fue generada o si hubo algún error.
+    si la historia ya fue generada o si hubo algún error. El estado se lee
+    de la caché write-through (core/job_status_cache.py) y solo si no está
+    se consulta la base de datos.
     
     Args:
         job_id: UUID del trabajo a consultar
-        db: Sesión de base de datos (inyectada automáticamente)
+        request: Petición (JSON o msgpack según Accept)
         
     Returns:
         StoryJobResponse con el estado actual del trabajo
@@ -36,8 +49,131 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
     Raises:
         HTTPException 404 si el job_id no existe
     """
-    job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
-    if not job:
+    payload = _load_job_payload(job_id, read_replica=True)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return encoded_response(request, payload)
+
+
+def _load_job_payload(job_id: str, read_replica: bool = False):
+    """
+    Estado actual del job: de la caché de estados o, si no está, de la base
+    de datos con una sesión corta (se ejecuta en el threadpool).
+
+    Args:
+        job_id: UUID del trabajo
+        read_replica: Leer de la réplica (con la primaria como respaldo para
+            un job recién creado que la réplica todavía no tiene)
+    """
+    payload = job_status_cache.get(job_id)
+    if payload is not None:
+        return payload
+
+    sessions = [SessionLocal]
+    if read_replica and replica_engine is not None:
+        sessions.insert(0, ReadSessionLocal)
+    for session_factory in sessions:
+        with session_factory() as db:
+            job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
+            if job:
+                payload = job_payload(job)
+                job_status_cache.remember_read(job_id, payload)
+                return payload
+    return None
+
+
+async def _next_job_payload(job_id: str, queue: asyncio.Queue, timeout: float):
+    """
+    Espera el siguiente cambio de estado publicado por el notificador.
+    Si no llega ninguno en `timeout` segundos, relee el job (caché de estados o DB).
+    """
+    try:
+        return await asyncio.wait_for(queue.get(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return await run_in_threadpool(_load_job_payload, job_id)
+
+
+@router.get("/{job_id}/wait", response_model=StoryJobResponse)
+async def wait_job_status(
+    job_id: str,
+    request: Request,
+    status: str = Query(None, description="Último estado conocido por el cliente"),
+    timeout: float = Query(25.0, gt=0, le=60, description="Segundos máximos de espera")
+):
+    """
+    Long-poll: responde en cuanto el estado del job sea distinto de `status`
+    o al vencer `timeout` (con el estado actual).
+
+    Args:
+        job_id: UUID del trabajo a consultar
+        request: Petición (JSON o msgpack según Accept)
+        status: Último estado que vio el cliente (si se omite responde de inmediato)
+        timeout: Segundos máximos de espera
+
+    Raises:
+        HTTPException 404 si el job_id no existe
+    """
+    # Suscribirse antes de leer la DB para no perder una transición intermedia
+    queue = job_notifier.subscribe(job_id)
+    try:
+        payload = await run_in_threadpool(_load_job_payload, job_id)
+        if payload is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        deadline = asyncio.get_running_loop().time() + timeout
+        while payload["status"] == status and payload["status"] not in TERMINAL_STATUSES:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            payload = await _next_job_payload(
+                job_id, queue, min(remaining, settings.JOB_EVENTS_DB_POLL_SECONDS)
+            ) or payload
+        return encoded_response(request, payload)
+    finally:
+        job_notifier.unsubscribe(job_id, queue)
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Server-Sent Events: envía un evento `status` con cada transición del job
+    (pending -> procesando -> completado/error) y cierra el stream al llegar
+    a un estado final. Reemplaza el polling con una única petición por job.
+
+    Args:
+        job_id: UUID del trabajo a seguir
+
+    Raises:
+        HTTPException 404 si el job_id no existe
+    """
+    queue = job_notifier.subscribe(job_id)
+    payload = await run_in_threadpool(_load_job_payload, job_id)
+    if payload is None:
+        job_notifier.unsubscribe(job_id, queue)
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return job
+    async def event_stream(payload):
+        try:
+            last_sent = None
+            while True:
+                if payload != last_sent:
+                    yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                    last_sent = payload
+                else:
+                    # Comentario SSE para mantener viva la conexión en proxies
+                    yield ": keep-alive\n\n"
+
+                if payload["status"] in TERMINAL_STATUSES:
+                    return
+                payload = await _next_job_payload(
+                    job_id, queue, settings.JOB_EVENTS_DB_POLL_SECONDS
+                ) or payload
+        finally:
+            job_notifier.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(payload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
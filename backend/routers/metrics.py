@@ -0,0 +1,19 @@
+"""
+Router que expone las métricas del proceso para Prometheus.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import registry  # Registro global de métricas
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus: pool de conexiones, etapas
+    de la generación, espera en cola, tokens, latencia HTTP por ruta, etc.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
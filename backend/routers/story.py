@@ -3,27 +3,49 @@ Router para la creación y consulta de historias interactivas.
 Maneja la generación asíncrona de historias usando OpenAI y el almacenamiento en DB.
 """
 
+import logging
 import uuid  # Para generar IDs únicos de trabajos
-from typing import Optional
-from datetime import datetime
+from typing import Any, Dict, Optional, Set
+from datetime import datetime, timezone
 # Imports de FastAPI
-from fastapi import APIRouter, Depends, HTTPException, Cookie, Response, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Cookie, Header, Query, Request, Response, BackgroundTasks
+from sqlalchemy import select  # Consultas para la sesión asíncrona
 from sqlalchemy.orm import Session  # Tipo para sesiones de base de datos
 
 # Imports locales
-from db.database import get_db, SessionLocal  # Dependencias de base de datos
+from db.database import get_db, get_read_db, replica_engine, SessionLocal, get_async_sessionmaker  # Dependencias de base de datos
 from models.story import Story, StoryNode  # Modelos ORM
 from models.job import StoryJob  # Modelo de trabajo asíncrono
 from schemas.story import (  # Schemas de validación
-    CompleteStoryNodeResponse, CompleteStoryResponse, CreateStoryRequest
+    CompleteStoryResponse, CreateStoryRequest, StoryLibraryResponse, StoryNodeTreeResponse
 )
 from schemas.job import StoryJobResponse
-from core.story_generator import StoryGenerator  # Lógica de generación con LLM
+from core.story_generator import StoryGenerator, AsyncStoryGenerator  # Lógica de generación con LLM
+from core.config import settings  # Configuración de la aplicación
+from core.job_events import job_payload, publish_job_payload, publish_job_update  # Notifica los cambios de estado a SSE/long-poll
+from core.job_queue import JobOwnershipLost, api_owner_id, claim_job, update_owned_job  # Reclamo y dueño de los jobs
+from core.story_cache import story_cache, cache_key, normalize_language  # Caché de historias por tema
+from core.generation_metrics import JOBS_FINISHED, observe_queue_wait  # Métricas del pipeline
+from core.profiling import ProfiledRoute, profiled_task  # Perfilado bajo demanda
+from core.story_pool import claim_pooled_story, pool_levels, pool_metrics  # Stock de historias pregeneradas
+from core.story_persistence import backfill_node_paths  # Rutas de nodos de historias antiguas
+from core.story_store import load_complete_story, load_node_subtree  # Lectura de historias (filas o blob)
+from core.story_library import (  # Biblioteca de la sesión con paginación keyset
+    InvalidCursor, list_session_stories, received_stories_query, received_story_ids
+)
+from core.admission import AdmissionRejected, admission_controller, client_ip, generation_queue  # Control de admisión
+from core.response_cache import (  # Respuestas serializadas de historias terminadas
+    IMMUTABLE_CACHE_CONTROL, etag_matches, story_response_cache
+)
+from core.response_encoding import encoded_response, request_variant, variant_headers  # JSON/msgpack y gzip/brotli
+
+logger = logging.getLogger(__name__)
 
 # Configuración del router
 router = APIRouter(
     prefix="/story",
-    tags=["story"]  # Agrupa endpoints en la documentación
+    tags=["story"],  # Agrupa endpoints en la documentación
+    route_class=ProfiledRoute  # Perfilado bajo demanda (ver core/profiling.py)
 )
 
 def get_session_id(session_id: Optional[str] = Cookie(None)):
@@ -42,13 +64,53 @@ def get_session_id(session_id: Optional[str] = Cookie(None)):
         session_id = str(uuid.uuid4())
     return session_id
 
+@router.get("", response_model=StoryLibraryResponse)
+def list_stories(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    limit: int = Query(settings.STORY_LIBRARY_DEFAULT_LIMIT, ge=1, le=settings.STORY_LIBRARY_MAX_LIMIT),
+    session_id: str = Depends(get_session_id),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Biblioteca del jugador: sus historias (las de la cookie de sesión), de la
+    más reciente a la más antigua, con un resumen sin nodos (título, fecha,
+    tamaño y finales).
+
+    La paginación es keyset (ver core/story_library.py): cada página cuesta lo
+    mismo sin importar cuántas se hayan recorrido.
+
+    Args:
+        request: Petición (JSON o msgpack, gzip o brotli según sus cabeceras)
+        cursor: Cursor devuelto en `next_cursor` (se omite en la primera página)
+        limit: Historias por página
+        session_id: ID de sesión del usuario (inyectado)
+        db: Sesión de base de datos de lectura (inyectada)
+
+    Returns:
+        StoryLibraryResponse con las historias y el cursor de la página siguiente
+
+    Raises:
+        HTTPException 400 si el cursor no es válido
+    """
+    try:
+        library = list_session_stories(db, session_id, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return encoded_response(request, library, headers={"Cache-Control": "private, no-cache"})
+
+
 @router.post("/create", response_model=StoryJobResponse)
 def create_story(
     request: CreateStoryRequest,
     background_tasks: BackgroundTasks,
     response: Response,
+    raw_request: Request,
     session_id: str = Depends(get_session_id),
-    db: Session = Depends(get_db)
+    accept_language: Optional[str] = Header(None),
+    # scope="function": la conexión vuelve al pool al terminar el endpoint, no
+    # después de la tarea en segundo plano (que abre sus propias sesiones)
+    db: Session = Depends(get_db, scope="function")
 ):
     """
     Endpoint para crear una nueva historia interactiva.
@@ -60,51 +122,118 @@ def create_story(
         request: Contiene el tema de la historia
         background_tasks: Gestor de tareas en segundo plano de FastAPI
         response: Objeto de respuesta para setear cookies
+        raw_request: Petición HTTP (IP del cliente para el control de admisión)
         session_id: ID de sesión del usuario (inyectado)
+        accept_language: Cabecera Accept-Language (idioma por defecto de la historia)
         db: Sesión de base de datos (inyectada)
         
     Returns:
         StoryJobResponse con el job_id para hacer polling
+
+    Raises:
+        HTTPException 429 (con Retry-After) si la sesión o la IP superan su
+        límite o si la cola de generaciones está llena (ver core/admission.py)
     """
+    # Control de admisión: un cliente en un bucle se frena antes de tocar la base de datos
+    try:
+        admission_controller.check_rate(session_id, client_ip(raw_request))
+    except AdmissionRejected as rejected:
+        raise rejected.http_exception()
+
     # Guardar el session_id en una cookie para futuras peticiones
     response.set_cookie(key="session_id", value=session_id, httponly=True)
 
     # Generar un ID único para este trabajo
     job_id = str(uuid.uuid4())
 
+    # Idioma explícito del request o, si no viene, el del navegador
+    language = normalize_language(request.language or accept_language) or None
+
     # Crear registro del trabajo en la base de datos con estado "pending"
     job = StoryJob(
         job_id=job_id,
         session_id=session_id,
         theme=request.theme,    
+        language=language,
         status="pending"
     )
     db.add(job)
-    db.commit()
 
-    # Lanzar la generación de la historia en segundo plano
-    # Esto permite que el endpoint responda inmediatamente
-    background_tasks.add_task(
-        generate_story_task, 
-        job_id, 
-        request.theme, 
-        session_id
-    )
+    # Si hay una historia pregenerada para este tema, el job se completa al instante
+    if settings.STORY_POOL_ENABLED:
+        pooled_story_id = claim_pooled_story(db, request.theme, language, session_id)
+        if pooled_story_id is not None:
+            job.story_id = pooled_story_id
+            job.status = "completado"
+            job.completed_at = datetime.now(timezone.utc)
+            payload = _committed_job_payload(db, job)
+            publish_job_payload(job_id, payload)
+            return payload
+
+    # Sin historia pregenerada hace falta el LLM: se rechaza si la cola está llena
+    try:
+        admission_controller.check_capacity(db)
+    except AdmissionRejected as rejected:
+        db.rollback()
+        raise rejected.http_exception()
+
+    payload = _committed_job_payload(db, job)
+    # El primer polling ya encuentra el job en la caché de estados
+    publish_job_payload(job_id, payload)
+
+    # Con la cola durable, el job 'pending' ya está encolado: lo procesará worker.py
+    if settings.JOB_QUEUE_BACKEND == "sql":
+        return payload
 
-    return job
+    # Encolar la generación después de enviar la respuesta. La cola del proceso
+    # limita las generaciones simultáneas; el job sigue en "pending" mientras espera
+    # sin ocupar un thread ni una conexión (ver core/admission.py).
+    # La variante asíncrona corre en el event loop en lugar del threadpool.
+    if settings.ASYNC_GENERATION:
+        background_tasks.add_task(
+            generation_queue.submit_async, generate_story_task_async, job_id, request.theme, session_id, language
+        )
+    else:
+        background_tasks.add_task(
+            generation_queue.submit, generate_story_task, job_id, request.theme, session_id, language
+        )
+
+    return payload
+
+
+def _committed_job_payload(db: Session, job: StoryJob) -> Dict[str, Any]:
+    """
+    Serializa el job dentro de la transacción y la confirma. Leer el job después
+    del commit lo refrescaría y volvería a tomar una conexión del pool.
+    """
+    db.flush()  # created_at lo pone la base de datos: se lee en la misma transacción
+    payload = job_payload(job)
+    db.commit()
+    return payload
 
-def generate_story_task(job_id: str, theme: str, session_id: str):
+@profiled_task("generate_story_task")
+def generate_story_task(
+    job_id: str, theme: str, session_id: str, language: Optional[str] = None, worker_id: Optional[str] = None
+):
     """
     Tarea en segundo plano que genera la historia usando el LLM.
     
     Esta función se ejecuta de forma asíncrona después de que el endpoint
-    /create responde al cliente. Actualiza el estado del job en la DB.
+    /create responde al cliente (o desde worker.py con la cola durable).
+    Actualiza el estado del job en la DB.
+
+    Sin `worker_id` la tarea reclama el job para este proceso de la API (con un
+    lease que renueva `api_lease_renewer`). Cada cambio de estado exige que el job
+    siga siendo de quien lo procesa: si se recuperó, no se pisa el nuevo intento.
     
     Args:
         job_id: UUID del trabajo
         theme: Tema de la historia solicitado por el usuario
         session_id: ID de sesión del usuario
+        language: Idioma de la historia (opcional)
+        worker_id: Worker que ya reclamó el job en la cola durable (opcional)
     """
+    owner_id = worker_id or api_owner_id()
     # Crear una nueva sesión de DB independiente (estamos en otro thread)
     db = SessionLocal()
 
@@ -114,41 +243,257 @@ def generate_story_task(job_id: str, theme: str, session_id: str):
 
         if not job:
             return
+        observe_queue_wait(job.created_at, settings.JOB_QUEUE_BACKEND)
+
+        # El worker ya lo reclamó al sacarlo de la cola; la API lo reclama ahora
+        if worker_id is None and not claim_job(db, job_id, owner_id, settings.JOB_LEASE_SECONDS):
+            db.rollback()
+            logger.info("El job %s ya lo reclamó otro proceso", job_id)
+            return
         
         try:
-            # Actualizar estado a "procesando"
-            job.status = "procesando"
-            db.commit()
+            # Publicar el estado "procesando"
+            publish_job_payload(job_id, _committed_job_payload(db, job))
+
+            def generate() -> int:
+                # Generar la historia usando el LLM (puede tardar varios segundos)
+                if settings.GENERATION_MODE == "streaming":
+                    def mark_partial(partial_story):
+                        # La raíz ya es jugable: el frontend puede abrir la historia
+                        if not update_owned_job(db, job_id, owner_id, story_id=partial_story.id, status="parcial"):
+                            raise JobOwnershipLost(job_id)
+                        # Sin recargar el job tras el commit: no se retiene una conexión mientras siguen llegando tokens
+                        publish_job_payload(job_id, _committed_job_payload(db, job))
+
+                    return StoryGenerator.generate_story_streaming(
+                        db, session_id, theme, language, on_root_ready=mark_partial
+                    ).id
+                if settings.GENERATION_MODE == "incremental":
+                    # Solo los primeros niveles; el resto se genera con /node/{id}/expand
+                    return StoryGenerator.generate_story_incremental(db, session_id, theme, language).id
+                if settings.GENERATION_MODE == "fanout":
+                    # Esquema y luego las ramas de primer nivel en paralelo
+                    return StoryGenerator.generate_story_fanout(db, session_id, theme, language).id
+                return StoryGenerator.generate_story(db, session_id, theme, language).id
 
-            # Generar la historia usando OpenAI (puede tardar varios segundos)
-            story = StoryGenerator.generate_story(db, session_id, theme)
+            if settings.STORY_CACHE_ENABLED:
+                # Reutiliza una historia del mismo tema que la sesión no tenga, o espera
+                # a la generación idéntica en curso de otra sesión
+                received = received_story_ids(db, session_id) if story_cache.reuse_k > 0 else frozenset()
+                story_id, _ = story_cache.get_or_generate(cache_key(theme, language), generate, session_id, received)
+            else:
+                story_id = generate()
             
             # Actualizar el job con el ID de la historia generada
-            job.story_id = story.id
-            job.status = "completado"
-            job.completed_at = datetime.now()
-            db.commit()
+            if not update_owned_job(
+                db, job_id, owner_id,
+                story_id=story_id, status="completado", completed_at=datetime.now(timezone.utc), lease_expires_at=None
+            ):
+                raise JobOwnershipLost(job_id)
+            payload = _committed_job_payload(db, job)
+            # La primera lectura de la historia ya encuentra la respuesta serializada
+            warm_complete_story_cache(story_id, db)
+            publish_job_payload(job_id, payload)
+            JOBS_FINISHED.inc(status="completado")
             
         except Exception as e:
             # Si algo falla, guardar el error en el job
-            job.status = "error"
-            job.completed_at = datetime.now()
-            job.error = str(e)
-            db.commit()
+            db.rollback()
+            # Tras "parcial" el job apuntaba a una historia a medias: deja de entregarla (la retención la borra)
+            failed = update_owned_job(
+                db, job_id, owner_id,
+                status="error", completed_at=datetime.now(timezone.utc), error=str(e), story_id=None, lease_expires_at=None
+            )
+            if not failed:
+                # Se recuperó mientras se generaba: el estado es del nuevo intento
+                db.rollback()
+                logger.warning("El job %s ya no pertenece a %s; no se actualiza su estado", job_id, owner_id)
+                return
+            publish_job_payload(job_id, _committed_job_payload(db, job))
+            JOBS_FINISHED.inc(status="error")
 
     finally:
         # Siempre cerrar la sesión de DB
         db.close()
 
 
+async def _update_job_async(job_id: str, owner_id: str, claim: bool = False, **values):
+    """
+    Reclama (`claim`) o actualiza un job de este proceso usando una sesión
+    asíncrona corta y publica el nuevo estado.
+
+    Returns:
+        El StoryJob actualizado o None si el job no existe o pertenece a otro proceso.
+    """
+    async with get_async_sessionmaker()() as db:
+        if claim:
+            owned = await db.run_sync(claim_job, job_id, owner_id, settings.JOB_LEASE_SECONDS)
+        else:
+            owned = await db.run_sync(update_owned_job, job_id, owner_id, **values)
+        if not owned:
+            await db.rollback()
+            return None
+        job = await db.scalar(select(StoryJob).where(StoryJob.job_id == job_id))
+        await db.commit()
+        publish_job_update(job)
+        return job
+
+
+async def _received_story_ids_async(session_id: str) -> Set[int]:
+    """Historias que ya recibió la sesión, con una sesión asíncrona corta."""
+    async with get_async_sessionmaker()() as db:
+        return set(await db.scalars(received_stories_query(session_id)))
+
+
+@profiled_task("generate_story_task_async")
+async def generate_story_task_async(job_id: str, theme: str, session_id: str, language: Optional[str] = None):
+    """
+    Variante asíncrona de `generate_story_task`.
+
+    No ocupa un thread del threadpool ni una conexión del pool mientras espera
+    al LLM: cada actualización del job abre una sesión corta y la cierra.
+
+    Args:
+        job_id: UUID del trabajo
+        theme: Tema de la historia solicitado por el usuario
+        session_id: ID de sesión del usuario
+        language: Idioma de la historia (opcional)
+    """
+    owner_id = api_owner_id()
+    job = await _update_job_async(job_id, owner_id, claim=True)
+    if job is None:
+        logger.info("El job %s no existe o ya lo reclamó otro proceso", job_id)
+        return
+    observe_queue_wait(job.created_at, "background")
+
+    async def generate() -> int:
+        # La respuesta de /complete se serializa con la misma AsyncSession que guardó el árbol
+        if settings.GENERATION_MODE == "fanout":
+            return (await AsyncStoryGenerator.generate_story_fanout(
+                session_id, theme, language, on_saved=cache_complete_story
+            )).id
+        return (await AsyncStoryGenerator.generate_story(
+            session_id, theme, language, on_saved=cache_complete_story
+        )).id
+
+    try:
+        if settings.STORY_CACHE_ENABLED:
+            received = await _received_story_ids_async(session_id) if story_cache.reuse_k > 0 else frozenset()
+            story_id, _ = await story_cache.get_or_generate_async(
+                cache_key(theme, language), generate, session_id, received
+            )
+        else:
+            story_id = await generate()
+    except Exception as e:
+        # Si algo falla, guardar el error en el job (salvo que ya sea de otro proceso)
+        failed = await _update_job_async(
+            job_id, owner_id, status="error", completed_at=datetime.now(timezone.utc), error=str(e), lease_expires_at=None
+        )
+        if failed is not None:
+            JOBS_FINISHED.inc(status="error")
+        return
+
+    completed = await _update_job_async(
+        job_id, owner_id, story_id=story_id, status="completado", completed_at=datetime.now(timezone.utc), lease_expires_at=None
+    )
+    if completed is None:
+        logger.warning("El job %s ya no pertenece a %s; no se actualiza su estado", job_id, owner_id)
+        return
+    JOBS_FINISHED.inc(status="completado")
+
+
+@router.get("/pool/metrics")
+def get_pool_metrics(db: Session = Depends(get_db)):
+    """
+    Métricas del stock de historias pregeneradas: aciertos, fallos, tasa de
+    aciertos, historias generadas por el replenisher y stock actual por tema.
+    """
+    return {**pool_metrics.snapshot(), "levels": pool_levels(db)}
+
+
+def serialize_complete_story(db: Session, story: Story) -> bytes:
+    """Construye el árbol completo de la historia y lo serializa a JSON."""
+    return build_complete_story_tree(db, story).model_dump_json().encode("utf-8")
+
+
+def warm_complete_story_cache(story_id: int, db: Optional[Session] = None):
+    """
+    Guarda en la caché de respuestas el JSON de una historia recién terminada.
+    Un fallo aquí no afecta al job: la primera lectura llenará la caché.
+
+    Args:
+        story_id: ID de la historia
+        db: Sesión a reutilizar (si no se indica, se abre una propia)
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        story = db.query(Story).filter(Story.id == story_id).first()
+        if story is not None:
+            cache_complete_story(db, story)
+    except Exception:
+        logger.exception("No se pudo precalentar la respuesta de la historia %s", story_id)
+    finally:
+        if own_session:
+            db.close()
+
+
+def cache_complete_story(db: Session, story: Story):
+    """
+    Guarda en la caché de respuestas el JSON de una historia ya confirmada.
+    También es el `on_saved` del pipeline asíncrono, que la llama con la
+    sesión síncrona de su AsyncSession. Un fallo se registra y no se propaga.
+    """
+    try:
+        if _is_cacheable(story):
+            story_response_cache.put(story.id, serialize_complete_story(db, story))
+    except Exception:
+        logger.exception("No se pudo precalentar la respuesta de la historia %s", story.id)
+
+
+def _is_cacheable(story: Story) -> bool:
+    """
+    Las historias en streaming o con nodos por expandir (todavía pueden ganar
+    nodos) no son cacheables. Las del stock sí: la respuesta no incluye la
+    sesión dueña, así que no cambia al reclamarlas.
+    """
+    return story.is_complete and not story.expandable_nodes
+
+
+def _render_story(db: Session, story_id: int):
+    """Serializa una historia. Devuelve (cuerpo, cacheable) o None si no existe."""
+    story = db.query(Story).filter(Story.id == story_id).first()
+    if not story:
+        return None
+    # Construir el árbol completo de la historia
+    body = serialize_complete_story(db, story)
+    return body, _is_cacheable(story)
+
+
 @router.get("/{story_id}/complete", response_model=CompleteStoryResponse)
-def get_complete_story(story_id: int, db: Session = Depends(get_db)):
+def get_complete_story(
+    story_id: int,
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
+):
     """
     Obtiene una historia completa con todos sus nodos y opciones.
+
+    Las historias terminadas no cambian: su JSON se sirve desde la caché de
+    respuestas con un ETag fuerte y `Cache-Control: immutable`, y se responde
+    304 si el cliente ya tiene esa versión. La variante (JSON o msgpack,
+    gzip o brotli) sale de `Accept` y `Accept-Encoding` y ya está
+    precalculada en la caché (ver core/response_encoding.py). Las historias
+    que todavía cambian se codifican en cada petición con `no-cache` y también
+    responden 304 si el ETag no cambió.
     
     Args:
         story_id: ID de la historia a consultar
-        db: Sesión de base de datos (inyectada)
+        request: Petición (cabeceras Accept y Accept-Encoding)
+        if_none_match: Cabecera If-None-Match con el ETag que tiene el cliente
+        db: Sesión de base de datos de lectura (inyectada)
         
     Returns:
         CompleteStoryResponse con la estructura completa de la historia
@@ -156,20 +501,39 @@ def get_complete_story(story_id: int, db: Session = Depends(get_db)):
     Raises:
         HTTPException 404 si la historia no existe
     """
-    story = db.query(Story).filter(Story.id == story_id).first()
-    if not story:
-        raise HTTPException(status_code=404, detail="Story not found")
-    
-    # Construir el árbol completo de la historia
-    complete_story = build_complete_story_tree(db, story)
-    return complete_story
+    cached = story_response_cache.get(story_id)
+    if cached is None:
+        rendered = _render_story(db, story_id)
+        if rendered is None and replica_engine is not None:
+            # Historia recién creada que la réplica todavía no tiene
+            with SessionLocal() as primary:
+                rendered = _render_story(primary, story_id)
+        if rendered is None:
+            raise HTTPException(status_code=404, detail="Story not found")
+
+        body, cacheable = rendered
+        if not cacheable:
+            # Historia que todavía cambia: se codifica en el momento y el cliente revalida con su ETag
+            response = encoded_response(request, body, headers={"Cache-Control": "no-cache"}, etag=True)
+            if etag_matches(if_none_match, response.headers["ETag"]):
+                return Response(
+                    status_code=304,
+                    headers={name: response.headers[name] for name in ("ETag", "Cache-Control", "Vary")}
+                )
+            return response
+        cached = story_response_cache.put(story_id, body)
+
+    variant, body, etag = cached.select(request_variant(request))
+    headers = variant_headers(variant, {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+    if etag_matches(if_none_match, etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=variant.media_type, headers=headers)
 
 def build_complete_story_tree(db: Session, story: Story) -> CompleteStoryResponse:
     """
-    Construye la estructura completa de una historia con todos sus nodos.
-    
-    Convierte los nodos de la base de datos en una estructura jerárquica
-    que incluye el nodo raíz y un diccionario con todos los nodos.
+    Construye la estructura completa de una historia con todos sus nodos,
+    sea cual sea su formato de almacenamiento (ver core/story_store.py).
     
     Args:
         db: Sesión de base de datos
@@ -181,32 +545,113 @@ def build_complete_story_tree(db: Session, story: Story) -> CompleteStoryRespons
     Raises:
         HTTPException 500 si no se encuentra el nodo raíz
     """
-    # Obtener todos los nodos de esta historia
-    nodes = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
-    
-    # Convertir cada nodo a su schema de respuesta
-    node_dict = {}
-    for node in nodes:
-        node_response = CompleteStoryNodeResponse(
-            id=node.id,
-            content=node.content,
-            is_ending=node.is_ending,
-            is_winning_ending=node.is_winning_ending,
-            options=node.options  # Las opciones ya están en formato JSON
-        )
-        node_dict[node.id] = node_response
-
-    # Encontrar el nodo raíz (el punto de inicio de la historia)
-    root_node = next((node for node in nodes if node.is_root), None)    
-    if not root_node:
+    complete_story = load_complete_story(db, story)
+    if complete_story is None:
         raise HTTPException(status_code=500, detail="Story root node not found")
+    return complete_story
+
+
+def _get_node_subtree(db: Session, story_id: int, node_id: Optional[int], prefetch: int) -> StoryNodeTreeResponse:
+    subtree = load_node_subtree(db, story_id, node_id, prefetch)
+    if subtree is not None:
+        return subtree
+
+    with SessionLocal() as primary:
+        if replica_engine is not None:
+            # Nodos recién guardados que la réplica todavía no tiene
+            subtree = load_node_subtree(primary, story_id, node_id, prefetch)
+
+        # Historias guardadas antes de existir `path`: se calculan las rutas una vez y se reintenta
+        unmapped = subtree is None and primary.query(StoryNode.id).filter(
+            StoryNode.story_id == story_id, StoryNode.path.is_(None)
+        ).first()
+        if unmapped:
+            backfill_node_paths(primary, story_id)
+            primary.commit()
+            subtree = load_node_subtree(primary, story_id, node_id, prefetch)
+    if subtree is None:
+        raise HTTPException(status_code=404, detail="Story node not found")
+    return subtree
+
+
+@router.get("/{story_id}/root", response_model=StoryNodeTreeResponse)
+def get_story_root(
+    story_id: int,
+    request: Request,
+    prefetch: int = Query(1, ge=0, le=settings.STORY_NODE_MAX_PREFETCH),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Obtiene el nodo raíz de una historia y sus hijos hasta `prefetch` niveles.
+    Es el punto de entrada para cargar una historia nodo a nodo.
+
+    Raises:
+        HTTPException 404 si la historia no existe
+    """
+    return encoded_response(request, _get_node_subtree(db, story_id, None, prefetch))
+
+
+@router.get("/{story_id}/node/{node_id}", response_model=StoryNodeTreeResponse)
+def get_story_node(
+    story_id: int,
+    node_id: int,
+    request: Request,
+    prefetch: int = Query(1, ge=0, le=settings.STORY_NODE_MAX_PREFETCH),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Obtiene un nodo de la historia y sus hijos hasta `prefetch` niveles, para
+    que el jugador cargue la historia por partes en lugar del árbol completo.
+
+    Args:
+        story_id: ID de la historia
+        node_id: ID del nodo
+        request: Petición (JSON o msgpack, gzip o brotli según sus cabeceras)
+        prefetch: Niveles de hijos a incluir (0 = solo el nodo)
+        db: Sesión de base de datos de lectura (inyectada)
+
+    Returns:
+        StoryNodeTreeResponse con el nodo y sus descendientes
+
+    Raises:
+        HTTPException 404 si el nodo no pertenece a la historia
+    """
+    return encoded_response(request, _get_node_subtree(db, story_id, node_id, prefetch))
+
+
+@router.post("/{story_id}/node/{node_id}/expand", response_model=StoryNodeTreeResponse)
+def expand_story_node(
+    story_id: int,
+    node_id: int,
+    request: Request,
+    prefetch: int = Query(1, ge=0, le=settings.STORY_NODE_MAX_PREFETCH),
+    db: Session = Depends(get_db)
+):
+    """
+    Genera el subárbol de un nodo de la frontera (modo "incremental") y lo
+    devuelve como `/node/{node_id}`. Si el nodo ya tiene opciones no llama al LLM.
+
+    El frontend lo llama para los hijos expandibles del nodo donde está el
+    jugador, así que la continuación suele estar lista antes de que elija.
+
+    Args:
+        story_id: ID de la historia
+        node_id: ID del nodo a expandir
+        prefetch: Niveles de hijos a incluir en la respuesta
+        db: Sesión de base de datos primaria (inyectada)
+
+    Raises:
+        HTTPException 404 si el nodo no existe, 409 si otro proceso lo está
+        expandiendo (con Retry-After) y 502 si falla la generación
+    """
+    try:
+        result = StoryGenerator.expand_node(db, story_id, node_id)
+    except Exception:
+        logger.exception("No se pudo expandir el nodo %s de la historia %s", node_id, story_id)
+        raise HTTPException(status_code=502, detail="Story expansion failed")
 
-    # Construir la respuesta completa
-    return CompleteStoryResponse(
-        id=story.id,
-        title=story.title,
-        session_id=story.session_id,
-        created_at=story.created_at,
-        root_node=node_dict[root_node.id],  # Nodo de inicio
-        all_nodes=node_dict  # Diccionario con todos los nodos por ID
-    )
\ No newline at end of file
+    if result == "not_found":
+        raise HTTPException(status_code=404, detail="Story node not found")
+    if result == "busy":
+        raise HTTPException(status_code=409, detail="Node expansion in progress", headers={"Retry-After": "1"})
+    return encoded_response(request, _get_node_subtree(db, story_id, node_id, prefetch))
@@ -14,24 +14,69 @@ class StoryNodeBase(BaseModel):
 class CompleteStoryNodeResponse(StoryNodeBase):
     id: int
     options: List[StoryOptionsSchema] = []
+    is_expandable: bool = False  # Sus opciones se generan con POST /story/{id}/node/{node_id}/expand
 
     class Config:
         from_attributes = True
 
 class StoryBase(BaseModel):
     title: str
-    session_id: Optional[str] = None
+    # Sin session_id: la cookie es la credencial de la biblioteca (GET /story)
+    # y esta respuesta es pública y cacheable
     
     class Config:
         from_attributes = True
 
 class CreateStoryRequest(BaseModel):
     theme: str
+    language: Optional[str] = None
+
+class StoryStatsSchema(BaseModel):
+    # Análisis del árbol al generarlo (ver core/story_analysis.py)
+    node_count: int
+    unreachable_nodes: int
+    max_depth: int  # La raíz es 0
+    winning_endings: int
+    losing_endings: int
+    branching_factor: float
+    dangling_options: int
+    has_winning_path: bool
+    expandable_nodes: int = 0  # Nodos que el modo "incremental" todavía no generó
 
 class  CompleteStoryResponse(StoryBase):
     id: int
     created_at: datetime
     root_node: CompleteStoryNodeResponse
     all_nodes: Dict[int, CompleteStoryNodeResponse]
+    stats: Optional[StoryStatsSchema] = None  # None en historias sin analizar o en streaming
+
+
+
+
+class StoryNodeTreeResponse(BaseModel):
+    story_id: int
+    title: str
+    node_id: int  # Nodo pedido
+    nodes: Dict[int, CompleteStoryNodeResponse]  # El nodo pedido y sus descendientes hasta `prefetch` niveles
+    stats: Optional[StoryStatsSchema] = None  # Tamaño total de la historia, para mostrar el progreso
+    is_complete: bool = True  # False mientras la generación en streaming agrega ramas
+
+
+class StorySummaryResponse(BaseModel):
+    # Resumen de una historia en la biblioteca de la sesión (GET /story)
+    id: int
+    title: str
+    created_at: datetime
+    theme: Optional[str] = None
+    language: Optional[str] = None
+    is_complete: bool = True
+    node_count: Optional[int] = None  # None en historias sin analizar
+    winning_endings: Optional[int] = None
+    losing_endings: Optional[int] = None
+    has_winning_path: Optional[bool] = None
+    expandable_nodes: int = 0
 
 
+class StoryLibraryResponse(BaseModel):
+    stories: List[StorySummaryResponse]
+    next_cursor: Optional[str] = None  # Cursor de la página siguiente (None si no hay más)
@@ -0,0 +1,94 @@
+"""
+Completa las estadísticas del árbol (core/story_analysis.py) de las historias
+guardadas antes de la migración 0005, o de todas con --all.
+
+Procesa las historias por lotes (un commit por lote) y borra de la caché de
+respuestas las que cambian, porque su JSON incluye las estadísticas.
+
+Uso (desde el directorio backend):
+    python -m scripts.analyze_stories
+    python -m scripts.analyze_stories --all --batch-size 50
+    python -m scripts.analyze_stories --dry-run
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import select  # Construcción de consultas SQL
+
+from core.response_cache import story_response_cache  # Respuestas serializadas a invalidar
+from core.story_analysis import analyze_stored_story  # Análisis de una historia guardada
+from db.database import SessionLocal  # Sesiones de base de datos
+from models.story import Story  # Modelo ORM
+
+logger = logging.getLogger("analyze_stories")
+
+
+def _pending_stories(reanalyze: bool):
+    """Historias completas sin analizar (o todas las completas)."""
+    query = select(Story).where(Story.is_complete.is_(True)).order_by(Story.id)
+    if reanalyze:
+        return query
+    return query.where(Story.node_count.is_(None))
+
+
+def analyze(batch_size: int, reanalyze: bool = False, dry_run: bool = False) -> dict:
+    """
+    Analiza todas las historias pendientes.
+
+    Returns:
+        Dict con historias analizadas, las que tienen camino ganador,
+        las que tienen opciones colgantes o nodos inalcanzables y errores.
+    """
+    totals = {"stories": 0, "winnable": 0, "broken": 0, "errors": 0}
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            stories = db.scalars(_pending_stories(reanalyze).where(Story.id > last_id).limit(batch_size)).all()
+            if not stories:
+                return totals
+
+            analyzed = []
+            for story in stories:
+                last_id = story.id
+                try:
+                    stats = analyze_stored_story(db, story)
+                except Exception:
+                    totals["errors"] += 1
+                    logger.exception("No se pudo analizar la historia %s", story.id)
+                    continue
+                analyzed.append(story.id)
+                totals["stories"] += 1
+                totals["winnable"] += stats.has_winning_path
+                totals["broken"] += bool(stats.dangling_options or stats.unreachable_nodes)
+
+            if dry_run:
+                db.rollback()
+                continue
+            db.commit()
+            for story_id in analyzed:
+                story_response_cache.invalidate(story_id)
+            logger.info("Lote analizado hasta la historia %s (%d en total)", last_id, totals["stories"])
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Completa las estadísticas del árbol de las historias")
+    parser.add_argument("--all", action="store_true", help="Vuelve a analizar también las ya analizadas")
+    parser.add_argument("--batch-size", type=int, default=100, help="Historias por transacción")
+    parser.add_argument("--dry-run", action="store_true", help="Analiza sin confirmar los cambios")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    totals = analyze(args.batch_size, args.all, args.dry_run)
+    action = "Se analizarían" if args.dry_run else "Se analizaron"
+    print(
+        f"{action} {totals['stories']} historias: {totals['winnable']} con camino ganador, "
+        f"{totals['broken']} con opciones colgantes o nodos inalcanzables. Errores: {totals['errors']}."
+    )
+
+
+if __name__ == "__main__":
+    main()
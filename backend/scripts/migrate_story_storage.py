@@ -0,0 +1,112 @@
+"""
+Migra historias existentes entre los formatos de almacenamiento "rows" y "blob".
+
+Procesa las historias por lotes (un commit por lote) y borra de la caché de
+respuestas las que cambian, porque sus IDs de nodo cambian con el formato.
+
+Es una operación offline: hay que detener la API (y worker.py) antes de correrla.
+- Los IDs de nodo no se conservan: el blob usa IDs locales (la raíz es 1) y al
+  volver a filas se reservan IDs nuevos. Un jugador con la historia abierta
+  pediría nodos que ya no existen.
+- El script solo borra el nivel en disco de la caché de respuestas y su propia
+  memoria; la memoria de cada proceso de la API se vacía al reiniciarlo.
+
+Uso (desde el directorio backend):
+    python -m scripts.migrate_story_storage --to blob --codec zstd --serialization msgpack
+    python -m scripts.migrate_story_storage --to rows --batch-size 50
+    python -m scripts.migrate_story_storage --to blob --dry-run
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import exists, or_, select  # Construcción de consultas SQL
+
+from core.config import settings  # Configuración de la aplicación
+from core.response_cache import story_response_cache  # Respuestas serializadas a invalidar
+from core.story_blob import CODECS, SERIALIZATIONS  # Formatos disponibles
+from core.story_store import convert_story_to_blob, convert_story_to_rows  # Conversión entre formatos
+from db.database import SessionLocal  # Sesiones de base de datos
+from models.story import Story, StoryNode  # Modelos ORM
+
+logger = logging.getLogger("migrate_story_storage")
+
+
+def _pending_stories(target: str):
+    """Historias completas que todavía no están en el formato de destino."""
+    has_rows = exists().where(StoryNode.story_id == Story.id)
+    query = select(Story).where(Story.is_complete.is_(True)).order_by(Story.id)
+    if target == "blob":
+        # El blob no admite nodos nuevos: las historias incrementales con frontera siguen en filas
+        closed = or_(Story.expandable_nodes.is_(None), Story.expandable_nodes == 0)
+        return query.where(Story.tree_blob.is_(None), has_rows, closed)
+    return query.where(Story.tree_blob.isnot(None))
+
+
+def migrate(target: str, codec: str, serialization: str, batch_size: int, dry_run: bool = False) -> dict:
+    """
+    Convierte todas las historias pendientes al formato indicado.
+
+    Returns:
+        Dict con historias migradas, nodos y bytes de blob escritos o liberados.
+    """
+    totals = {"stories": 0, "nodes": 0, "blob_bytes": 0, "errors": 0}
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            stories = db.scalars(_pending_stories(target).where(Story.id > last_id).limit(batch_size)).all()
+            if not stories:
+                return totals
+
+            migrated = []
+            for story in stories:
+                last_id = story.id
+                try:
+                    with db.begin_nested():
+                        if target == "blob":
+                            result = convert_story_to_blob(db, story, codec, serialization)
+                        else:
+                            result = convert_story_to_rows(db, story)
+                except Exception:
+                    totals["errors"] += 1
+                    logger.exception("No se pudo migrar la historia %s", story.id)
+                    continue
+                migrated.append(story.id)
+                totals["stories"] += 1
+                totals["nodes"] += result["nodes"]
+                totals["blob_bytes"] += result["bytes"]
+
+            if dry_run:
+                db.rollback()
+                continue
+            db.commit()
+            for story_id in migrated:
+                story_response_cache.invalidate(story_id)
+            logger.info("Lote migrado hasta la historia %s (%d en total)", last_id, totals["stories"])
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Migra historias entre los formatos de almacenamiento (con la API detenida: los IDs de nodo cambian)"
+    )
+    parser.add_argument("--to", choices=["blob", "rows"], required=True, help="Formato de destino")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=settings.STORY_BLOB_CODEC)
+    parser.add_argument("--serialization", choices=sorted(SERIALIZATIONS), default=settings.STORY_BLOB_SERIALIZATION)
+    parser.add_argument("--batch-size", type=int, default=100, help="Historias por transacción")
+    parser.add_argument("--dry-run", action="store_true", help="Convierte sin confirmar los cambios")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    totals = migrate(args.to, args.codec, args.serialization, args.batch_size, args.dry_run)
+    action = "Se migrarían" if args.dry_run else "Se migraron"
+    print(
+        f"{action} {totals['stories']} historias ({totals['nodes']} nodos) a '{args.to}'. "
+        f"Bytes de blob: {totals['blob_bytes']}. Errores: {totals['errors']}."
+    )
+
+
+if __name__ == "__main__":
+    main()
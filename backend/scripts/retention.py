@@ -0,0 +1,39 @@
+"""
+Ejecuta una pasada de retención (ver core/retention.py) e imprime el informe.
+
+Uso (desde el directorio backend):
+    python -m scripts.retention
+    python -m scripts.retention --dry-run
+    python -m scripts.retention --archive ndjson --batch-size 1000
+"""
+
+import argparse
+import json
+import logging
+
+from core.config import settings  # Configuración de la aplicación
+from core.retention import run_retention  # Pasada de retención
+from db.database import SessionLocal  # Sesiones de base de datos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Borra jobs vencidos e historias huérfanas")
+    parser.add_argument(
+        "--archive", choices=["none", "table", "ndjson"], default=settings.RETENTION_ARCHIVE,
+        help="Destino de los jobs borrados (por defecto RETENTION_ARCHIVE)"
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE, help="Filas por transacción")
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta lo que se borraría")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        report = run_retention(db, args.archive, args.batch_size, args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Configuración común de las pruebas.
+
+core.config lee el entorno al importarse y db.database crea el engine en ese
+momento: las variables se fijan aquí, antes de que las pruebas importen la app.
+"""
+
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/choose-your-adventure-tests.db")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("AUTO_MIGRATE", "false")
+
+
+@pytest.fixture
+def migrated_engine(tmp_path):
+    """Engine de una base SQLite nueva con todas las migraciones aplicadas."""
+    from migrations.runner import upgrade
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(migrated_engine):
+    """Sesión ORM sobre la base migrada de la prueba."""
+    from sqlalchemy.orm import Session
+
+    with Session(migrated_engine) as session:
+        yield session
+
+
+@pytest.fixture
+def story_structure():
+    """Historia de dos niveles: la raíz con dos opciones, una gana y otra sigue."""
+    from core.models import StoryLLMResponse
+
+    return StoryLLMResponse.model_validate({
+        "title": "La cueva",
+        "rootNode": {
+            "content": "Entras en la cueva.",
+            "isEnding": False,
+            "isWinningEnding": False,
+            "options": [
+                {"text": "Izquierda", "nextNode": {"content": "Encuentras el tesoro.", "isEnding": True, "isWinningEnding": True}},
+                {"text": "Derecha", "nextNode": {
+                    "content": "Un río.",
+                    "isEnding": False,
+                    "isWinningEnding": False,
+                    "options": [
+                        {"text": "Nadar", "nextNode": {"content": "Te arrastra la corriente.", "isEnding": True, "isWinningEnding": False}},
+                    ],
+                }},
+            ],
+        },
+    })
+
+
+@pytest.fixture(params=["rows", "blob"])
+def storage_backend(request, monkeypatch):
+    """Ejecuta la prueba con cada formato de almacenamiento (STORY_STORAGE_BACKEND)."""
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "STORY_STORAGE_BACKEND", request.param)
+    return request.param
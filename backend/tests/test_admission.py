@@ -0,0 +1,20 @@
+"""
+Duración de las generaciones recientes para el control de admisión (core/admission.py).
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from core.admission import GenerationDurations
+from models.job import StoryJob
+
+
+def test_durations_compare_utc_timestamps(db_session):
+    created_at = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    for index, seconds in enumerate((10, 20, 30)):
+        db_session.add(StoryJob(
+            job_id=f"job-{index}", session_id="session-a", theme="fantasy", status="completado",
+            created_at=created_at, completed_at=created_at + timedelta(seconds=seconds)
+        ))
+    db_session.commit()
+
+    assert GenerationDurations()._load(db_session) == 20
@@ -0,0 +1,24 @@
+"""
+Latencia HTTP por ruta (core/http_metrics.py).
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.http_metrics import HTTP_REQUEST_SECONDS, HTTPMetricsMiddleware
+
+
+def test_unhandled_exception_is_recorded_as_500():
+    app = FastAPI()
+    app.add_middleware(HTTPMetricsMiddleware)
+
+    @app.get("/metrics-test/falla")
+    def falla():
+        raise RuntimeError("falla")
+
+    labels = {"method": "GET", "route": "/metrics-test/falla", "status": "500"}
+    before = HTTP_REQUEST_SECONDS.snapshot(**labels).get("count", 0)
+    client = TestClient(app, raise_server_exceptions=False)
+
+    assert client.get("/metrics-test/falla").status_code == 500
+    assert HTTP_REQUEST_SECONDS.snapshot(**labels)["count"] == before + 1
@@ -0,0 +1,51 @@
+"""
+Reclamo, dueño y recuperación de los trabajos (core/job_queue.py).
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from core.job_queue import claim_job, recover_stale_jobs, update_owned_job
+from models.job import StoryJob
+
+
+def _job(db_session, job_id, status="pending", **values):
+    job = StoryJob(job_id=job_id, session_id="session-a", theme="fantasy", status=status, **values)
+    db_session.add(job)
+    db_session.commit()
+    return job
+
+
+def test_api_claims_its_job_once_and_with_a_lease(db_session):
+    job = _job(db_session, "job-1")
+
+    assert claim_job(db_session, "job-1", "api-a", lease_seconds=60)
+    db_session.commit()
+    assert not claim_job(db_session, "job-1", "worker-b", lease_seconds=60)
+
+    assert (job.status, job.claimed_by, job.attempts) == ("procesando", "api-a", 1)
+    assert job.lease_expires_at is not None
+
+
+def test_recovered_job_is_not_overwritten_by_its_previous_owner(db_session):
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    job = _job(db_session, "job-1", status="procesando", claimed_by="worker-a", attempts=1, lease_expires_at=expired)
+
+    assert recover_stale_jobs(db_session, max_attempts=3) == 1
+    db_session.refresh(job)
+    assert claim_job(db_session, "job-1", "worker-b", lease_seconds=60)
+    db_session.commit()
+
+    assert not update_owned_job(db_session, "job-1", "worker-a", status="completado", story_id=7)
+    assert update_owned_job(db_session, "job-1", "worker-b", status="completado", story_id=8)
+    db_session.commit()
+    assert (job.status, job.story_id, job.attempts) == ("completado", 8, 2)
+
+
+def test_jobs_without_lease_are_not_recovered(db_session):
+    # Sin lease nadie puede saber si el proceso que lo generaba sigue vivo
+    long_ago = datetime.now(timezone.utc) - timedelta(days=1)
+    job = _job(db_session, "job-1", status="procesando", created_at=long_ago)
+
+    assert recover_stale_jobs(db_session, max_attempts=3) == 0
+    db_session.refresh(job)
+    assert job.status == "procesando"
@@ -0,0 +1,33 @@
+"""
+Modelo falso y envoltorio de los proveedores de LLM (core/llm_providers.py).
+"""
+
+import json
+
+from core.llm_providers import FakeStoryChatModel, ManagedLLM, RateLimiter
+
+# El texto del prompt ya no decide la forma: lleva las dos marcas antiguas a propósito
+PROMPT = 'Devuelve "synopsis". Opción elegida: Huir'
+
+
+def _llm():
+    return ManagedLLM(FakeStoryChatModel(depth=3), RateLimiter())
+
+
+def test_shape_comes_from_the_caller_not_from_the_prompt():
+    llm = _llm()
+
+    story = json.loads(llm.invoke(PROMPT).content)
+    outline = json.loads(llm.invoke(PROMPT, shape="outline").content)
+
+    assert "synopsis" not in story
+    assert "synopsis" in outline
+    assert {"text", "summary", "canWin"} <= set(outline["rootNode"]["options"][0])
+
+
+def test_stream_uses_the_requested_shape():
+    llm = _llm()
+
+    streamed = "".join(str(chunk.content) for chunk in llm.stream(PROMPT, shape="outline"))
+
+    assert streamed == llm.invoke(PROMPT, shape="outline").content
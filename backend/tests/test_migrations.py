@@ -0,0 +1,37 @@
+"""
+Las migraciones crean todo lo que declaran los modelos, desde una base nueva
+y desde las bases que dejaba `create_tables()` antes de existir las migraciones.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+from db.database import Base
+from migrations.runner import applied_versions, load_migrations, upgrade
+from migrations.schema import schema_differences
+from migrations.versions import v0001_baseline
+
+
+def test_migrated_schema_covers_models(migrated_engine):
+    assert schema_differences(migrated_engine) == []
+
+
+def test_upgrade_twice_applies_nothing(migrated_engine):
+    assert upgrade(migrated_engine) == []
+
+
+@pytest.mark.parametrize(
+    "create_all",
+    [v0001_baseline.metadata.create_all, Base.metadata.create_all],
+    ids=["esquema-inicial", "modelos-actuales"],
+)
+def test_upgrade_database_created_with_create_all(tmp_path, create_all):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    create_all(engine)
+
+    upgrade(engine)
+
+    assert schema_differences(engine) == []
+    with engine.connect() as connection:
+        assert applied_versions(connection) == {migration.version for migration in load_migrations()}
+    engine.dispose()
@@ -0,0 +1,24 @@
+"""
+Planes de las consultas frecuentes sobre una base recién migrada
+(lo mismo que `python -m migrations check-plans`).
+"""
+
+import pytest
+
+from migrations.plans import EXPECTED_INDEXES, check_query_plans, hot_queries
+
+
+@pytest.fixture
+def plans(migrated_engine):
+    return check_query_plans(migrated_engine)
+
+
+@pytest.mark.parametrize("name", sorted(hot_queries()))
+def test_hot_query_uses_an_index(plans, name):
+    assert plans[name]["problems"] == [], "\n".join(plans[name]["plan"])
+
+
+@pytest.mark.parametrize("name,index", sorted(EXPECTED_INDEXES.items()))
+def test_hot_query_uses_expected_index(plans, name, index):
+    assert any(index in line for line in plans[name]["plan"]), "\n".join(plans[name]["plan"])
+
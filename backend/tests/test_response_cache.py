@@ -0,0 +1,32 @@
+"""
+Nivel en disco de la caché de respuestas (core/response_cache.py).
+"""
+
+import json
+
+from core.response_cache import StoryResponseCache
+
+BODY = json.dumps({"title": "La cueva", "content": "Entras en la cueva. " * 200}).encode()
+
+
+def test_other_process_reads_every_variant_from_disk(tmp_path):
+    written = StoryResponseCache(max_bytes=1 << 20, disk_dir=str(tmp_path)).put(7, BODY)
+
+    # Otra instancia (otro proceso) sin nada en memoria
+    entry = StoryResponseCache(max_bytes=1 << 20, disk_dir=str(tmp_path)).get(7)
+
+    assert entry.body == BODY
+    assert entry.etag == written.etag
+    assert entry.variants == written.variants
+
+
+def test_invalidate_removes_every_variant_file(tmp_path):
+    cache = StoryResponseCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    cache.put(7, BODY)
+    cache.put(8, BODY)
+
+    cache.invalidate(7)
+
+    assert cache.get(7) is None
+    assert all("-7." not in path.name for path in tmp_path.iterdir())
+    assert cache.get(8) is not None
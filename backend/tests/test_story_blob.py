@@ -0,0 +1,61 @@
+"""
+Formato blob de una historia completa (core/story_blob.py).
+"""
+
+import pytest
+from sqlalchemy import select
+
+from core.story_blob import StoryBlob, blob_nodes_from_flat, blob_nodes_from_rows, encode_story_blob
+from core.story_persistence import flatten_story_tree, persist_story_tree
+from models.story import StoryNode
+
+FORMATS = [("none", "json"), ("zlib", "json"), ("zstd", "msgpack")]
+
+
+def _require(codec, serialization):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    if serialization == "msgpack":
+        pytest.importorskip("msgpack")
+
+
+@pytest.mark.parametrize("codec, serialization", FORMATS)
+def test_blob_round_trip_gives_each_node_and_its_subtree(story_structure, codec, serialization):
+    _require(codec, serialization)
+    nodes = blob_nodes_from_flat(flatten_story_tree(story_structure.rootNode))
+
+    blob = StoryBlob(encode_story_blob(nodes, codec, serialization))
+
+    # Preorden: 1 raíz, 2 "Izquierda", 3 "Derecha", 4 "Nadar"
+    assert (blob.codec, blob.serialization, blob.node_count) == (codec, serialization, 4)
+    root = blob.node(1)
+    assert root["content"] == "Entras en la cueva."
+    assert root["options"] == [{"text": "Izquierda", "node_id": 2}, {"text": "Derecha", "node_id": 3}]
+    assert blob.node(2)["is_winning_ending"] is True
+    assert [node["id"] for node in blob.subtree(1, prefetch=1)] == [1, 2, 3]
+    assert [node["id"] for node in blob.subtree(3, prefetch=1)] == [3, 4]
+    assert [node["id"] for node in blob.subtree(1, prefetch=2)] == [1, 2, 3, 4]
+    with pytest.raises(KeyError):
+        blob.node(5)
+
+
+def test_nodes_from_rows_match_the_tree_they_were_saved_from(db_session, story_structure):
+    story = persist_story_tree(db_session, "session-a", story_structure)
+    db_session.commit()
+    # Orden de lectura distinto del preorden: la conversión recorre las opciones desde la raíz
+    rows = db_session.scalars(
+        select(StoryNode).where(StoryNode.story_id == story.id).order_by(StoryNode.id.desc())
+    ).all()
+
+    from_rows = blob_nodes_from_rows(rows)
+
+    assert from_rows == blob_nodes_from_flat(flatten_story_tree(story_structure.rootNode))
+    blob = StoryBlob(encode_story_blob(from_rows))
+    assert [node["content"] for node in blob.nodes()] == [
+        "Entras en la cueva.", "Encuentras el tesoro.", "Un río.", "Te arrastra la corriente."
+    ]
+
+
+def test_nodes_from_rows_require_a_root():
+    with pytest.raises(ValueError):
+        blob_nodes_from_rows([])
@@ -0,0 +1,59 @@
+"""
+Caché de historias por tema (core/story_cache.py).
+"""
+
+import threading
+
+from core.story_cache import StoryCache, cache_key
+
+KEY = cache_key("Piratas", "es")
+
+
+def _generator(start=1):
+    ids = iter(range(start, 1000))
+    return lambda: next(ids)
+
+
+def test_without_reuse_every_request_generates():
+    cache = StoryCache(max_keys=10, ttl_seconds=60, reuse_k=0)
+    generate = _generator()
+
+    results = [cache.get_or_generate(KEY, generate, f"session-{i}") for i in range(3)]
+
+    assert results == [(1, True), (2, True), (3, True)]
+
+
+def test_reuse_skips_stories_the_session_already_received():
+    cache = StoryCache(max_keys=10, ttl_seconds=60, reuse_k=2)
+    generate = _generator()
+    cache.get_or_generate(KEY, generate, "session-a")
+    cache.get_or_generate(KEY, generate, "session-b")
+
+    # La rotación empieza por la 1, que "session-a" ya tiene
+    assert cache.get_or_generate(KEY, generate, "session-a", exclude={1}) == (2, False)
+    # Con todas recibidas se genera una nueva
+    assert cache.get_or_generate(KEY, generate, "session-a", exclude={1, 2}) == (3, True)
+
+
+def test_concurrent_requests_of_the_same_session_do_not_share_a_generation():
+    cache = StoryCache(max_keys=10, ttl_seconds=60, reuse_k=0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_generate():
+        started.set()
+        release.wait(5)
+        return 1
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(a1=cache.get_or_generate(KEY, slow_generate, "session-a")))
+    leader.start()
+    started.wait(5)
+
+    # Otra petición de la misma sesión genera la suya; la de otra sesión espera a la del líder
+    results["a2"] = cache.get_or_generate(KEY, lambda: 2, "session-a")
+    _, shared, is_leader = cache._lookup(KEY, "session-b", frozenset())
+    release.set()
+    leader.join(5)
+
+    assert results == {"a1": (1, True), "a2": (2, True)}
+    assert not is_leader and shared.result(5) == 1
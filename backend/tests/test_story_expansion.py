@@ -0,0 +1,67 @@
+"""
+Lease de la expansión de nodos del modo incremental (core/story_expansion.py).
+"""
+
+import pytest
+from sqlalchemy import func, select
+
+from core.models import StoryNodeLLM
+from core.story_expansion import ExpansionLeaseLost, claim_expansion, persist_expansion
+from core.story_persistence import persist_story_tree
+from models.story import StoryNode
+
+EXPANSION = StoryNodeLLM.model_validate({
+    "content": "",
+    "isEnding": False,
+    "isWinningEnding": False,
+    "options": [
+        {"text": "Salir", "nextNode": {"content": "Ves el sol.", "isEnding": True, "isWinningEnding": True}},
+    ],
+})
+
+
+@pytest.fixture
+def frontier(db_session, story_structure):
+    """Historia con una hoja marcada como frontera."""
+    story = persist_story_tree(db_session, "session-a", story_structure)
+    node = db_session.scalar(
+        select(StoryNode).where(StoryNode.story_id == story.id, StoryNode.content == "Te arrastra la corriente.")
+    )
+    node.is_ending = False
+    node.is_expandable = True
+    db_session.commit()
+    return story, node
+
+
+def _node_count(db_session, story):
+    return db_session.scalar(select(func.count()).where(StoryNode.story_id == story.id))
+
+
+def test_expansion_is_written_while_the_lease_is_held(db_session, frontier):
+    story, node = frontier
+    claimed_at = claim_expansion(db_session, story.id, node.id)
+
+    added = persist_expansion(db_session, story, node, EXPANSION, levels=1, claimed_at=claimed_at)
+    db_session.commit()
+
+    assert added == 1
+    db_session.refresh(node)
+    assert not node.is_expandable and node.expansion_started_at is None
+    assert len(node.options) == 1
+
+
+def test_expansion_is_dropped_after_another_process_reclaims_the_node(db_session, frontier):
+    story, node = frontier
+    claimed_at = claim_expansion(db_session, story.id, node.id)
+    # Vence el lease y otro proceso reclama el nodo con un instante posterior
+    node.expansion_started_at = claimed_at.replace(year=claimed_at.year + 1)
+    db_session.commit()
+    before = _node_count(db_session, story)
+
+    with pytest.raises(ExpansionLeaseLost):
+        persist_expansion(db_session, story, node, EXPANSION, levels=1, claimed_at=claimed_at)
+    db_session.rollback()
+
+    assert _node_count(db_session, story) == before
+    db_session.refresh(node)
+    assert node.is_expandable
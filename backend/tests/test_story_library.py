@@ -0,0 +1,45 @@
+"""
+Biblioteca de historias de una sesión (core/story_library.py).
+"""
+
+from core.story_library import list_session_stories, received_story_ids
+from core.story_store import save_story_tree
+from models.job import StoryJob
+
+
+def _deliver(db, story, session_id, job_id):
+    db.add(StoryJob(job_id=job_id, session_id=session_id, theme="piratas", status="completado", story_id=story.id))
+    db.commit()
+
+
+def test_summary_has_theme_and_language(db_session, story_structure, storage_backend):
+    story = save_story_tree(db_session, "session-a", story_structure, "piratas", "es")
+    _deliver(db_session, story, "session-a", "job-1")
+
+    library = list_session_stories(db_session, "session-a", None, 10)
+
+    [summary] = library.stories
+    assert (summary.theme, summary.language) == ("piratas", "es")
+    assert summary.node_count == 4
+
+
+def test_library_follows_the_job_that_delivered_the_story(db_session, story_structure):
+    # Historia generada para "session-a" y reutilizada para "session-b"
+    story = save_story_tree(db_session, "session-a", story_structure, "piratas", "es")
+    _deliver(db_session, story, "session-b", "job-1")
+
+    assert [s.id for s in list_session_stories(db_session, "session-b", None, 10).stories] == [story.id]
+    assert list_session_stories(db_session, "session-a", None, 10).stories == []
+    assert received_story_ids(db_session, "session-b") == {story.id}
+
+
+def test_pages_follow_the_cursor(db_session, story_structure):
+    stories = [save_story_tree(db_session, "session-a", story_structure) for _ in range(5)]
+    for index, story in enumerate(stories):
+        _deliver(db_session, story, "session-a", f"job-{index}")
+
+    first = list_session_stories(db_session, "session-a", None, 3)
+    second = list_session_stories(db_session, "session-a", first.next_cursor, 3)
+
+    assert [s.id for s in first.stories + second.stories] == [story.id for story in reversed(stories)]
+    assert second.next_cursor is None
@@ -0,0 +1,84 @@
+"""
+Parseo de la respuesta completa del LLM (core/story_parser.py).
+"""
+
+import json
+
+import pytest
+
+from core.models import StoryOutlineLLM
+from core.story_parser import StoryParseError, check_tree_limits, extract_json_text, parse_json_model, parse_story
+
+STORY = {
+    "title": "La cueva",
+    "rootNode": {
+        "content": "Entras en la cueva.",
+        "isEnding": False,
+        "isWinningEnding": False,
+        "options": [
+            {"text": "Izquierda", "nextNode": {"content": "Encuentras el tesoro.", "isEnding": True, "isWinningEnding": True}},
+            {"text": "Derecha", "next_node": {
+                "content": "Un río.",
+                "isEnding": False,
+                "isWinningEnding": False,
+                "options": [
+                    {"text": "Nadar", "nextNode": {"content": "Te arrastra la corriente.", "isEnding": True, "isWinningEnding": False}},
+                ],
+            }},
+        ],
+    },
+}
+TEXT = json.dumps(STORY, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("response", [
+    TEXT,
+    f"```json\n{TEXT}\n```",
+    f"```\n{TEXT}\n```",
+    f"Aquí tienes tu historia:\n\n{TEXT}\n\n¡Que la disfrutes!",
+    f"Primero un ejemplo:\n```python\nprint('hola')\n```\nY la historia:\n```json\n{TEXT}\n```",
+])
+def test_json_is_found_alone_in_fences_or_surrounded_by_prose(response):
+    assert json.loads(extract_json_text(response)) == STORY
+
+
+def test_response_without_json_is_rejected():
+    with pytest.raises(StoryParseError):
+        extract_json_text("Lo siento, no puedo escribir esa historia.")
+
+
+def test_story_is_validated_with_both_next_node_keys():
+    story = parse_story(f"```json\n{TEXT}\n```", max_depth=3, max_nodes=4)
+
+    assert story.title == "La cueva"
+    left, right = story.rootNode.options
+    assert left.next_node.isWinningEnding
+    assert right.next_node.options[0].next_node.content == "Te arrastra la corriente."
+
+
+def test_tree_limits_count_nodes_and_levels():
+    assert check_tree_limits(STORY, max_depth=3, max_nodes=4) == 4
+    with pytest.raises(StoryParseError, match="profundidad"):
+        check_tree_limits(STORY, max_depth=2, max_nodes=4)
+    with pytest.raises(StoryParseError, match="nodos"):
+        check_tree_limits(STORY, max_depth=3, max_nodes=3)
+
+
+@pytest.mark.parametrize("response", [
+    "{\"title\": \"La cueva\", \"rootNode\": ",  # JSON truncado
+    json.dumps({"title": "La cueva"}),  # Sin rootNode
+    json.dumps({"title": "La cueva", "rootNode": {"isEnding": "quizás"}}),  # No cumple el esquema
+])
+def test_invalid_stories_raise_parse_errors(response):
+    with pytest.raises(StoryParseError):
+        parse_story(response)
+
+
+def test_other_models_use_the_same_extraction():
+    outline = {"title": "La cueva", "rootNode": {"content": "Entras.", "options": [{"text": "Izquierda"}]}}
+
+    parsed = parse_json_model(f"Esquema:\n```json\n{json.dumps(outline)}\n```", StoryOutlineLLM)
+
+    assert parsed.rootNode.options[0].text == "Izquierda"
+    with pytest.raises(StoryParseError):
+        parse_json_model('{"title": "La cueva"}', StoryOutlineLLM)
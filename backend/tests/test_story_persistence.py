@@ -0,0 +1,35 @@
+"""
+Escritura de nodos por partes (core/story_persistence.py).
+"""
+
+from sqlalchemy import select
+
+from core.story_persistence import persist_streamed_branch
+from models.story import Story, StoryNode
+
+
+def test_streamed_branch_is_written_with_links_between_its_nodes(db_session):
+    story = Story(title="La cueva", session_id="session-a", is_complete=False)
+    db_session.add(story)
+    db_session.commit()
+    story_id = story.id
+
+    # Orden del stream: cada nodo se cierra después de sus hijos
+    branch = [
+        ((0, 0), {"content": "Encuentras el tesoro.", "isEnding": True, "isWinningEnding": True}),
+        ((0, 1), {"content": "Te pierdes.", "isEnding": True}),
+        ((0,), {"content": "Bajas al pozo.", "options": [{"text": "Cavar"}, {"text": "Seguir"}]}),
+    ]
+    node_ids = persist_streamed_branch(db_session, story_id, branch)
+    db_session.commit()
+
+    nodes = {node.id: node for node in db_session.scalars(select(StoryNode).where(StoryNode.story_id == story_id))}
+    assert set(nodes) == set(node_ids.values())
+    parent = nodes[node_ids[(0,)]]
+    assert parent.depth == 1
+    assert parent.options == [
+        {"text": "Cavar", "node_id": node_ids[(0, 0)]},
+        {"text": "Seguir", "node_id": node_ids[(0, 1)]},
+    ]
+    assert nodes[node_ids[(0, 0)]].is_winning_ending
+    assert nodes[node_ids[(0, 1)]].options == []
@@ -0,0 +1,40 @@
+"""
+Lectura y escritura de historias en los dos formatos de almacenamiento
+(core/story_store.py).
+"""
+
+import json
+
+from core.story_store import load_complete_story, load_node_subtree, save_story_tree
+
+
+def test_complete_story_does_not_expose_owner_session(db_session, story_structure, storage_backend):
+    story = save_story_tree(db_session, "session-a", story_structure)
+    db_session.commit()
+
+    body = json.loads(load_complete_story(db_session, story).model_dump_json())
+
+    assert "session_id" not in body
+    assert "session-a" not in json.dumps(body)
+    assert body["root_node"]["content"] == "Entras en la cueva."
+    assert len(body["all_nodes"]) == 4
+
+
+def test_root_subtree_reports_whether_the_story_is_complete(db_session, story_structure, storage_backend):
+    story = save_story_tree(db_session, "session-a", story_structure)
+    story.is_complete = False  # Como la raíz de una generación en streaming
+    db_session.commit()
+
+    root = load_node_subtree(db_session, story.id, None, prefetch=1)
+
+    assert root.is_complete is False
+    assert root.nodes[root.node_id].content == "Entras en la cueva."
+    assert len(root.nodes) == 3
+
+
+def test_pooled_story_enters_the_stock_in_the_same_insert(db_session, story_structure, storage_backend):
+    story = save_story_tree(db_session, None, story_structure, "Fantasy", None, pool_key="fantasy|")
+    db_session.commit()
+
+    assert story.pool_key == "fantasy|"
+    assert story.session_id is None
@@ -0,0 +1,83 @@
+"""
+Parser incremental de la respuesta en streaming (core/stream_parser.py).
+"""
+
+import json
+
+import pytest
+
+from core.stream_parser import NodeClosedEvent, NodeHeaderEvent, StoryStreamParser, TitleEvent
+
+STORY = {
+    "title": "La \"cueva\" \\ oscura",
+    "rootNode": {
+        "content": "Entras. Hay llaves {} y corchetes [] en la pared.",
+        "isEnding": False,
+        "isWinningEnding": False,
+        "options": [
+            {"text": "Izquierda", "nextNode": {"content": "Encuentras el tesoro.", "isEnding": True, "isWinningEnding": True}},
+            {"text": "Derecha", "next_node": {
+                "content": "Un río con \"corriente\".",
+                "isEnding": False,
+                "isWinningEnding": False,
+                "options": [
+                    {"text": "Nadar", "nextNode": {"content": "Te arrastra.\nFin.", "isEnding": True, "isWinningEnding": False}},
+                ],
+            }},
+        ],
+    },
+}
+TEXT = "```json\n" + json.dumps(STORY, ensure_ascii=False, indent=1) + "\n```"
+
+
+def _feed(chunks):
+    parser = StoryStreamParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return parser, events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(TEXT)])
+def test_events_do_not_depend_on_how_the_text_is_split(size):
+    parser, events = _feed([TEXT[i:i + size] for i in range(0, len(TEXT), size)])
+
+    assert parser.text == TEXT
+    assert events[0] == TitleEvent(title='La "cueva" \\ oscura')
+    assert events[1] == NodeHeaderEvent(
+        path=(), fields={"content": STORY["rootNode"]["content"], "isEnding": False, "isWinningEnding": False}
+    )
+    closed = [event for event in events if isinstance(event, NodeClosedEvent)]
+    # Cada nodo se cierra después de sus hijos; la raíz al final
+    assert [event.path for event in closed] == [(0,), (1, 0), (1,), ()]
+    assert closed[-1].data == STORY["rootNode"]
+
+
+def test_closed_nodes_carry_their_subtree_and_option_text():
+    _, events = _feed([TEXT])
+    closed = {event.path: event for event in events if isinstance(event, NodeClosedEvent)}
+
+    # nextNode y next_node llevan por igual al siguiente nodo
+    assert closed[(0,)].option_text == "Izquierda"
+    assert closed[(1,)].option_text == "Derecha"
+    assert closed[(1,)].data == STORY["rootNode"]["options"][1]["next_node"]
+    assert closed[(1, 0)].data["content"] == "Te arrastra.\nFin."
+    assert closed[()].option_text is None
+
+
+def test_values_split_inside_escapes_and_literals():
+    # Cortes justo después de una barra invertida y en medio de true/false
+    text = '{"title": "a\\"b", "rootNode": {"content": "x", "isEnding": true, "isWinningEnding": false, "options": []}}'
+    chunks = [text[:13], text[13:15], text[15:60], text[60:64], text[64:]]
+
+    _, events = _feed(chunks)
+
+    assert events[0] == TitleEvent(title='a"b')
+    assert NodeHeaderEvent(path=(), fields={"content": "x", "isEnding": True, "isWinningEnding": False}) in events
+    assert events[-1] == NodeClosedEvent(
+        path=(), data={"content": "x", "isEnding": True, "isWinningEnding": False, "options": []}
+    )
+
+
+def test_text_after_the_json_is_ignored():
+    parser, events = _feed(['{"title": "t", "rootNode": {"content": "x", "options": []}}', "\n```\n{\"otro\": 1}"])
+
+    assert [type(event) for event in events] == [TitleEvent, NodeHeaderEvent, NodeClosedEvent]
@@ -0,0 +1,151 @@
+"""
+Worker independiente que procesa la cola durable de trabajos (JOB_QUEUE_BACKEND="sql").
+
+Permite escalar la generación de historias por separado de los procesos de la API:
+cada worker procesa hasta `--concurrency` trabajos a la vez, lo que también
+limita la cantidad de llamadas simultáneas al LLM.
+
+Uso (desde el directorio backend):
+    python worker.py --concurrency 4
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from core.config import settings  # Configuración centralizada
+from core.job_queue import claim_next_job, heartbeat, recover_stale_jobs  # Operaciones de la cola
+from core.retention import run_retention  # Limpieza de jobs vencidos e historias huérfanas
+from core.story_pool import story_pool_replenisher  # Reposición del stock de historias
+from db.database import SessionLocal, engine  # Sesiones y motor de la base de datos
+from migrations import upgrade  # Migraciones versionadas del esquema
+from routers.story import generate_story_task  # Tarea de generación compartida con la API
+
+logger = logging.getLogger("worker")
+
+
+class _Heartbeat:
+    """
+    Renueva el lease de un trabajo en un thread aparte mientras se procesa.
+    Se usa como context manager alrededor de la generación.
+    """
+
+    def __init__(self, job_id: str, worker_id: str, lease_seconds: int):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        # Se late tres veces por lease para tolerar algún retraso
+        while not self._stop.wait(self.lease_seconds / 3):
+            db = SessionLocal()
+            try:
+                if not heartbeat(db, self.job_id, self.worker_id, self.lease_seconds):
+                    logger.warning("El job %s ya no pertenece a %s", self.job_id, self.worker_id)
+                    return
+            except Exception:
+                logger.exception("Error renovando el lease del job %s", self.job_id)
+            finally:
+                db.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _worker_loop(worker_id: str, stop_event: threading.Event):
+    """Reclama y procesa trabajos hasta que se pida detener el worker."""
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_next_job(db, worker_id, settings.JOB_LEASE_SECONDS)
+            claimed = (job.job_id, job.theme, job.session_id, job.language) if job else None
+        except Exception:
+            logger.exception("Error reclamando trabajos")
+            claimed = None
+        finally:
+            db.close()
+
+        if not claimed:
+            stop_event.wait(settings.WORKER_POLL_INTERVAL)
+            continue
+
+        job_id, theme, session_id, language = claimed
+        logger.info("%s procesando job %s", worker_id, job_id)
+        with _Heartbeat(job_id, worker_id, settings.JOB_LEASE_SECONDS):
+            generate_story_task(job_id, theme, session_id, language, worker_id)
+
+
+def run_worker(concurrency: int):
+    """
+    Lanza `concurrency` threads de procesamiento y recupera periódicamente
+    los trabajos abandonados hasta recibir SIGINT/SIGTERM. Con
+    RETENTION_INTERVAL_SECONDS también ejecuta la retención cada tanto.
+    """
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    base_id = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [
+        threading.Thread(target=_worker_loop, args=(f"{base_id}-{i}", stop_event), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info("Worker %s iniciado con concurrencia %d", base_id, concurrency)
+
+    if settings.STORY_POOL_ENABLED:
+        story_pool_replenisher.start()
+
+    next_retention = time.monotonic()
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            recovered = recover_stale_jobs(db, settings.JOB_MAX_ATTEMPTS)
+            if recovered:
+                logger.info("Se recuperaron %d trabajos abandonados", recovered)
+        except Exception:
+            logger.exception("Error recuperando trabajos abandonados")
+        finally:
+            db.close()
+
+        if settings.RETENTION_INTERVAL_SECONDS > 0 and time.monotonic() >= next_retention:
+            next_retention = time.monotonic() + settings.RETENTION_INTERVAL_SECONDS
+            db = SessionLocal()
+            try:
+                run_retention(db)
+            except Exception:
+                logger.exception("Error ejecutando la retención")
+            finally:
+                db.close()
+        stop_event.wait(settings.JOB_LEASE_SECONDS / 2)
+
+    # Espera a que los trabajos en curso terminen antes de salir
+    story_pool_replenisher.stop()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de generación de historias")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.WORKER_CONCURRENCY,
+        help="Trabajos procesados en paralelo (por defecto WORKER_CONCURRENCY)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if settings.DEBUG else logging.INFO)
+    if settings.AUTO_MIGRATE:
+        upgrade(engine)
+    run_worker(args.concurrency)
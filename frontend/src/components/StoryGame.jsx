@@ -4,26 +4,81 @@
  * Este es el componente principal del juego interactivo.
  * Renderiza el nodo actual de la historia, muestra el contenido y las opciones disponibles.
  * También maneja la lógica de navegación entre nodos y la pantalla de finalización.
+ * En las historias incrementales genera por adelantado los nodos de la frontera
+ * que están a un paso del jugador.
  */
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 
-function StoryGame({ story, onNewStory }) {
+function StoryGame({ story, onNewStory, loadNode, expandNode }) {
+    const [nodes, setNodes] = useState({});
     const [currentNodeId, setCurrentNodeId] = useState(null);
     const [currentNode, setCurrentNode] = useState(null);
     const [options, setOptions] = useState([]);
     const [isEnding, setIsEnding] = useState(false);
     const [isWinningEnding, setIsWinningEnding] = useState(false);
+    const expanding = useRef(new Set());
 
     useEffect(() => {
         if (story && story.root_node) {
-            const rootNodeId = story.root_node.id;
-            setCurrentNodeId(rootNodeId);
+            // Una historia en streaming se recarga con más ramas: se agregan sin mover al jugador
+            setNodes((previous) => ({ ...previous, ...(story.all_nodes || {}) }));
+            setCurrentNodeId((current) => current ?? story.root_node.id);
         }
     }, [story]);
 
+    const fetchNodes = (nodeId) => {
+        // Pide el nodo y sus siguientes niveles, y los agrega a los ya cargados
+        loadNode(nodeId)
+            .then((loaded) => setNodes((previous) => ({ ...previous, ...loaded })))
+            .catch(() => {});
+    };
+
+    const expand = (nodeId) => {
+        // Una sola petición por nodo; los nodos generados se agregan a los ya cargados
+        if (!expandNode || expanding.current.has(nodeId)) {
+            return;
+        }
+        expanding.current.add(nodeId);
+        expandNode(nodeId)
+            .then((loaded) => setNodes((previous) => ({ ...previous, ...loaded })))
+            .catch(() => {})
+            .finally(() => expanding.current.delete(nodeId));
+    };
+
     useEffect(() => {
-        if (currentNodeId && story && story.all_nodes) {
-            const node = story.all_nodes[currentNodeId];
+        if (currentNodeId) {
+            const node = nodes[currentNodeId];
+
+            if (!node) {
+                if (loadNode) {
+                    fetchNodes(currentNodeId);
+                }
+                return;
+            }
+
+            // Precarga: si falta algún nodo de los dos siguientes niveles, se pide antes de que el jugador elija
+            if (loadNode && !node.is_ending) {
+                const missing = (node.options || []).some((option) => {
+                    const child = nodes[option.node_id];
+                    return !child || (!child.is_ending && (child.options || []).some((next) => !nodes[next.node_id]));
+                });
+                if (missing) {
+                    fetchNodes(currentNodeId);
+                }
+            }
+
+            // El jugador llegó a la frontera antes de que estuviera generada
+            if (node.is_expandable) {
+                expand(currentNodeId);
+            }
+
+            // Un nivel por adelantado: se generan los hijos de la frontera mientras el jugador lee
+            (node.options || []).forEach((option) => {
+                const child = nodes[option.node_id];
+                if (child && child.is_expandable) {
+                    expand(option.node_id);
+                }
+            });
 
             setCurrentNode(node);
             setIsEnding(node.is_ending);
@@ -35,7 +90,7 @@ function StoryGame({ story, onNewStory }) {
                 setOptions([]);
             }
         }
-    }, [currentNodeId, story]);
+    }, [currentNodeId, nodes]);
 
     const chooseOption = (optionId) => {
         setCurrentNodeId(optionId);
@@ -74,6 +129,10 @@ function StoryGame({ story, onNewStory }) {
                             </button>
                         </div>
                     </div>
+                ) : currentNode.is_expandable ? (
+                    <div className="story-options">
+                        <p>Continuando la historia...</p>
+                    </div>
                 ) : (
                     <div className="story-options">
                         <h3>¿Qué quieres hacer?</h3>
@@ -3,7 +3,9 @@
  * 
  * Este componente maneja la creación de nuevas historias.
  * Permite al usuario ingresar un tema, envía la solicitud al backend,
- * y hace polling del estado del trabajo hasta que la historia esté lista.
+ * y sigue el estado del trabajo hasta que la historia esté lista:
+ * primero con Server-Sent Events (una sola petición por job) y, si el
+ * navegador o la red no lo permiten, con polling.
  */
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
@@ -19,12 +21,38 @@ function StoryGenerator() {
     const [jobStatus, setJobStatus] = useState(null);
     const [error, setError] = useState(null);
     const [loading, setLoading] = useState(false);
+    const [useEvents, setUseEvents] = useState(typeof EventSource !== "undefined");
+
+    useEffect(() => {
+        if (!jobId || !useEvents) {
+            return;
+        }
+
+        // El servidor envía un evento "status" con cada transición del job
+        const source = new EventSource(`${API_BASE_URL}/job/${jobId}/events`, { withCredentials: true });
+
+        source.addEventListener("status", (event) => {
+            const data = JSON.parse(event.data);
+            if (data.status === "completado" || data.status === "error") {
+                source.close();
+            }
+            handleJobUpdate(jobId, data);
+        });
+
+        // Si el stream falla, volver al polling
+        source.onerror = () => {
+            source.close();
+            setUseEvents(false);
+        };
+
+        return () => source.close();
+    }, [jobId, useEvents]);
 
     useEffect(() => {
         let pollInterval;
 
-        // Hacer polling mientras el job esté pendiente o procesando
-        if (jobId && (jobStatus === "pending" || jobStatus === "procesando")) {
+        // Hacer polling mientras el job esté pendiente o procesando (solo sin SSE)
+        if (!useEvents && jobId && (jobStatus === "pending" || jobStatus === "procesando")) {
             pollInterval = setInterval(() => {
                 pollJobStatus(jobId);
             }, 3000); // Cada 3 segundos
@@ -35,7 +63,7 @@ function StoryGenerator() {
                 clearInterval(pollInterval);
             }
         };
-    }, [jobId, jobStatus]);
+    }, [jobId, jobStatus, useEvents]);
 
     const generateStory = async (theme) => {
         setLoading(true);
@@ -44,35 +72,55 @@ function StoryGenerator() {
 
         try {
             const response = await axios.post(`${API_BASE_URL}/story/create`, { theme });
-            const { job_id, status } = response.data;
+            const { job_id, status, story_id } = response.data;
+
+            // Historia pregenerada: el job ya viene completado
+            if (status === "completado" && story_id) {
+                fetchStory(story_id);
+                return;
+            }
+
             setJobId(job_id);
             setJobStatus(status);
 
-            // Iniciar polling inmediatamente
-            pollJobStatus(job_id);
+            // Sin SSE, iniciar polling inmediatamente
+            if (!useEvents) {
+                pollJobStatus(job_id);
+            }
         } catch (e) {
-            setError(`Error al generar la historia: ${e.message}`);
+            if (e.response?.status === 429) {
+                // Control de admisión: demasiadas historias seguidas o la cola está llena
+                const wait = e.response.data?.detail?.estimated_wait_seconds ?? e.response.headers["retry-after"];
+                setError(`Hay muchas historias generándose. Vuelve a intentarlo en ${wait} segundos.`);
+            } else {
+                setError(`Error al generar la historia: ${e.message}`);
+            }
             setLoading(false);
         }
     };
 
-    const pollJobStatus = async (id) => {
-        try {
-            const response = await axios.get(`${API_BASE_URL}/job/${id}`);
-            const { status, story_id, error: jobError } = response.data;
+    const handleJobUpdate = (id, data) => {
+        const { status, story_id, error: jobError } = data;
 
-            console.log(`Job ${id}: status=${status}, story_id=${story_id}, error=${jobError}`);
+        console.log(`Job ${id}: status=${status}, story_id=${story_id}, error=${jobError}`);
 
-            setJobStatus(status);
+        setJobStatus(status);
 
-            if (status === "completado" && story_id) {
-                console.log(`Historia completada, navegando a /story/${story_id}`);
-                fetchStory(story_id);
-            } else if (status === "error" || jobError) {
-                console.error(`Error en job: ${jobError}`);
-                setError(jobError || "Error al generar la historia");
-                setLoading(false);
-            }
+        // "parcial": la raíz ya es jugable mientras se escriben las ramas más profundas
+        if ((status === "completado" || status === "parcial") && story_id) {
+            console.log(`Historia lista (${status}), navegando a /story/${story_id}`);
+            fetchStory(story_id, status === "parcial" ? id : null);
+        } else if (status === "error" || jobError) {
+            console.error(`Error en job: ${jobError}`);
+            setError(jobError || "Error al generar la historia");
+            setLoading(false);
+        }
+    };
+
+    const pollJobStatus = async (id) => {
+        try {
+            const response = await axios.get(`${API_BASE_URL}/job/${id}`);
+            handleJobUpdate(id, response.data);
         } catch (e) {
             console.error(`Error al consultar job: ${e.message}`, e.response);
             if (e.response?.status !== 404) {
@@ -82,11 +130,12 @@ function StoryGenerator() {
         }
     };
 
-    const fetchStory = async (id) => {
+    const fetchStory = async (id, partialJobId) => {
         try {
             setLoading(false);
             setJobStatus("completado");
-            navigate(`/story/${id}`);
+            // Historia a medias: StoryLoader sigue el job hasta que termine o falle
+            navigate(partialJobId ? `/story/${id}?job=${partialJobId}` : `/story/${id}`);
         } catch (e) {
             setError(`Error al cargar la historia: ${e.message}`);
             setLoading(false);
@@ -2,19 +2,40 @@
  * Componente StoryLoader
  * 
  * Este componente se encarga de cargar una historia existente desde el backend usando su ID.
+ * Carga la raíz con sus primeros niveles y le pasa a StoryGame una función para pedir
+ * el resto de los nodos a medida que el jugador avanza, y otra para generar los nodos
+ * de la frontera de las historias incrementales.
+ * Mientras una historia en streaming no está completa vuelve a pedir la raíz:
+ * las ramas de primer nivel aparecen a medida que se terminan de generar. Si llega
+ * con el job que la genera (?job=...), también lo consulta y muestra el error si
+ * la generación falla a mitad de camino.
  * Muestra un estado de carga, maneja errores si la historia no existe, y renderiza
  * el juego (StoryGame) una vez que los datos están listos.
  */
 import { useState, useEffect } from "react";
-import { useParams, useNavigate } from "react-router-dom";
+import { useParams, useNavigate, useSearchParams } from "react-router-dom";
 import axios from 'axios';
 import LoadingStatus from "./LoadingStatus.jsx";
 import StoryGame from "./StoryGame.jsx";
 import { API_BASE_URL } from "../util";
 
+// Niveles de nodos que se piden por adelantado en cada carga
+const PREFETCH_DEPTH = 2;
+
+// Reintentos de una expansión que otro servidor está generando (409)
+const EXPAND_RETRIES = 30;
+
+// Recarga de la raíz de una historia incompleta: cada 3 segundos, como mucho 10 minutos
+const ROOT_POLL_INTERVAL_MS = 3000;
+const ROOT_POLL_MAX_ATTEMPTS = 200;
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 
 function StoryLoader() {
     const { id } = useParams();
+    const [searchParams] = useSearchParams();
+    const jobId = searchParams.get("job");
     const navigate = useNavigate();
     const [story, setStory] = useState(null);
     const [loading, setLoading] = useState(true)
@@ -24,13 +45,37 @@ function StoryLoader() {
         loadStory(id)
     }, [id])
 
+    useEffect(() => {
+        if (!story || story.is_complete) {
+            return;
+        }
+        // Historia en streaming: la raíz gana opciones a medida que se cierran sus ramas
+        let attempts = 0;
+        const pollInterval = setInterval(() => {
+            attempts += 1;
+            if (attempts > ROOT_POLL_MAX_ATTEMPTS) {
+                clearInterval(pollInterval);
+                return;
+            }
+            if (jobId) {
+                checkJob(jobId, pollInterval);
+            } else {
+                reloadRoot(id);
+            }
+        }, ROOT_POLL_INTERVAL_MS);
+
+        return () => clearInterval(pollInterval);
+    }, [id, jobId, story?.is_complete])
+
     const loadStory = async (storyId) => {
         setLoading(true)
         setError(null)
 
         try {
-            const response = await axios.get(`${API_BASE_URL}/story/${storyId}/complete`)
-            setStory(response.data)
+            // Solo la raíz y sus primeros niveles: el resto se carga mientras se juega
+            const response = await axios.get(`${API_BASE_URL}/story/${storyId}/root?prefetch=${PREFETCH_DEPTH}`)
+            const { title, node_id, nodes, is_complete } = response.data
+            setStory({ id: storyId, title, root_node: nodes[node_id], all_nodes: nodes, is_complete })
             setLoading(false)
         } catch (err) {
             if (err.response?.status === 404) {
@@ -43,6 +88,60 @@ function StoryLoader() {
         }
     }
 
+    const reloadRoot = async (storyId) => {
+        try {
+            const response = await axios.get(`${API_BASE_URL}/story/${storyId}/root?prefetch=${PREFETCH_DEPTH}`)
+            const { title, node_id, nodes, is_complete } = response.data
+            setStory((previous) => ({
+                ...previous,
+                title,
+                root_node: nodes[node_id],
+                all_nodes: { ...previous.all_nodes, ...nodes },
+                is_complete
+            }))
+        } catch (err) {
+            console.error(`Error al recargar la raíz: ${err.message}`)
+        }
+    }
+
+    const checkJob = async (generationJobId, pollInterval) => {
+        try {
+            const response = await axios.get(`${API_BASE_URL}/job/${generationJobId}`)
+            const { status, error: jobError } = response.data
+            if (status === "error") {
+                // La generación falló después de publicar la raíz: la historia no se va a completar
+                clearInterval(pollInterval)
+                setStory(null)
+                setError(jobError || "Error al generar la historia")
+                return
+            }
+        } catch (err) {
+            console.error(`Error al consultar job: ${err.message}`)
+        }
+        reloadRoot(id)
+    }
+
+    const loadNode = async (nodeId) => {
+        const response = await axios.get(`${API_BASE_URL}/story/${id}/node/${nodeId}?prefetch=${PREFETCH_DEPTH}`)
+        return response.data.nodes
+    }
+
+    const expandNode = async (nodeId) => {
+        // Genera el subárbol de un nodo de la frontera; si otro servidor ya lo está generando, reintenta
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const response = await axios.post(`${API_BASE_URL}/story/${id}/node/${nodeId}/expand?prefetch=${PREFETCH_DEPTH}`)
+                return response.data.nodes
+            } catch (err) {
+                if (err.response?.status !== 409 || attempt >= EXPAND_RETRIES) {
+                    throw err
+                }
+                const retryAfter = Number(err.response.headers["retry-after"]) || 1
+                await wait(retryAfter * 1000)
+            }
+        }
+    }
+
     const createNewStory = () => {
         navigate("/")
     }
@@ -54,7 +153,7 @@ function StoryLoader() {
     if (error) {
         return <div className="story-loader">
             <div className="error-message">
-                <h2>Historia no encontrada</h2>
+                <h2>No se pudo abrir la historia</h2>
                 <p>{error}</p>
                 <button onClick={createNewStory}>Crear nueva historia</button>
             </div>
@@ -63,7 +162,7 @@ function StoryLoader() {
 
     if (story) {
         return <div className="story-loader">
-            <StoryGame story={story} onNewStory={createNewStory} />
+            <StoryGame story={story} onNewStory={createNewStory} loadNode={loadNode} expandNode={expandNode} />
         </div>
     }
 